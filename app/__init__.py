@@ -2,8 +2,12 @@ from flask import Flask
 from config import Config
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from app.db_pool import RoutingSession, configure_engines, instrument_engines, count_queries
+from app.profiling import init_profiling
+from sqlalchemy import text
+from sqlalchemy.schema import CreateColumn
 
-db = SQLAlchemy()
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 login_manager.login_message_category = 'info'
@@ -11,11 +15,16 @@ login_manager.login_message_category = 'info'
 def create_app(config_class=Config):
     app = Flask(__name__)
     app.config.from_object(config_class)
+    configure_engines(app)
 
     db.init_app(app)
     login_manager.init_app(app)
 
     with app.app_context():
+        instrument_engines(db)
+        count_queries(app, db)
+        init_profiling(app, db)
+
         from app.routes import main
         from app.auth import auth
         app.register_blueprint(main)
@@ -26,12 +35,31 @@ def create_app(config_class=Config):
         def load_user(user_id):
             return User.query.get(int(user_id))
             
-        try:
-            db.create_all()
-            print("Database initialized successfully.")
-        except Exception as e:
-            print(f"Error during database initialization: {e}")
-            # On serverless, we might want to continue and let it fail on-route 
-            # instead of crashing the entire function startup
+        if not app.config['FAST_START']:
+            init_schema()
 
     return app
+
+def init_schema():
+    """Creates any missing tables and indexes (needs an app context)."""
+    try:
+        db.create_all()
+        # create_all skips tables that already exist, so add their newer indexes
+        for table in db.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(db.engine, checkfirst=True)
+        # ...and their newer columns, which all have server defaults
+        inspector = db.inspect(db.engine)
+        with db.engine.begin() as conn:
+            for table in db.metadata.sorted_tables:
+                existing = {c['name'] for c in inspector.get_columns(table.name)}
+                for column in table.columns:
+                    if column.name not in existing:
+                        table_name = conn.dialect.identifier_preparer.format_table(table)
+                        column_sql = CreateColumn(column).compile(dialect=conn.dialect)
+                        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_sql}"))
+        print("Database initialized successfully.")
+    except Exception as e:
+        print(f"Error during database initialization: {e}")
+        # On serverless, we might want to continue and let it fail on-route 
+        # instead of crashing the entire function startup
@@ -0,0 +1,186 @@
+from collections import namedtuple
+
+import numpy as np
+
+from app.solver import PENALTY_WEIGHTS
+
+# Whole-timetable evaluation: entries are scattered into dense occupancy
+# arrays indexed by (entity, day * slots_per_day + slot), and every metric
+# (hard clashes, the solver's soft-penalty terms, room and seat usage,
+# faculty load, group idle gaps) is a few array reductions over them.
+# Events follow build_model: one per subject and group, or one per shared
+# subject, whose member groups' entries are a single section.
+
+Assignment = namedtuple('Assignment', 'subject_id group_id room_id day slot')
+
+def evaluate(config, days, slots, subjects, groups, rooms, faculties, entries, conflict_cliques=()):
+    """
+    Scores a timetable given as rows with subject_id, group_id, room_id, day
+    and slot (TimetableEntry rows, Assignments from a stored version or an
+    import). Penalty terms use the solver's settings, weights and semantics.
+    """
+    num_days, slots_per_day = len(days), len(slots)
+    periods = num_days * slots_per_day
+    day_pos = {day: d for d, day in enumerate(days)}
+    slot_pos = {slot: sl for sl, slot in enumerate(slots)}
+    subject_pos = {s.id: i for i, s in enumerate(subjects)}
+    group_pos = {g.id: i for i, g in enumerate(groups)}
+    room_pos = {r.id: i for i, r in enumerate(rooms)}
+    faculty_pos = {f.id: i for i, f in enumerate(faculties)}
+    n_groups, n_rooms, n_faculties = len(groups), len(rooms), len(faculties)
+
+    placed = [(subject_pos[e.subject_id], group_pos[e.group_id], room_pos[e.room_id],
+               day_pos[e.day] * slots_per_day + slot_pos[e.slot])
+              for e in entries
+              if e.subject_id in subject_pos and e.group_id in group_pos and e.room_id in room_pos
+              and e.day in day_pos and e.slot in slot_pos]
+    s_i, g_i, r_i, pos = np.array(placed, dtype=np.int64).reshape(-1, 4).T
+
+    is_lab = np.array([bool(s.is_lab) for s in subjects], dtype=bool)
+    is_shared = np.array([bool(s.is_shared) for s in subjects], dtype=bool)
+    hours = np.array([s.hours_per_week for s in subjects], dtype=np.int64)
+    subject_faculty = np.array([faculty_pos.get(s.faculty_id, -1) for s in subjects], dtype=np.int64)
+    group_size = np.array([g.size for g in groups], dtype=np.int64)
+    capacity = np.array([r.capacity for r in rooms], dtype=np.int64)
+    room_is_lab = np.array([r.type == 'lab' for r in rooms], dtype=bool)
+
+    # Event code: subject * (groups + 1) + group + 1, or + 0 for a shared section
+    stride = n_groups + 1
+    expected = {}
+    groups_by_course = {}
+    for g in groups:
+        groups_by_course.setdefault(g.course_id, []).append(group_pos[g.id])
+    for s in subjects:
+        members = groups_by_course.get(s.course_id, [])
+        codes = ([subject_pos[s.id] * stride] if s.is_shared and members
+                 else [subject_pos[s.id] * stride + g + 1 for g in members])
+        for code in codes:
+            expected[code] = s.hours_per_week
+    entry_events = s_i * stride + np.where(is_shared[s_i], 0, g_i + 1)
+    event_codes, entry_event = np.unique(np.concatenate([np.fromiter(expected, np.int64, len(expected)),
+                                                         entry_events]), return_inverse=True)
+    entry_event = entry_event[len(expected):]
+    n_events = len(event_codes)
+    event_subject = event_codes // stride
+    expected_hours = np.array([expected.get(code, 0) for code in event_codes.tolist()], dtype=np.int64)
+
+    # Sections held: one per (event, period, room), attended by its entries' groups
+    section_keys, entry_section = np.unique((entry_event * periods + pos) * max(n_rooms, 1) + r_i,
+                                            return_inverse=True)
+    section_room = section_keys % max(n_rooms, 1)
+    section_pos = (section_keys // max(n_rooms, 1)) % periods
+    section_event = section_keys // max(n_rooms, 1) // periods
+    section_subject = event_subject[section_event]
+    attendees = np.bincount(entry_section, weights=group_size[g_i], minlength=len(section_keys))
+
+    # Occupancy, as counts so double bookings show up as values above 1
+    room_count = _occupancy(section_room, section_pos, n_rooms, periods)
+    group_count = _occupancy(g_i, pos, n_groups, periods)
+    held = np.zeros((n_events, periods), dtype=bool)
+    held[section_event, section_pos] = True
+    held_event, held_pos = np.nonzero(held)
+    held_faculty = subject_faculty[event_subject[held_event]]
+    with_faculty = held_faculty >= 0
+    faculty_count = _occupancy(held_faculty[with_faculty], held_pos[with_faculty], n_faculties, periods)
+    faculty_busy = faculty_count > 0
+
+    subject_busy = np.zeros((len(subjects), periods), dtype=bool)
+    subject_busy[event_subject[held_event], held_pos] = True
+    pairs = {(min(u, v), max(u, v)) for clique in conflict_cliques for u in clique for v in clique
+             if u != v and u in subject_pos and v in subject_pos}
+    first, second = (np.array([subject_pos[p[k]] for p in pairs], dtype=np.int64) for k in (0, 1))
+
+    misplaced = (is_lab[section_subject] & ~room_is_lab[section_room]) | \
+                (~is_lab[section_subject] & room_is_lab[section_room] & (not config.get('LECTURES_IN_LABS', False)))
+    conflicts = {
+        'room': int(np.clip(room_count - 1, 0, None).sum()),
+        'group': int(np.clip(group_count - 1, 0, None).sum()),
+        'faculty': int(np.clip(faculty_count - 1, 0, None).sum()),
+        'elective': int((subject_busy[first] & subject_busy[second]).sum()),
+        'capacity': int((attendees > capacity[section_room]).sum()),
+        'room_type': int(misplaced.sum()),
+        'hours': int((held.sum(axis=1) != expected_hours).sum()),
+    }
+
+    # --- Soft penalties, as in build_model ---
+    penalties = dict.fromkeys(PENALTY_WEIGHTS, 0)
+    if config.get('CONSTRAINT_FACULTY_MAX_HOURS_ENABLED', True) and n_faculties:
+        max_hours = np.array([f.max_hours_per_week for f in faculties], dtype=np.int64)
+        penalties['MAX_HOURS_PENALTY'] = int(np.clip(faculty_busy.sum(axis=1) - max_hours, 0, None).sum())
+    max_consecutive = config.get('MAX_CONSECUTIVE_LECTURES', 3)
+    if config.get('CONSTRAINT_FACULTY_CONSECUTIVE_ENABLED', True) and slots_per_day > max_consecutive:
+        # Windows of max_consecutive + 1 slots that are all busy, from running sums
+        running = np.cumsum(faculty_busy.reshape(n_faculties, num_days, slots_per_day), axis=2)
+        running = np.concatenate([np.zeros((n_faculties, num_days, 1), dtype=running.dtype), running], axis=2)
+        window = running[:, :, max_consecutive + 1:] - running[:, :, :slots_per_day - max_consecutive]
+        penalties['CONSECUTIVE_PENALTY'] = int((window > max_consecutive).sum())
+    by_day = held.reshape(n_events, num_days, slots_per_day)
+    lab_events = is_lab[event_subject]
+    if config.get('CONSTRAINT_LAB_CONSECUTIVE_ENABLED', True) and slots_per_day > 2:
+        # Held at sl and sl + 2 but not sl + 1
+        lab_days = by_day[lab_events]
+        penalties['CONSECUTIVE_LABS_WEIGHT'] = int(
+            (lab_days[:, :, :-2] & ~lab_days[:, :, 1:-1] & lab_days[:, :, 2:]).sum())
+    if config.get('CONSTRAINT_SUBJECT_DISTRIBUTION_ENABLED', True):
+        spread = ~lab_events & (hours[event_subject] <= num_days)
+        penalties['SAME_DAY_MULTI_PENALTY'] = int((by_day[spread].sum(axis=2) > 1).sum())
+    weighted = {key: config.get(key, default) * penalties[key] for key, default in PENALTY_WEIGHTS.items()}
+
+    # --- Utilization ---
+    room_used = (room_count > 0).sum(axis=1)
+    fill = attendees / np.maximum(capacity[section_room], 1)
+    room_fill = np.bincount(section_room, weights=fill, minlength=n_rooms) / np.maximum(room_used, 1)
+    faculty_hours = faculty_busy.sum(axis=1)
+
+    group_days = (group_count > 0).reshape(n_groups, num_days, slots_per_day)
+    busy_days = group_days.any(axis=2)
+    day_start = group_days.argmax(axis=2)
+    day_end = slots_per_day - 1 - group_days[:, :, ::-1].argmax(axis=2)
+    gaps = np.where(busy_days, day_end - day_start + 1 - group_days.sum(axis=2), 0).sum(axis=1)
+
+    return {
+        'entries': len(placed),
+        'skipped': len(entries) - len(placed),
+        'conflicts': conflicts,
+        'hard_conflicts': sum(conflicts.values()),
+        'penalties': penalties,
+        'weighted_penalties': weighted,
+        'score': sum(weighted.values()),
+        'room_utilization': _ratio(room_used.sum(), n_rooms * periods),
+        'seat_fill': _ratio(fill.sum(), len(fill)),
+        'rooms': [{'id': r.id, 'name': r.name, 'utilization': _ratio(room_used[i], periods),
+                   'seat_fill': round(float(room_fill[i]), 3)} for i, r in enumerate(rooms)],
+        'faculty_load': {
+            'mean_hours': round(float(faculty_hours.mean()), 3) if n_faculties else 0.0,
+            'std_hours': round(float(faculty_hours.std()), 3) if n_faculties else 0.0,
+            'max_hours': int(faculty_hours.max()) if n_faculties else 0,
+            'faculties': [{'id': f.id, 'name': f.name, 'hours': int(faculty_hours[i]),
+                           'max_hours': f.max_hours_per_week,
+                           'load': _ratio(faculty_hours[i], f.max_hours_per_week)}
+                          for i, f in enumerate(faculties)],
+        },
+        'idle_gaps': {
+            'total': int(gaps.sum()),
+            'groups': [{'id': g.id, 'name': g.name, 'gaps': int(gaps[i])} for i, g in enumerate(groups)],
+        },
+        # Share of rooms / groups / faculty busy in each (day, slot) cell
+        'heatmaps': {
+            'days': list(days),
+            'slots': list(slots),
+            'rooms': _heatmap(room_count > 0, num_days, slots_per_day),
+            'groups': _heatmap(group_count > 0, num_days, slots_per_day),
+            'faculty': _heatmap(faculty_busy, num_days, slots_per_day),
+        },
+    }
+
+def _occupancy(entity, pos, n_entities, periods):
+    """(entities x periods) counts of how many times each entity is booked in each period."""
+    return np.bincount(entity * periods + pos, minlength=n_entities * periods).reshape(n_entities, periods)
+
+def _heatmap(busy, num_days, slots_per_day):
+    if not len(busy):
+        return np.zeros((num_days, slots_per_day)).tolist()
+    return np.round(busy.mean(axis=0), 3).reshape(num_days, slots_per_day).tolist()
+
+def _ratio(part, whole):
+    return round(float(part) / whole, 3) if whole else 0.0
@@ -2,9 +2,16 @@ from flask import Blueprint, render_template, redirect, url_for, flash, request
 from flask_login import login_user, logout_user, login_required, current_user
 from app.models import User
 from app import db
+from app.snapshot import create_demo_tenant, record_demo_activity
 
 auth = Blueprint('auth', __name__)
 
+@auth.before_app_request
+def _record_demo_activity():
+    # Keeps a visitor's demo tenant from being pruned while it is in use
+    if request.endpoint != 'static' and current_user.is_authenticated and current_user.is_demo:
+        record_demo_activity(current_user)
+
 @auth.route('/login', methods=['GET', 'POST'])
 def login():
     if current_user.is_authenticated:
@@ -45,13 +52,8 @@ def logout():
 
 @auth.route('/demo-login')
 def demo_login():
-    # Find or create a demo user
-    user = User.query.filter_by(username='demo_institution').first()
-    if not user:
-        user = User(username='demo_institution', is_demo=True)
-        user.set_password('demo123')
-        db.session.add(user)
-        db.session.commit()
+    # Every visitor gets a private copy of the demo institution
+    user = create_demo_tenant()
     login_user(user)
     flash('Logged in as Demo Institution', 'info')
     return redirect(url_for('main.manage'))
@@ -0,0 +1,201 @@
+import csv
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from types import SimpleNamespace
+
+from sqlalchemy import create_engine, select
+
+from app.models import User, Faculty, StudentGroup, Room, Subject, TimeSlot, TimetableEntry, SystemSetting
+from app.generation import SOLVER_STATUS_NAMES, parse_setting_value
+from app.solver import solve_timetable
+from app.enrollment import subject_conflicts
+from app.history import record_version
+
+# Headless batch solving: instances come from JSON/CSV bundles or straight
+# from the database (SQLAlchemy Core on the model tables, no Flask app and
+# no ORM session), are solved in a process pool and written out in bulk.
+
+_optional_int = lambda v: int(v) if v not in (None, '') else None
+_bool = lambda v: v if isinstance(v, bool) else str(v).strip().lower() in ('true', '1', 'yes')
+
+# Bundle entity -> {field: converter}; the attributes solve_timetable reads
+BUNDLE_FIELDS = {
+    'subjects': {'id': int, 'name': str, 'course_id': int, 'hours_per_week': int,
+                 'faculty_id': _optional_int, 'is_lab': _bool, 'is_shared': _bool},
+    'groups': {'id': int, 'name': str, 'course_id': int, 'size': int},
+    'rooms': {'id': int, 'name': str, 'capacity': int, 'type': str},
+    'faculties': {'id': int, 'name': str, 'max_hours_per_week': int},
+    'time_slots': {'day': str, 'slot_number': int},
+}
+
+def load_bundle(path):
+    """
+    Reads one instance from a JSON file ({"config": {...}, "subjects": [...], ...})
+    or a directory of CSVs (subjects.csv, groups.csv, rooms.csv, faculties.csv,
+    optional time_slots.csv and config.json). Column names are the field names.
+    """
+    if os.path.isdir(path):
+        raw = {}
+        for entity in BUNDLE_FIELDS:
+            csv_path = os.path.join(path, f'{entity}.csv')
+            if os.path.exists(csv_path):
+                with open(csv_path, newline='', encoding='utf-8') as f:
+                    raw[entity] = list(csv.DictReader(f))
+        config_path = os.path.join(path, 'config.json')
+        if os.path.exists(config_path):
+            with open(config_path, encoding='utf-8') as f:
+                raw['config'] = json.load(f)
+        name = os.path.basename(os.path.normpath(path))
+    else:
+        with open(path, encoding='utf-8') as f:
+            raw = json.load(f)
+        name = raw.get('name') or os.path.splitext(os.path.basename(path))[0]
+
+    inputs = tuple(
+        [SimpleNamespace(**{field: convert(row.get(field)) for field, convert in fields.items()})
+         for row in raw.get(entity, [])]
+        for entity, fields in BUNDLE_FIELDS.items()
+    )
+    return {'name': name, 'user_id': None, 'config': raw.get('config', {}), 'inputs': inputs}
+
+def load_tenants(database_url, user_ids):
+    """Reads each tenant's solver inputs from the database, honouring LIMIT_MAX_* settings."""
+    engine = create_engine(database_url)
+    instances = []
+    with engine.connect() as conn:
+        for user_id in user_ids:
+            settings = SystemSetting.__table__
+            config = {key: parse_setting_value(value) for key, value in
+                      conn.execute(select(settings.c.key, settings.c.value).where(settings.c.user_id == user_id))}
+
+            def _rows(model, limit_key=None):
+                table = model.__table__
+                query = select(table).where(table.c.user_id == user_id).order_by(table.c.id)
+                if limit_key and config.get(limit_key, 0) > 0:
+                    query = query.limit(config[limit_key])
+                return [SimpleNamespace(**row._mapping) for row in conn.execute(query)]
+
+            inputs = (
+                _rows(Subject, 'LIMIT_MAX_SUBJECTS'),
+                _rows(StudentGroup, 'LIMIT_MAX_GROUPS'),
+                _rows(Room, 'LIMIT_MAX_ROOMS'),
+                _rows(Faculty, 'LIMIT_MAX_FACULTIES'),
+                _rows(TimeSlot),
+            )
+            pins = _pinned(conn, user_id)
+            if pins:
+                config['PINNED_ENTRIES'] = pins
+            conflicts = subject_conflicts(conn.execute, user_id)
+            if conflicts:
+                config['SUBJECT_CONFLICTS'] = conflicts
+            instances.append({'name': f'user_{user_id}', 'user_id': user_id, 'config': config, 'inputs': inputs})
+    engine.dispose()
+    return instances
+
+def all_tenant_ids(database_url):
+    engine = create_engine(database_url)
+    with engine.connect() as conn:
+        table = Subject.__table__
+        ids = [row[0] for row in conn.execute(select(table.c.user_id).where(table.c.user_id.isnot(None))
+                                              .distinct().order_by(table.c.user_id))]
+    engine.dispose()
+    return ids
+
+def solve_all(instances, workers=None, overrides=None):
+    """Solves the instances in a process pool; returns one report (with results) per instance, in order."""
+    workers = max(1, min(workers or os.cpu_count() or 1, len(instances) or 1))
+    cores_per_run = max(1, (os.cpu_count() or 1) // workers)
+    jobs = [{**instance, 'config': {**instance['config'], **(overrides or {}), 'SOLVER_NUM_WORKERS': cores_per_run}}
+            for instance in instances]
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return list(pool.map(_solve_instance, jobs))
+
+def _solve_instance(instance):
+    subjects, groups, rooms, faculties, time_slots = instance['inputs']
+    stats = {}
+    started = time.perf_counter()
+    try:
+        status, results, obj_value = solve_timetable(subjects, groups, rooms, faculties, time_slots,
+                                                     config=instance['config'], stats=stats)
+        error = None
+    except Exception as e:
+        status, results, obj_value, error = None, [], None, str(e)
+    return {
+        'name': instance['name'],
+        'user_id': instance['user_id'],
+        'status': SOLVER_STATUS_NAMES.get(status, 'ERROR' if error else str(status)),
+        'objective': obj_value,
+        'best_bound': stats.get('best_bound'),
+        'penalties': stats.get('penalties', {}),
+        'entries': len(results),
+        'subjects': len(subjects),
+        'groups': len(groups),
+        'rooms': len(rooms),
+        'build_time': round(stats.get('build_time', 0.0), 3),
+        'solve_time': round(stats.get('solve_time', 0.0), 3),
+        'total_time': round(time.perf_counter() - started, 3),
+        'error': error,
+        'results': results,
+    }
+
+def write_csv(report, out_dir):
+    path = os.path.join(out_dir, f"{report['name']}.csv")
+    with open(path, 'w', newline='', encoding='utf-8') as f:
+        writer = csv.writer(f)
+        writer.writerow(['day', 'slot', 'group', 'subject', 'faculty', 'room'])
+        for r in sorted(report['results'], key=lambda r: (r['group'], r['day_idx'], r['slot_idx'])):
+            writer.writerow([r['day'], r['slot'], r['group'], r['subject'], r['faculty'], r['room']])
+    return path
+
+def write_to_db(database_url, reports):
+    """Replaces each solved tenant's timetable and score, one transaction per tenant."""
+    engine = create_engine(database_url)
+    entries, settings = TimetableEntry.__table__, SystemSetting.__table__
+    for report in reports:
+        if report['user_id'] is None or report['status'] not in ('OPTIMAL', 'FEASIBLE'):
+            continue
+        user_id = report['user_id']
+        with engine.begin() as conn:
+            pins = set(_pinned(conn, user_id))
+            conn.execute(entries.delete().where(entries.c.user_id == user_id))
+            conn.execute(entries.insert(), [
+                {'user_id': user_id, 'subject_id': r['subject_id'], 'room_id': r['room_id'],
+                 'group_id': r['group_id'], 'day': r['day'], 'slot': r['slot'],
+                 'pinned': (r['subject_id'], r['group_id'], r['room_id'], r['day'], r['slot']) in pins}
+                for r in report['results']
+            ])
+            record_version(conn.execute, user_id,
+                           [(r['subject_id'], r['group_id'], r['room_id'], r['day'], r['slot'])
+                            for r in report['results']],
+                           report['objective'], 'batch')
+            users = User.__table__
+            conn.execute(users.update().where(users.c.id == user_id)
+                         .values(timetable_revision=users.c.timetable_revision + 1))
+            score = str(report['objective'])
+            updated = conn.execute(settings.update()
+                                   .where(settings.c.user_id == user_id, settings.c.key == 'LAST_SOLVER_SCORE')
+                                   .values(value=score))
+            if updated.rowcount == 0:
+                conn.execute(settings.insert().values(user_id=user_id, key='LAST_SOLVER_SCORE', value=score,
+                                                      description='Last optimization score'))
+    engine.dispose()
+
+def _pinned(conn, user_id):
+    entries = TimetableEntry.__table__
+    rows = conn.execute(select(entries.c.subject_id, entries.c.group_id, entries.c.room_id, entries.c.day,
+                               entries.c.slot).where(entries.c.user_id == user_id, entries.c.pinned.is_(True)))
+    return sorted(tuple(row) for row in rows)
+
+def format_report(reports):
+    """Fixed-width per-instance timing and quality table."""
+    header = f"{'instance':<24} {'status':<10} {'objective':>10} {'bound':>10} {'entries':>8} {'build s':>8} {'solve s':>8} {'total s':>8}"
+    lines = [header, '-' * len(header)]
+    for r in reports:
+        objective = '-' if r['objective'] is None else f"{r['objective']:.0f}"
+        bound = '-' if r['best_bound'] is None else f"{r['best_bound']:.0f}"
+        lines.append(f"{r['name']:<24} {r['status']:<10} {objective:>10} {bound:>10} {r['entries']:>8} "
+                     f"{r['build_time']:>8.2f} {r['solve_time']:>8.2f} {r['total_time']:>8.2f}")
+    return '\n'.join(lines)
@@ -0,0 +1,130 @@
+import threading
+import time
+
+from ortools.sat.python import cp_model
+
+# Adaptive time budget for a single solve: the starting limit scales with the
+# model's size instead of always being SOLVER_TIME_LIMIT, the search stops
+# once the incumbent has not improved for SOLVER_STAGNATION_SECONDS, and a
+# run still improving (or without any solution yet) at its limit is extended,
+# up to SOLVER_MAX_TIME_LIMIT.
+
+BUDGET_POLL_SECONDS = 0.1
+
+def budget_policy(compiled, config):
+    """
+    The budget for a solve of `compiled`: a starting limit of one second per
+    SOLVER_BUDGET_UNITS_PER_SECOND variables plus constraints, kept between
+    SOLVER_MIN_TIME_LIMIT and SOLVER_TIME_LIMIT, and how far and in what
+    steps it may be extended.
+    """
+    time_limit = float(config.get('SOLVER_TIME_LIMIT', 30))
+    units = max(1.0, float(config.get('SOLVER_BUDGET_UNITS_PER_SECOND', 5000) or 1))
+    floor = min(float(config.get('SOLVER_MIN_TIME_LIMIT', 5)), time_limit)
+    size = compiled['variables'] + compiled['constraints']
+    initial = min(max(size / units, floor), time_limit)
+
+    stagnation = float(config.get('SOLVER_STAGNATION_SECONDS', 0) or 0)
+    max_limit = max(float(config.get('SOLVER_MAX_TIME_LIMIT', 0) or 0), initial)
+    return {
+        'variables': compiled['variables'],
+        'constraints': compiled['constraints'],
+        'initial_limit': round(initial, 3),
+        'max_limit': round(max_limit, 3),
+        'stagnation_seconds': stagnation,
+        # Each extension buys one more stagnation window (a quarter of the start limit without one)
+        'extension_seconds': round(stagnation or initial / 4, 3),
+        'gap_limit': float(config.get('SOLVER_GAP_LIMIT', 0) or 0),
+    }
+
+def solve_with_budget(solver, model, policy):
+    """
+    Solves `model` under `policy`, stopping on stagnation or at the (possibly
+    extended) limit. Returns (status, run) where `run` records how the budget
+    was spent: time used, extensions, improvements and why the search stopped.
+    """
+    solver.parameters.max_time_in_seconds = policy['max_limit']
+    if policy['gap_limit'] > 0:
+        solver.parameters.relative_gap_limit = policy['gap_limit']
+    watch = _BudgetWatch(solver, policy)
+    watch.start()
+    try:
+        status = solver.Solve(model, watch)
+    finally:
+        watch.finish()
+
+    if status == cp_model.OPTIMAL:
+        # relative_gap_limit ends the search as OPTIMAL before the bound meets the objective
+        reason = 'optimal' if solver.ObjectiveValue() == solver.BestObjectiveBound() else 'gap'
+    elif status == cp_model.INFEASIBLE:
+        reason = 'infeasible'
+    else:
+        reason = watch.stop_reason or 'time_limit'
+    return status, {
+        'wall_time': round(solver.WallTime(), 3),
+        'limit': round(watch.deadline, 3),
+        'extensions': watch.extensions,
+        'improvements': watch.improvements,
+        'last_improvement': round(watch.last_improvement, 3) if watch.last_improvement is not None else None,
+        'stop_reason': reason,
+    }
+
+class _BudgetWatch(cp_model.CpSolverSolutionCallback):
+    """
+    Records when the incumbent improves and, from a watchdog thread, stops
+    the solver on stagnation or at the current deadline unless the last
+    window brought an improvement (or no solution came yet) and there is
+    room to extend.
+    """
+
+    def __init__(self, solver, policy):
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self._solver = solver
+        self._policy = policy
+        self._started = time.monotonic()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._watch, daemon=True)
+        self._best = None
+        self.deadline = policy['initial_limit']
+        self.extensions = 0
+        self.improvements = 0
+        self.last_improvement = None  # seconds into the solve
+        self.stop_reason = None
+
+    def on_solution_callback(self):
+        objective = self.ObjectiveValue()
+        if self._best is None or objective < self._best:
+            self._best = objective
+            self.improvements += 1
+            self.last_improvement = time.monotonic() - self._started
+
+    def start(self):
+        self._thread.start()
+
+    def finish(self):
+        self._done.set()
+        self._thread.join()
+
+    def _watch(self):
+        policy = self._policy
+        stagnation = policy['stagnation_seconds']
+        while not self._done.wait(BUDGET_POLL_SECONDS):
+            elapsed = time.monotonic() - self._started
+            last = self.last_improvement
+            if stagnation and last is not None and elapsed - last >= stagnation:
+                self._stop('stagnation')
+                return
+            if elapsed < self.deadline:
+                continue
+            window = policy['extension_seconds']
+            # Also extend while there is no timetable at all yet: stopping then leaves nothing to save
+            if (last is None or elapsed - last < window) and self.deadline < policy['max_limit']:
+                self.deadline = min(self.deadline + window, policy['max_limit'])
+                self.extensions += 1
+                continue
+            self._stop('time_limit')
+            return
+
+    def _stop(self, reason):
+        self.stop_reason = reason
+        self._solver.StopSearch()
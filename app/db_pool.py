@@ -0,0 +1,172 @@
+import functools
+import threading
+import time
+from collections import deque
+
+from flask import g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import NullPool, QueuePool
+from sqlalchemy.sql.dml import UpdateBase
+
+# Connection strategies (DB_POOL_STRATEGY):
+# - serverless: no pooling in the process (NullPool). Meant for short-lived
+#   invocations behind an external pooler such as pgbouncer / Supavisor in
+#   transaction mode, so server-side prepared statements are disabled.
+# - pooled: a QueuePool sized for long-lived gunicorn workers.
+
+def engine_options(uri, config):
+    """SQLAlchemy engine options for `uri` under the configured strategy."""
+    url = make_url(uri)
+    if url.get_backend_name() == 'sqlite':
+        return {}
+
+    if config['DB_POOL_STRATEGY'] == 'serverless':
+        options = {'poolclass': TimedNullPool}
+        # psycopg 3 prepares repeated statements server-side, which breaks under
+        # transaction pooling; psycopg2 never does.
+        if url.get_driver_name() == 'psycopg':
+            options['connect_args'] = {'prepare_threshold': None}
+        return options
+
+    return {
+        'poolclass': TimedQueuePool,
+        'pool_size': config['DB_POOL_SIZE'],
+        'max_overflow': config['DB_MAX_OVERFLOW'],
+        'pool_timeout': config['DB_POOL_TIMEOUT'],
+        'pool_recycle': config['DB_POOL_RECYCLE'],
+        'pool_pre_ping': True,
+        # Reuse the most recent connection so surplus ones idle out and get recycled
+        'pool_use_lifo': True,
+    }
+
+def configure_engines(app):
+    """Fills SQLALCHEMY_ENGINE_OPTIONS / SQLALCHEMY_BINDS from the pool settings (before db.init_app)."""
+    config = app.config
+    config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', engine_options(config['SQLALCHEMY_DATABASE_URI'], config))
+    if config.get('DATABASE_REPLICA_URL'):
+        binds = dict(config.get('SQLALCHEMY_BINDS') or {})
+        binds.setdefault('replica', {'url': config['DATABASE_REPLICA_URL'],
+                                     **engine_options(config['DATABASE_REPLICA_URL'], config)})
+        config['SQLALCHEMY_BINDS'] = binds
+
+class RoutingSession(Session):
+    """Sends reads from views marked @read_only to the replica engine, when one is configured."""
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None and not self._flushing and not isinstance(clause, UpdateBase)
+                and has_request_context() and g.get('read_replica')
+                and 'replica' in self._db.engines):
+            return self._db.engines['replica']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def read_only(view):
+    """Marks a view as safe to serve from the read replica (which may lag the primary)."""
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        g.read_replica = True
+        return view(*args, **kwargs)
+    return wrapper
+
+class PoolStats:
+    """Checkout counts and time spent waiting for a connection, per engine."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._waits = deque(maxlen=1000)
+        self.counters = {'checkouts': 0, 'checkins': 0, 'connects': 0, 'failed_checkouts': 0}
+        self.wait_total = 0.0
+
+    def record_wait(self, seconds, failed=False):
+        with self._lock:
+            self._waits.append(seconds)
+            self.wait_total += seconds
+            if failed:
+                self.counters['failed_checkouts'] += 1
+
+    def count(self, name):
+        with self._lock:
+            self.counters[name] += 1
+
+    def snapshot(self):
+        with self._lock:
+            waits = sorted(self._waits)
+            return {
+                **self.counters,
+                'checked_out': self.counters['checkouts'] - self.counters['checkins'],
+                'wait_time_total': self.wait_total,
+                'wait_time_avg': sum(waits) / len(waits) if waits else 0.0,
+                'wait_time_p95': waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                'wait_time_max': waits[-1] if waits else 0.0,
+            }
+
+pool_stats = {}
+
+def instrument_engines(db):
+    """Attaches PoolStats to every engine of the app (needs an app context)."""
+    for key, engine in db.engines.items():
+        name = key or 'primary'
+        stats = pool_stats.setdefault(name, PoolStats())
+        engine.pool._pool_stats = stats
+        event.listen(engine, 'connect', lambda *args, s=stats: s.count('connects'))
+        event.listen(engine, 'checkout', lambda *args, s=stats: s.count('checkouts'))
+        event.listen(engine, 'checkin', lambda *args, s=stats: s.count('checkins'))
+
+def count_queries(app, db):
+    """
+    With QUERY_COUNT_HEADER on, counts the SQL statements each request runs
+    and reports them in an X-DB-Queries response header (the load harness
+    reads it per endpoint). Otherwise no listener is attached.
+    """
+    if not app.config.get('QUERY_COUNT_HEADER'):
+        return
+    for engine in db.engines.values():
+        event.listen(engine, 'before_cursor_execute', _count_query)
+
+    @app.after_request
+    def _query_count_header(response):
+        response.headers['X-DB-Queries'] = str(g.get('db_queries', 0))
+        return response
+
+def _count_query(*args):
+    if has_request_context():
+        g.db_queries = g.get('db_queries', 0) + 1
+
+def pool_metrics(db):
+    return {
+        (key or 'primary'): {
+            'pool': type(engine.pool).__name__,
+            'status': engine.pool.status(),
+            **(pool_stats[key or 'primary'].snapshot() if (key or 'primary') in pool_stats else {})
+        }
+        for key, engine in db.engines.items()
+    }
+
+class _TimedPool:
+    """Times how long each checkout waits for a connection (a new connect under NullPool)."""
+
+    _pool_stats = None
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except Exception:
+            if self._pool_stats:
+                self._pool_stats.record_wait(time.perf_counter() - started, failed=True)
+            raise
+        if self._pool_stats:
+            self._pool_stats.record_wait(time.perf_counter() - started)
+        return connection
+
+    def recreate(self):
+        pool = super().recreate()
+        pool._pool_stats = self._pool_stats
+        return pool
+
+class TimedQueuePool(_TimedPool, QueuePool):
+    pass
+
+class TimedNullPool(_TimedPool, NullPool):
+    pass
@@ -0,0 +1,365 @@
+import calendar
+import threading
+from collections import namedtuple
+
+from app import db
+from app.history import record_version
+from app.models import User, TimetableEntry, Subject, StudentGroup, Room, Faculty, TimeSlot
+
+# Manual timetable edits (move, swap) checked against an in-memory occupancy
+# index per tenant: one bitset per room, group, faculty and event (subject,
+# group; or just subject for a shared section) with bit d * slots_per_day + sl
+# set when it is busy at day d, slot sl. A shared section's entries move together.
+# A hard clash is then a single AND, and soft penalties are re-priced only for
+# the faculty and events an edit touches, with the solver's weights and switches.
+# Each applied edit is saved as a timetable version (source 'edit').
+# An index is valid for one User.timetable_revision; every timetable write and
+# every change to what the solver reads (entities, imports, settings) bumps it.
+
+INDEX_CACHE_MAX_TENANTS = 256
+
+Placement = namedtuple('Placement', 'subject_id group_id room_id pos')
+
+class StaleTimetable(Exception):
+    """The timetable changed (another edit or a solve) while an edit was being applied."""
+
+class OccupancyIndex:
+
+    def __init__(self, revision, config, days, slots, subjects, groups, rooms, faculties, entries,
+                 conflict_cliques=()):
+        from app.solver import PENALTY_WEIGHTS
+
+        self.revision = revision
+        self.lock = threading.Lock()
+        self.days = days
+        self.slots = slots
+        self.slots_per_day = len(slots)
+        self.day_mask = (1 << self.slots_per_day) - 1
+        self._day_pos = {day: d for d, day in enumerate(days)}
+        self._slot_pos = {slot: sl for sl, slot in enumerate(slots)}
+
+        self.subjects = {s.id: s for s in subjects}
+        self.groups = {g.id: g for g in groups}
+        self.rooms = {r.id: r for r in rooms}
+        self.faculties = {f.id: f for f in faculties}
+
+        # Same settings and defaults as build_model / set_objective
+        self.weights = {key: config.get(key, default) for key, default in PENALTY_WEIGHTS.items()}
+        self.lectures_in_labs = config.get('LECTURES_IN_LABS', False)
+        self.max_consecutive = config.get('MAX_CONSECUTIVE_LECTURES', 3)
+        self.enabled = {
+            'MAX_HOURS_PENALTY': config.get('CONSTRAINT_FACULTY_MAX_HOURS_ENABLED', True),
+            'CONSECUTIVE_PENALTY': config.get('CONSTRAINT_FACULTY_CONSECUTIVE_ENABLED', True),
+            'CONSECUTIVE_LABS_WEIGHT': config.get('CONSTRAINT_LAB_CONSECUTIVE_ENABLED', True),
+            'SAME_DAY_MULTI_PENALTY': config.get('CONSTRAINT_SUBJECT_DISTRIBUTION_ENABLED', True),
+        }
+
+        # Subjects sharing enrolled students, from the clique cover the solver gets
+        self.conflicting = {}
+        for clique in conflict_cliques:
+            for subject_id in clique:
+                self.conflicting.setdefault(subject_id, set()).update(c for c in clique if c != subject_id)
+        self._subject_events = {}
+
+        self.room_bits = {}
+        self.group_bits = {}
+        self.faculty_bits = {}
+        self.event_bits = {}
+        self.entries = {}
+        for e in entries:
+            if e.day in self._day_pos and e.slot in self._slot_pos and e.subject_id in self.subjects:
+                self.entries[e.id] = Placement(e.subject_id, e.group_id, e.room_id, self.position(e.day, e.slot))
+                self._occupy(self.entries[e.id])
+
+    def position(self, day, slot):
+        try:
+            slot = int(slot)
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid slot: {slot}")
+        if day not in self._day_pos or slot not in self._slot_pos:
+            raise ValueError(f"{day} slot {slot} is not in the timetable grid")
+        return self._day_pos[day] * self.slots_per_day + self._slot_pos[slot]
+
+    def day_slot(self, pos):
+        return self.days[pos // self.slots_per_day], self.slots[pos % self.slots_per_day]
+
+    def section(self, entry_id):
+        """The entry's id plus, for a shared subject, those of the other groups' entries held with it."""
+        p = self.entries[entry_id]
+        if not self.subjects[p.subject_id].is_shared:
+            return (entry_id,)
+        return tuple(i for i, q in self.entries.items()
+                     if q.subject_id == p.subject_id and q.pos == p.pos and q.room_id == p.room_id)
+
+    def place(self, moves, dry_run=False):
+        """
+        Moves sections, given as (entry_ids, room_id, pos), to new placements,
+        all or nothing. Returns the hard conflicts (nothing is changed if there
+        are any) and the change in the weighted soft penalty. A dry run
+        restores the index.
+        """
+        old = {entry_id: self.entries[entry_id] for entry_ids, _, _ in moves for entry_id in entry_ids}
+        faculty_ids = {self.subjects[p.subject_id].faculty_id for p in old.values()} - {None}
+        events = {self._event(p) for p in old.values()}
+        before = self._weighted(self._penalty_counts(faculty_ids, events))
+
+        for placement in old.values():
+            self._vacate(placement)
+        placed, conflicts = [], []
+        for entry_ids, room_id, pos in moves:
+            section = [old[entry_id]._replace(room_id=room_id, pos=pos) for entry_id in entry_ids]
+            clashes = self.conflicts(section)
+            if clashes:
+                conflicts.extend(dict(c, entry_id=entry_ids[0]) for c in clashes)
+                continue
+            for entry_id, placement in zip(entry_ids, section):
+                self._occupy(placement)
+                placed.append((entry_id, placement))
+
+        delta = self._weighted(self._penalty_counts(faculty_ids, events)) - before
+        if conflicts or dry_run:
+            for _, placement in placed:
+                self._vacate(placement)
+            for placement in old.values():
+                self._occupy(placement)
+        else:
+            self.entries.update(placed)
+        return {'conflicts': conflicts, 'penalty_delta': None if conflicts else delta}
+
+    def conflicts(self, section):
+        """Hard constraints the placements of one section would break, given everything else in the index."""
+        placement = section[0]
+        subject = self.subjects[placement.subject_id]
+        room = self.rooms.get(placement.room_id)
+        if room is None:
+            return [{'type': 'room', 'message': "Unknown room"}]
+        members = [self.groups[p.group_id] for p in section if p.group_id in self.groups]
+        size = sum(g.size for g in members)
+
+        clashes = []
+        if subject.is_lab and room.type != 'lab':
+            clashes.append({'type': 'room', 'message': f"{subject.name} needs a lab, {room.name} is not one"})
+        elif not subject.is_lab and room.type == 'lab' and not self.lectures_in_labs:
+            clashes.append({'type': 'room', 'message': f"Lectures cannot be held in the lab {room.name}"})
+        if room.capacity < size:
+            names = ', '.join(g.name for g in members)
+            clashes.append({'type': 'room', 'message': f"{room.name} seats {room.capacity}, {names} has {size}"})
+
+        bit = 1 << placement.pos
+        day, slot = self.day_slot(placement.pos)
+        if self.room_bits.get(room.id, 0) & bit:
+            clashes.append({'type': 'room', 'message': f"{room.name} is already booked on {day} slot {slot}",
+                            'with': self._occupants(placement.pos, room_id=room.id)})
+        for p in section:
+            if self.group_bits.get(p.group_id, 0) & bit:
+                name = self.groups[p.group_id].name if p.group_id in self.groups else f"Group {p.group_id}"
+                clashes.append({'type': 'group', 'message': f"{name} already has a class on {day} slot {slot}",
+                                'with': self._occupants(p.pos, group_id=p.group_id)})
+        if subject.faculty_id is not None and self.faculty_bits.get(subject.faculty_id, 0) & bit:
+            faculty = self.faculties.get(subject.faculty_id)
+            name = faculty.name if faculty else f"Faculty {subject.faculty_id}"
+            clashes.append({'type': 'faculty', 'message': f"{name} is already teaching on {day} slot {slot}",
+                            'with': self._occupants(placement.pos, faculty_id=subject.faculty_id)})
+        for other_id in self.conflicting.get(subject.id, ()):
+            if any(self.event_bits[event] & bit for event in self._subject_events.get(other_id, ())):
+                clashes.append({'type': 'enrollment',
+                                'message': f"{subject.name} shares students with {self.subjects[other_id].name}, "
+                                           f"held on {day} slot {slot}",
+                                'with': self._occupants(placement.pos, subject_id=other_id)})
+        return clashes
+
+    def penalties(self):
+        """Weighted contribution of each soft-penalty family, as solver.penalty_breakdown reports it."""
+        counts = self._penalty_counts(set(self.faculty_bits), set(self.event_bits))
+        return {key: self.weights[key] * count for key, count in counts.items()}
+
+    def _penalty_counts(self, faculty_ids, events):
+        """Unweighted penalty terms of the given faculty and events."""
+        counts = dict.fromkeys(self.weights, 0)
+        num_days = len(self.days)
+        window = self.max_consecutive + 1
+        for faculty_id in faculty_ids:
+            bits = self.faculty_bits.get(faculty_id, 0)
+            faculty = self.faculties.get(faculty_id)
+            if self.enabled['MAX_HOURS_PENALTY'] and faculty is not None:
+                counts['MAX_HOURS_PENALTY'] += max(0, bits.bit_count() - faculty.max_hours_per_week)
+            if self.enabled['CONSECUTIVE_PENALTY'] and self.slots_per_day > self.max_consecutive:
+                # Windows of max_consecutive + 1 busy slots in a row
+                starts = (1 << (self.slots_per_day - self.max_consecutive)) - 1
+                for d in range(num_days):
+                    row = (bits >> (d * self.slots_per_day)) & self.day_mask
+                    run = row
+                    for k in range(1, window):
+                        run &= row >> k
+                    counts['CONSECUTIVE_PENALTY'] += (run & starts).bit_count()
+
+        for event in events:
+            subject = self.subjects[event[0]]
+            bits = self.event_bits.get(event, 0)
+            for d in range(num_days):
+                row = (bits >> (d * self.slots_per_day)) & self.day_mask
+                if subject.is_lab and self.enabled['CONSECUTIVE_LABS_WEIGHT']:
+                    # Held at sl and sl + 2 but not sl + 1
+                    gaps = row & ~(row >> 1) & (row >> 2) & ((1 << max(self.slots_per_day - 2, 0)) - 1)
+                    counts['CONSECUTIVE_LABS_WEIGHT'] += gaps.bit_count()
+                elif (not subject.is_lab and self.enabled['SAME_DAY_MULTI_PENALTY']
+                      and subject.hours_per_week <= num_days):
+                    counts['SAME_DAY_MULTI_PENALTY'] += row.bit_count() > 1
+        return counts
+
+    def _weighted(self, counts):
+        return sum(self.weights[key] * count for key, count in counts.items())
+
+    def _occupy(self, placement):
+        bit = 1 << placement.pos
+        faculty_id = self.subjects[placement.subject_id].faculty_id
+        self.room_bits[placement.room_id] = self.room_bits.get(placement.room_id, 0) | bit
+        self.group_bits[placement.group_id] = self.group_bits.get(placement.group_id, 0) | bit
+        if faculty_id is not None:
+            self.faculty_bits[faculty_id] = self.faculty_bits.get(faculty_id, 0) | bit
+        event = self._event(placement)
+        self.event_bits[event] = self.event_bits.get(event, 0) | bit
+        self._subject_events.setdefault(placement.subject_id, set()).add(event)
+
+    def _vacate(self, placement):
+        mask = ~(1 << placement.pos)
+        faculty_id = self.subjects[placement.subject_id].faculty_id
+        self.room_bits[placement.room_id] &= mask
+        self.group_bits[placement.group_id] &= mask
+        if faculty_id is not None:
+            self.faculty_bits[faculty_id] &= mask
+        self.event_bits[self._event(placement)] &= mask
+
+    def _event(self, placement):
+        # A shared section is one event for all of its groups, as in build_model
+        if self.subjects[placement.subject_id].is_shared:
+            return placement.subject_id, None
+        return placement.subject_id, placement.group_id
+
+    def _occupants(self, pos, room_id=None, group_id=None, faculty_id=None, subject_id=None):
+        """Ids of the entries behind a clash; only looked up when there is one."""
+        return [entry_id for entry_id, p in self.entries.items()
+                if p.pos == pos and (p.room_id == room_id or p.group_id == group_id or p.subject_id == subject_id
+                                     or (faculty_id is not None
+                                         and self.subjects[p.subject_id].faculty_id == faculty_id))]
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+def tenant_index(user_id, revision):
+    """The tenant's occupancy index for `revision`, rebuilt from the database when stale."""
+    with _indexes_lock:
+        index = _indexes.get(user_id)
+    if index is not None and index.revision == revision:
+        return index
+    index = build_index(user_id, revision)
+    with _indexes_lock:
+        if len(_indexes) >= INDEX_CACHE_MAX_TENANTS:
+            _indexes.clear()
+        _indexes[user_id] = index
+    return index
+
+def build_index(user_id, revision):
+    return OccupancyIndex(revision, **tenant_timetable(user_id))
+
+def tenant_timetable(user_id):
+    """
+    The tenant's settings, time grid, entities and entries as plain rows:
+    the keyword arguments of OccupancyIndex and app.analytics.evaluate().
+    """
+    from app.generation import load_settings, tenant_conflicts
+
+    config = load_settings(user_id)
+    time_slots = db.session.query(TimeSlot.day, TimeSlot.slot_number).filter_by(user_id=user_id).all()
+    if time_slots:
+        # Weekdays in calendar order, any other day names after them
+        weekdays = list(calendar.day_name)
+        days = sorted(set(day for day, _ in time_slots),
+                      key=lambda day: (weekdays.index(day) if day in weekdays else len(weekdays), day))
+        slots = sorted(set(slot for _, slot in time_slots))
+    else:
+        days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+        slots = list(range(1, 9))
+
+    def _rows(*columns):
+        return db.session.query(*columns).filter_by(user_id=user_id).all()
+
+    return dict(
+        config=config, days=days, slots=slots,
+        subjects=_rows(Subject.id, Subject.name, Subject.faculty_id, Subject.is_lab, Subject.is_shared,
+                       Subject.hours_per_week, Subject.course_id),
+        groups=_rows(StudentGroup.id, StudentGroup.name, StudentGroup.size, StudentGroup.course_id),
+        rooms=_rows(Room.id, Room.name, Room.type, Room.capacity),
+        faculties=_rows(Faculty.id, Faculty.name, Faculty.max_hours_per_week),
+        entries=_rows(TimetableEntry.id, TimetableEntry.subject_id, TimetableEntry.group_id,
+                      TimetableEntry.room_id, TimetableEntry.day, TimetableEntry.slot),
+        conflict_cliques=tenant_conflicts(user_id),
+    )
+
+def bump_revision(user_id):
+    """Invalidates the tenant's occupancy index and cached entity counts (caller commits)."""
+    User.query.filter_by(id=user_id).update({User.timetable_revision: User.timetable_revision + 1})
+
+def drop_index(user_id):
+    with _indexes_lock:
+        _indexes.pop(user_id, None)
+
+def move_entry(user_id, revision, entry_id, day, slot, room_id=None, dry_run=False):
+    """Moves one entry to `day`/`slot` (and `room_id`, if given). Raises LookupError / ValueError."""
+    index = tenant_index(user_id, revision)
+    with index.lock:
+        placement = _placement(index, entry_id)
+        pos = index.position(day, slot)
+        try:
+            room_id = int(room_id) if room_id is not None else placement.room_id
+        except (TypeError, ValueError):
+            raise ValueError(f"Invalid room: {room_id}")
+        return _apply(user_id, index, [(index.section(entry_id), room_id, pos)], dry_run)
+
+def swap_entries(user_id, revision, first_id, second_id, dry_run=False):
+    """Exchanges the day, slot and room of two entries."""
+    if first_id == second_id:
+        raise ValueError("Cannot swap an entry with itself")
+    index = tenant_index(user_id, revision)
+    with index.lock:
+        first, second = _placement(index, first_id), _placement(index, second_id)
+        first_section, second_section = index.section(first_id), index.section(second_id)
+        if first_id in second_section:
+            raise ValueError("Both entries belong to the same shared section")
+        return _apply(user_id, index, [(first_section, second.room_id, second.pos),
+                                       (second_section, first.room_id, first.pos)], dry_run)
+
+def _placement(index, entry_id):
+    if entry_id not in index.entries:
+        raise LookupError(f"Timetable entry {entry_id} not found")
+    return index.entries[entry_id]
+
+def _apply(user_id, index, moves, dry_run):
+    result = index.place(moves, dry_run)
+    if result['conflicts'] or dry_run:
+        return result
+
+    try:
+        for entry_ids, room_id, pos in moves:
+            day, slot = index.day_slot(pos)
+            (TimetableEntry.query.filter(TimetableEntry.id.in_(entry_ids), TimetableEntry.user_id == user_id)
+             .update({TimetableEntry.room_id: room_id, TimetableEntry.day: day, TimetableEntry.slot: slot},
+                     synchronize_session=False))
+        # Only commit on top of the revision the index was built from
+        bumped = (User.query.filter_by(id=user_id, timetable_revision=index.revision)
+                  .update({User.timetable_revision: User.timetable_revision + 1}))
+        if not bumped:
+            raise StaleTimetable("The timetable was changed by someone else; reload and try again")
+        live = (db.session.query(TimetableEntry.subject_id, TimetableEntry.group_id, TimetableEntry.room_id,
+                                 TimetableEntry.day, TimetableEntry.slot).filter_by(user_id=user_id))
+        version = record_version(db.session.execute, user_id, [tuple(row) for row in live],
+                                 sum(index.penalties().values()), source='edit')
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        drop_index(user_id)
+        raise
+    index.revision += 1
+    result['revision'] = index.revision
+    result['version'] = version
+    return result
@@ -0,0 +1,78 @@
+import threading
+
+from sqlalchemy import and_, func, select
+from sqlalchemy.orm import aliased
+
+from app.models import Enrollment
+
+# Elective enrollments as a subject conflict graph: an edge joins two subjects
+# whenever at least one student takes both. The solver gets the graph as a
+# cover of cliques, one "at most one of these subjects per period" constraint
+# per clique, instead of one constraint per student. Cliques are cached per
+# tenant and User.timetable_revision, which enrollment imports bump.
+
+_cliques = {}  # user_id -> (revision, cliques)
+_cliques_lock = threading.Lock()
+
+def conflict_edges_query(user_id):
+    """(subject_id, other_subject_id, shared_students) for every pair with shared students, smaller id first."""
+    a, b = aliased(Enrollment.__table__), aliased(Enrollment.__table__)
+    return (select(a.c.subject_id, b.c.subject_id, func.count())
+            .select_from(a.join(b, and_(b.c.user_id == a.c.user_id, b.c.student == a.c.student,
+                                        b.c.subject_id > a.c.subject_id)))
+            .where(a.c.user_id == user_id)
+            .group_by(a.c.subject_id, b.c.subject_id))
+
+def conflict_cliques(edges):
+    """
+    Greedy clique cover of the conflict graph: every edge ends up inside at
+    least one returned clique (a sorted list of subject ids). Each clique is
+    grown from the endpoints of an uncovered edge, preferring neighbours
+    that cover the most still-uncovered edges.
+    """
+    neighbours = {}
+    for u, v in edges:
+        if u != v:
+            neighbours.setdefault(u, set()).add(v)
+            neighbours.setdefault(v, set()).add(u)
+    uncovered = {_edge(u, v) for u, v in edges if u != v}
+
+    cliques = []
+    # Visit edges from the best-connected subjects first, for larger cliques
+    for u, v in sorted(uncovered, key=lambda e: (-len(neighbours[e[0]]) - len(neighbours[e[1]]), e)):
+        if (u, v) not in uncovered:
+            continue
+        clique = [u, v]
+        candidates = neighbours[u] & neighbours[v]
+        # gain: uncovered edges from a candidate into the clique so far
+        gain = {w: (_edge(w, u) in uncovered) + (_edge(w, v) in uncovered) for w in candidates}
+        while candidates:
+            best = max(candidates, key=lambda w: (gain[w], -w))
+            clique.append(best)
+            candidates &= neighbours[best]
+            for w in candidates:
+                gain[w] += _edge(w, best) in uncovered
+        for i, x in enumerate(clique):
+            for y in clique[i + 1:]:
+                uncovered.discard(_edge(x, y))
+        cliques.append(sorted(clique))
+    return sorted(cliques)
+
+def subject_conflicts(execute, user_id, revision=None):
+    """
+    The tenant's conflict cliques; `execute` runs a Core select (a Session or
+    Connection method). With a `revision` the cover is reused until it changes.
+    """
+    if revision is not None:
+        with _cliques_lock:
+            cached = _cliques.get(user_id)
+        if cached and cached[0] == revision:
+            return cached[1]
+    cliques = conflict_cliques([(u, v) for u, v, _ in execute(conflict_edges_query(user_id))])
+    if revision is not None:
+        with _cliques_lock:
+            _cliques[user_id] = (revision, cliques)
+    return cliques
+
+def _edge(x, y):
+    return (x, y) if x < y else (y, x)
@@ -0,0 +1,255 @@
+import csv
+import io
+import itertools
+import os
+import re
+import tempfile
+import threading
+import traceback
+import zipfile
+from collections import namedtuple
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_
+
+from app import db
+from app.models import TimetableEntry, Subject, Faculty, Room, StudentGroup, TimeSlot, ExportJob
+
+# Timetable exports, produced as generators so responses can stream them:
+# a CSV of all entries, iCalendar files per group or faculty, and zips with
+# one file per group or faculty. Big zips can also be written to EXPORT_DIR
+# by a background job; expire_export_jobs() cleans up after those.
+
+EXPORT_DIR = os.environ.get('EXPORT_DIR') or os.path.join(tempfile.gettempdir(), 'timetable-exports')
+EXPORT_JOB_TIMEOUT = int(os.environ.get('EXPORT_JOB_TIMEOUT') or 3600)
+EXPORT_KEEP_HOURS = float(os.environ.get('EXPORT_KEEP_HOURS') or 24)
+EXPORT_FORMATS = ('csv', 'ics')
+EXPORT_GROUPINGS = ('group', 'faculty')
+CSV_HEADER = ['Day', 'Slot', 'Start', 'End', 'Group', 'Subject', 'Faculty', 'Room']
+CSV_CHUNK_ROWS = 500
+
+WEEKDAYS = {day: i for i, day in enumerate(
+    ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday', 'Sunday'))}
+
+# In faculty exports a row is one section: `group` lists all of its groups and group_id is None
+ExportRow = namedtuple('ExportRow', 'day slot group_id group subject faculty_id faculty room start_time end_time '
+                                    'subject_id room_id')
+
+def export_rows(user_id, by=None, key_id=None):
+    """
+    The tenant's entries as ExportRows, streamed from the database in batches.
+    `by` ('group' or 'faculty') orders rows so each group/faculty is contiguous;
+    with `key_id` only that group's or faculty's entries are returned.
+    By faculty, a shared subject's entries for its groups become one row.
+    """
+    query = (db.session.query(TimetableEntry.day, TimetableEntry.slot, StudentGroup.id, StudentGroup.name,
+                              Subject.name, Subject.faculty_id, Faculty.name, Room.name,
+                              TimeSlot.start_time, TimeSlot.end_time, TimetableEntry.subject_id,
+                              TimetableEntry.room_id)
+             .join(Subject, TimetableEntry.subject_id == Subject.id)
+             .outerjoin(Faculty, Subject.faculty_id == Faculty.id)
+             .join(Room, TimetableEntry.room_id == Room.id)
+             .join(StudentGroup, TimetableEntry.group_id == StudentGroup.id)
+             .outerjoin(TimeSlot, and_(TimeSlot.user_id == TimetableEntry.user_id,
+                                       TimeSlot.day == TimetableEntry.day,
+                                       TimeSlot.slot_number == TimetableEntry.slot))
+             .filter(TimetableEntry.user_id == user_id))
+
+    if by == 'faculty':
+        if key_id is not None:
+            query = query.filter(Subject.faculty_id == key_id)
+        order = [Subject.faculty_id]
+    elif by == 'group':
+        if key_id is not None:
+            query = query.filter(TimetableEntry.group_id == key_id)
+        order = [TimetableEntry.group_id]
+    else:
+        order = [StudentGroup.name, TimetableEntry.group_id]
+    # Seeded time slots run Monday..Friday, so their ids give the week order
+    query = query.order_by(*order, TimeSlot.id, TimetableEntry.day, TimetableEntry.slot,
+                           TimetableEntry.subject_id, TimetableEntry.room_id, StudentGroup.name)
+
+    rows = (ExportRow(*row) for row in query.yield_per(1000))
+    yield from _sections(rows) if by == 'faculty' else rows
+
+def csv_chunks(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_HEADER)
+    for i, r in enumerate(rows, 1):
+        start, end = slot_times(r)
+        writer.writerow([r.day, r.slot, start.strftime('%H:%M'), end.strftime('%H:%M'),
+                         r.group, r.subject, r.faculty or 'N/A', r.room])
+        if i % CSV_CHUNK_ROWS == 0:
+            yield _drain(buffer)
+    yield _drain(buffer)
+
+def ics_chunks(calendar_name, rows, week_start=None):
+    """A weekly-recurring iCalendar feed, with the first occurrences in the week of `week_start`."""
+    week_start = week_start or _monday(date.today())
+    stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%SZ')
+    yield _ics_lines("BEGIN:VCALENDAR", "VERSION:2.0", "PRODID:-//TimetableAI//Timetable Export//EN",
+                     "CALSCALE:GREGORIAN", f"X-WR-CALNAME:{_ics_text(calendar_name)}")
+    for r in rows:
+        day = week_start + timedelta(days=WEEKDAYS.get(r.day, 0))
+        start, end = slot_times(r)
+        if r.group_id is None:
+            uid = f"section-{r.subject_id}-{r.room_id}-{_ics_text(r.day)}-{r.slot}"
+        else:
+            uid = f"{r.group_id}-{_ics_text(r.day)}-{r.slot}-{r.faculty_id or 0}"
+        yield _ics_lines("BEGIN:VEVENT",
+                         f"UID:{uid}@timetable",
+                         f"DTSTAMP:{stamp}",
+                         f"DTSTART:{datetime.combine(day, start).strftime('%Y%m%dT%H%M%S')}",
+                         f"DTEND:{datetime.combine(day, end).strftime('%Y%m%dT%H%M%S')}",
+                         "RRULE:FREQ=WEEKLY",
+                         f"SUMMARY:{_ics_text(f'{r.subject} ({r.group})')}",
+                         f"LOCATION:{_ics_text(r.room)}",
+                         f"DESCRIPTION:{_ics_text('Faculty: ' + (r.faculty or 'N/A'))}",
+                         "END:VEVENT")
+    yield _ics_lines("END:VCALENDAR")
+
+def zip_chunks(user_id, by, fmt):
+    """A zip with one CSV or iCalendar file per group/faculty, streamed as it is compressed."""
+    stream = _ZipStream()
+    with zipfile.ZipFile(stream, 'w', zipfile.ZIP_DEFLATED) as archive:
+        key = (lambda r: r.group_id) if by == 'group' else (lambda r: r.faculty_id)
+        for key_id, rows in itertools.groupby(export_rows(user_id, by), key=key):
+            first, rows = _peek(rows)
+            name = (first.group if by == 'group' else first.faculty) or 'Unassigned'
+            chunks = csv_chunks(rows) if fmt == 'csv' else ics_chunks(name, rows)
+            with archive.open(f"{by}/{_slug(name)}-{key_id or 0}.{fmt}", 'w') as member:
+                for chunk in chunks:
+                    member.write(chunk.encode('utf-8'))
+                    yield from stream.drain()
+        yield from stream.drain()
+    yield from stream.drain()
+
+def slot_times(row):
+    """Start/end of the row's period from its TimeSlot, else the grid's default of (8 + slot):00."""
+    start = _parse_time(row.start_time) or datetime.strptime(f'{(8 + row.slot) % 24}:00', '%H:%M').time()
+    end = _parse_time(row.end_time) or datetime.strptime(f'{(9 + row.slot) % 24}:00', '%H:%M').time()
+    return start, end
+
+def start_export_job(app, user_id, by, fmt):
+    expire_export_jobs()
+    job = ExportJob(user_id=user_id, by=by, format=fmt, status='queued')
+    db.session.add(job)
+    db.session.commit()
+    threading.Thread(target=_run_export_job, args=(app, job.id), daemon=True).start()
+    return job
+
+def expire_export_jobs(now=None):
+    """
+    Jobs run on a thread of the process that queued them, so a restart loses
+    them: ones still unfinished after EXPORT_JOB_TIMEOUT are marked failed.
+    Finished zips are deleted EXPORT_KEEP_HOURS after they were written.
+    """
+    now = now or datetime.utcnow()
+    orphaned = ExportJob.query.filter(ExportJob.status.in_(('queued', 'running')),
+                                      ExportJob.created_at < now - timedelta(seconds=EXPORT_JOB_TIMEOUT))
+    for job in orphaned:
+        job.status = 'failed'
+        job.error = 'Export did not finish; the server may have restarted. Please export again.'
+        job.finished_at = now
+    stale = ExportJob.query.filter(ExportJob.status == 'done',
+                                   ExportJob.finished_at < now - timedelta(hours=EXPORT_KEEP_HOURS))
+    for job in stale:
+        if job.path and os.path.exists(job.path):
+            os.remove(job.path)
+        job.status = 'expired'
+        job.path = None
+    db.session.commit()
+
+def _run_export_job(app, job_id):
+    with app.app_context():
+        job = db.session.get(ExportJob, job_id)
+        job.status = 'running'
+        db.session.commit()
+        path = os.path.join(EXPORT_DIR, f'export-{job.id}.zip')
+        try:
+            os.makedirs(EXPORT_DIR, exist_ok=True)
+            with open(path + '.tmp', 'wb') as f:
+                for chunk in zip_chunks(job.user_id, job.by, job.format):
+                    f.write(chunk)
+            os.replace(path + '.tmp', path)
+            job.status = 'done'
+            job.path = path
+        except Exception as e:
+            db.session.rollback()
+            traceback.print_exc()
+            job = db.session.get(ExportJob, job_id)
+            job.status = 'failed'
+            job.error = str(e)
+        job.finished_at = datetime.utcnow()
+        db.session.commit()
+
+class _ZipStream:
+    """Write-only sink for ZipFile; having no tell/seek makes it write a streamable zip."""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        if self._chunks:
+            data = b''.join(self._chunks)
+            self._chunks = []
+            yield data
+
+def _sections(rows):
+    """Merges consecutive rows of the same class (subject, day, slot, room) into one listing all its groups."""
+    for _, section in itertools.groupby(rows, key=lambda r: (r.faculty_id, r.subject_id, r.day, r.slot, r.room_id)):
+        section = list(section)
+        yield section[0]._replace(group_id=None, group=', '.join(r.group for r in section))
+
+def _peek(rows):
+    first = next(rows)
+    return first, itertools.chain([first], rows)
+
+def _drain(buffer):
+    data = buffer.getvalue()
+    buffer.seek(0)
+    buffer.truncate()
+    return data
+
+def _monday(day):
+    return day - timedelta(days=day.weekday())
+
+def _parse_time(value):
+    for fmt in ('%H:%M', '%H:%M:%S'):
+        try:
+            return datetime.strptime(value, fmt).time()
+        except (TypeError, ValueError):
+            continue
+    return None
+
+def _ics_text(value):
+    return (str(value).replace('\\', '\\\\').replace(';', '\\;').replace(',', '\\,')
+            .replace('\n', '\\n'))
+
+def _ics_lines(*lines):
+    return ''.join(_fold(line) + '\r\n' for line in lines)
+
+def _fold(line, limit=75):
+    """Folds a content line into lines of at most `limit` octets, never splitting a UTF-8 character (RFC 5545 3.1)."""
+    parts, current, size = [], [], 0
+    for char in line:
+        width = len(char.encode('utf-8'))
+        if size + width > limit:
+            parts.append(''.join(current))
+            # Continuation lines start with a space, which counts towards the limit
+            current, size = [' '], 1
+        current.append(char)
+        size += width
+    parts.append(''.join(current))
+    return '\r\n'.join(parts)
+
+def _slug(name):
+    return re.sub(r'[^A-Za-z0-9]+', '-', name).strip('-') or 'unnamed'
@@ -0,0 +1,263 @@
+import json
+from ortools.sat.python import cp_model
+from app import db
+from app.models import (Faculty, StudentGroup, Room, Subject, TimetableEntry,
+                        SystemSetting, TimeSlot, SolutionMemo, SolveRun, User)
+from app.solver import solve_timetable, analyze_constraints, estimate_model_footprint
+from app.editing import bump_revision
+from app.enrollment import subject_conflicts
+from app.history import record_version
+from app.memory_budget import MemoryBudgetExceeded, PeakRSS, fit_memory_budget
+from app.profiling import phase, record_phase
+
+# Timetable generation for one tenant, shared by the web routes and the
+# standalone solver workers. Nothing here depends on the request context.
+
+SOLVER_STATUS_NAMES = {
+    cp_model.UNKNOWN: "UNKNOWN",
+    cp_model.MODEL_INVALID: "MODEL_INVALID",
+    cp_model.FEASIBLE: "FEASIBLE",
+    cp_model.OPTIMAL: "OPTIMAL",
+    cp_model.INFEASIBLE: "INFEASIBLE"
+}
+
+# Solver runs kept per tenant for tuning the time budget settings
+SOLVE_RUNS_KEPT = 200
+
+def parse_setting_value(val):
+    if val.lower() == 'true': return True
+    if val.lower() == 'false': return False
+    try:
+        if '.' in val: return float(val)
+        return int(val)
+    except:
+        return val
+
+def load_settings(user_id):
+    """The tenant's settings as parsed values."""
+    return {key: parse_setting_value(value) for key, value in
+            db.session.query(SystemSetting.key, SystemSetting.value).filter_by(user_id=user_id)}
+
+def load_solver_inputs(user_id):
+    """User's solver config and entities, honouring the LIMIT_MAX_* settings."""
+    config = load_settings(user_id)
+
+    # Helper for user-specific data with limits
+    def _get_limited(model, limit_key):
+        limit = config.get(limit_key, 0)
+        query = model.query.filter_by(user_id=user_id)
+        if limit > 0:
+            query = query.limit(limit)
+        return query.all()
+
+    subjects = _get_limited(Subject, 'LIMIT_MAX_SUBJECTS')
+    groups = _get_limited(StudentGroup, 'LIMIT_MAX_GROUPS')
+    rooms = _get_limited(Room, 'LIMIT_MAX_ROOMS')
+    faculties = _get_limited(Faculty, 'LIMIT_MAX_FACULTIES')
+    time_slots = TimeSlot.query.filter_by(user_id=user_id).all()
+
+    # Only set when present, so other tenants keep their fingerprints
+    pins = pinned_entries(user_id)
+    if pins:
+        config['PINNED_ENTRIES'] = pins
+    conflicts = tenant_conflicts(user_id)
+    if conflicts:
+        config['SUBJECT_CONFLICTS'] = conflicts
+    return config, subjects, groups, rooms, faculties, time_slots
+
+def tenant_conflicts(user_id):
+    """The tenant's elective conflict cliques, cached per User.timetable_revision."""
+    revision = db.session.query(User.timetable_revision).filter_by(id=user_id).scalar()
+    return subject_conflicts(db.session.execute, user_id, revision)
+
+def pinned_entries(user_id):
+    """The tenant's pinned entries as sorted (subject_id, group_id, room_id, day, slot) tuples."""
+    rows = (db.session.query(TimetableEntry.subject_id, TimetableEntry.group_id, TimetableEntry.room_id,
+                             TimetableEntry.day, TimetableEntry.slot)
+            .filter(TimetableEntry.user_id == user_id, TimetableEntry.pinned.is_(True)))
+    return sorted(tuple(row) for row in rows)
+
+def save_timetable(user_id, results, obj_value, source='generate'):
+    """
+    Replaces the user's live timetable and solver score (caller commits).
+    Entries matching a previously pinned one stay pinned. The timetable is
+    also recorded in the tenant's history; returns its version number.
+    """
+    pins = set(pinned_entries(user_id))
+    TimetableEntry.query.filter_by(user_id=user_id).delete()
+    bump_revision(user_id)
+
+    # Save solver score
+    score_setting = SystemSetting.query.filter_by(user_id=user_id, key='LAST_SOLVER_SCORE').first()
+    if not score_setting:
+        score_setting = SystemSetting(user_id=user_id, key='LAST_SOLVER_SCORE', value=str(obj_value))
+        db.session.add(score_setting)
+    else:
+        score_setting.value = str(obj_value)
+
+    for r in results:
+        entry = TimetableEntry(
+            user_id=user_id,
+            subject_id=r['subject_id'],
+            room_id=r['room_id'],
+            group_id=r['group_id'],
+            day=r['day'],
+            slot=r['slot'],
+            pinned=(r['subject_id'], r['group_id'], r['room_id'], r['day'], r['slot']) in pins
+        )
+        db.session.add(entry)
+
+    return record_version(db.session.execute, user_id,
+                          [(r['subject_id'], r['group_id'], r['room_id'], r['day'], r['slot']) for r in results],
+                          obj_value, source)
+
+def solve_and_save(user_id, config, subjects, groups, rooms, faculties, time_slots, fingerprint,
+                   still_owner=None):
+    """
+    Solves (or reuses the memoized solution) and stores the timetable.
+    `still_owner`, if given, is checked before writing so a worker whose job
+    lease was taken over does not overwrite the newer run.
+    Returns (payload, http_code).
+    """
+    # Reuse the stored solution for identical inputs, otherwise run the solver
+    with phase('memo'):
+        memo = find_solution_memo(user_id, fingerprint,
+                                  requested_time_limit(config, subjects, groups, rooms, faculties, time_slots))
+    dropped = []
+    if memo:
+        status, obj_value = memo.status, memo.obj_value
+        results = [dict(zip(('subject_id', 'room_id', 'group_id', 'day', 'slot'), row))
+                   for row in json.loads(memo.entries)]
+    else:
+        try:
+            with phase('estimate'):
+                config, footprint, dropped = fit_memory_budget(config, subjects, groups, rooms, faculties, time_slots)
+        except MemoryBudgetExceeded as e:
+            return {
+                "status": "Failed",
+                "message": f"{e} Narrow the scope with the LIMIT_MAX_* settings or raise SOLVER_MEMORY_BUDGET_MB.",
+                "estimate": e.footprint,
+                "memory_budget_mb": e.budget_mb,
+                "suggested_limits": e.suggested_limits
+            }, 400
+        # Racing strategies and staged solves can warm-start from the timetable currently in place
+        hint = None
+        if config.get('SOLVER_PORTFOLIO_SIZE', 0) > 1 or config.get('SOLVER_STAGED'):
+            hint = [(e.subject_id, e.group_id, e.room_id, e.day, e.slot)
+                    for e in TimetableEntry.query.filter_by(user_id=user_id).all()]
+        stats = {}
+        with PeakRSS() as rss:
+            status, results, obj_value = solve_timetable(subjects, groups, rooms, faculties, time_slots,
+                                                         config=config, hint=hint, stats=stats)
+        record_phase('build', stats.get('build_time'))
+        record_phase('search', stats.get('solve_time'))
+        record_solve_run(user_id, fingerprint, config, status, obj_value, stats, footprint, rss, dropped)
+
+    if still_owner is not None and not still_owner():
+        db.session.rollback()
+        return {"status": "Failed", "message": "Solve was taken over by another worker"}, 409
+
+    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
+        # Save to DB - isolated by user
+        with phase('save'):
+            save_timetable(user_id, results, obj_value)
+
+            # A lean solve answers a different model than the fingerprint describes, so it is not reused
+            if not memo and not dropped:
+                # The limit the run actually had, which an adaptive budget may have extended
+                budget = stats.get('budget')
+                time_limit = budget['limit'] if budget else float(config.get('SOLVER_TIME_LIMIT', 30))
+                store_solution_memo(user_id, fingerprint, time_limit, status, obj_value, results)
+
+            db.session.commit()
+        return {
+            "status": "Success",
+            "entries_generated": len(results),
+            "solver_status": int(status),
+            "cached": memo is not None,
+            "dropped_constraints": dropped
+        }, 200
+    else:
+        status_name = SOLVER_STATUS_NAMES.get(status, f"UNKNOWN STATUS CODE: {status}")
+
+        # Analyze reasons
+        reasons = analyze_constraints(subjects, groups, rooms, faculties, time_slots)
+        db.session.commit()
+
+        return {
+            "status": "Failed",
+            "message": f"No solution found. Status: {status_name}",
+            "reasons": reasons
+        }, 400
+
+def requested_time_limit(config, subjects, groups, rooms, faculties, time_slots):
+    """
+    The time limit a new solve of these inputs starts with: SOLVER_TIME_LIMIT,
+    or with SOLVER_ADAPTIVE_BUDGET the size-based starting limit.
+    """
+    # Staged and portfolio solves always run under SOLVER_TIME_LIMIT, as in solve_timetable
+    if (config.get('SOLVER_ADAPTIVE_BUDGET') and not config.get('SOLVER_STAGED')
+            and int(config.get('SOLVER_PORTFOLIO_SIZE', 0) or 0) <= 1):
+        from app.budget import budget_policy
+        footprint = estimate_model_footprint(subjects, groups, rooms, faculties, time_slots, config)
+        return budget_policy(footprint, config)['initial_limit']
+    return float(config.get('SOLVER_TIME_LIMIT', 30))
+
+def find_solution_memo(user_id, fingerprint, time_limit):
+    """
+    Returns the tenant's stored solution for these exact inputs if it can be
+    reused: proven optimal, or feasible under at least the time limit a new
+    solve would get (memos store the limit their run ended with).
+    Memos for any other fingerprint are stale (data or config changed) and are evicted.
+    """
+    SolutionMemo.query.filter(SolutionMemo.user_id == user_id,
+                              SolutionMemo.fingerprint != fingerprint).delete()
+    memo = SolutionMemo.query.filter_by(user_id=user_id, fingerprint=fingerprint).first()
+    if not memo:
+        return None
+    if memo.status == cp_model.OPTIMAL:
+        return memo
+    if memo.status == cp_model.FEASIBLE and memo.time_limit >= time_limit:
+        return memo
+    return None
+
+def store_solution_memo(user_id, fingerprint, time_limit, status, obj_value, results):
+    SolutionMemo.query.filter_by(user_id=user_id).delete()
+    db.session.add(SolutionMemo(
+        user_id=user_id,
+        fingerprint=fingerprint,
+        status=int(status),
+        time_limit=time_limit,
+        obj_value=obj_value,
+        entries=json.dumps([[r['subject_id'], r['room_id'], r['group_id'], r['day'], r['slot']] for r in results])
+    ))
+
+def record_solve_run(user_id, fingerprint, config, status, obj_value, stats, footprint=None, rss=None, dropped=()):
+    """
+    Logs a solver run with its time budget outcome, estimated and measured
+    memory, dropping the tenant's oldest beyond SOLVE_RUNS_KEPT (caller commits).
+    """
+    budget = stats.get('budget')
+    db.session.add(SolveRun(
+        user_id=user_id,
+        fingerprint=fingerprint,
+        status=int(status),
+        obj_value=obj_value,
+        best_bound=stats.get('best_bound'),
+        variables=stats.get('variables'),
+        constraints=stats.get('constraints'),
+        time_limit=budget['limit'] if budget else float(config.get('SOLVER_TIME_LIMIT', 30)),
+        solve_time=stats.get('solve_time'),
+        stop_reason=budget['stop_reason'] if budget else None,
+        budget=json.dumps(budget) if budget else None,
+        # Unscaled, so calibration compares measurements with the raw estimator; and only
+        # for runs that built their model, as a model cache hit barely grows the process
+        estimated_mb=(footprint['memory_mb'] / footprint['calibration']
+                      if footprint and not stats.get('model_cache_hit') else None),
+        peak_rss_mb=round(rss.peak_mb, 1) if rss else None,
+        memory_growth_mb=round(rss.growth_mb, 1) if rss else None,
+        dropped_families=','.join(dropped) or None
+    ))
+    stale = (db.session.query(SolveRun.id).filter(SolveRun.user_id == user_id)
+             .order_by(SolveRun.id.desc()).offset(SOLVE_RUNS_KEPT).subquery())
+    SolveRun.query.filter(SolveRun.id.in_(db.session.query(stale.c.id))).delete(synchronize_session=False)
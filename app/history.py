@@ -0,0 +1,151 @@
+import json
+
+from sqlalchemy import func, insert, select
+
+from app import db
+from app.models import TimetableVersion, Subject, StudentGroup, Room, User
+
+# Timetable history: every saved timetable becomes a numbered version. Most
+# versions store only what changed since the version before them (added,
+# removed and moved assignments) as flat integer lists; every
+# VERSION_KEYFRAME_INTERVAL-th version is a full copy, so rebuilding any
+# version reads at most that many rows. An assignment is (subject_id,
+# group_id, room_id, day, slot); in a payload the day is an index into the
+# version's own `days` list.
+
+VERSION_KEYFRAME_INTERVAL = 20
+TIMETABLE_VERSIONS_KEPT = 100
+
+versions = TimetableVersion.__table__
+
+def record_version(execute, user_id, assignments, obj_value=None, source='generate'):
+    """
+    Stores `assignments` as the tenant's next version and returns its number
+    (caller commits). `execute` runs a Core statement: a Session or
+    Connection method, so batch writes can record versions too.
+    """
+    current = set(map(tuple, assignments))
+    # Concurrent saves for one tenant queue on its user row, so the later one numbers after the earlier
+    execute(select(User.__table__.c.id).where(User.__table__.c.id == user_id).with_for_update())
+    latest = execute(select(func.max(versions.c.number)).where(versions.c.user_id == user_id)).scalar()
+    number = (latest or 0) + 1
+    if latest is None or number % VERSION_KEYFRAME_INTERVAL == 1:
+        base, payload = None, pack_full(current)
+    else:
+        base, payload = latest, pack_delta(diff_assignments(load_version(execute, user_id, latest), current))
+    execute(insert(versions).values(user_id=user_id, number=number, base=base, source=source,
+                                    entry_count=len(current), obj_value=obj_value,
+                                    payload=json.dumps(payload, separators=(',', ':'))))
+    _prune(execute, user_id, number)
+    return number
+
+def load_version(execute, user_id, number):
+    """The set of assignments in version `number`, or None if the tenant has no such version."""
+    start = execute(select(func.max(versions.c.number))
+                    .where(versions.c.user_id == user_id, versions.c.number <= number,
+                           versions.c.base.is_(None))).scalar()
+    if start is None:
+        return None
+    rows = execute(select(versions.c.number, versions.c.payload)
+                   .where(versions.c.user_id == user_id, versions.c.number.between(start, number))
+                   .order_by(versions.c.number)).all()
+    if not rows or rows[-1].number != number:
+        return None
+
+    assignments = set()
+    for row in rows:
+        assignments = apply_payload(assignments, json.loads(row.payload))
+    return assignments
+
+def apply_payload(assignments, payload):
+    """The set of assignments a stored payload (full copy or delta) leaves on top of `assignments`."""
+    days = payload['days']
+    if 'entries' in payload:
+        return set(unpack_flat(payload['entries'], days))
+    assignments = set(assignments)
+    assignments.difference_update(unpack_flat(payload['removed'], days))
+    assignments.update(unpack_flat(payload['added'], days))
+    moved = payload['moved']
+    for i in range(0, len(moved), 8):
+        s, g, r0, d0, sl0, r1, d1, sl1 = moved[i:i + 8]
+        assignments.discard((s, g, r0, days[d0], sl0))
+        assignments.add((s, g, r1, days[d1], sl1))
+    return assignments
+
+def diff_assignments(old, new):
+    """
+    What changed from the `old` to the `new` set of assignments, in one pass
+    over each: {'added': [...], 'removed': [...], 'moved': [(before, after), ...]}.
+    A subject's class for a group that left one place and arrived at another
+    counts as moved rather than removed and added.
+    """
+    arrivals = {}
+    for a in new - old:
+        arrivals.setdefault(a[:2], []).append(a)
+    moved, removed = [], []
+    for r in old - new:
+        waiting = arrivals.get(r[:2])
+        if waiting:
+            moved.append((r, waiting.pop()))
+        else:
+            removed.append(r)
+    added = [a for waiting in arrivals.values() for a in waiting]
+    return {'added': added, 'removed': removed, 'moved': moved}
+
+def rollback_timetable(user_id, number):
+    """
+    Makes version `number` the live timetable again, saved as a new version
+    (caller commits). Classes whose subject, group or room has since been
+    deleted are left out. Returns (new version number, classes left out).
+    """
+    # Generation pulls in OR-Tools; only load it once a rollback actually happens
+    from app.generation import save_timetable
+
+    version = db.session.execute(select(versions.c.obj_value)
+                                 .where(versions.c.user_id == user_id, versions.c.number == number)).first()
+    assignments = load_version(db.session.execute, user_id, number) if version is not None else None
+    if assignments is None:
+        raise LookupError(f"Timetable version {number} not found")
+
+    subjects, groups, rooms = (set(db.session.execute(select(model.id).where(model.user_id == user_id)).scalars())
+                               for model in (Subject, StudentGroup, Room))
+    kept = [a for a in assignments if a[0] in subjects and a[1] in groups and a[2] in rooms]
+    results = [dict(zip(('subject_id', 'group_id', 'room_id', 'day', 'slot'), a)) for a in kept]
+    new_number = save_timetable(user_id, results, version.obj_value, source='rollback')
+    return new_number, len(assignments) - len(kept)
+
+def _prune(execute, user_id, latest):
+    """Drops versions beyond the newest TIMETABLE_VERSIONS_KEPT, keeping the full copy the oldest kept one needs."""
+    oldest_kept = latest - TIMETABLE_VERSIONS_KEPT + 1
+    if oldest_kept <= 1:
+        return
+    start = execute(select(func.max(versions.c.number))
+                    .where(versions.c.user_id == user_id, versions.c.number <= oldest_kept,
+                           versions.c.base.is_(None))).scalar()
+    if start:
+        execute(versions.delete().where(versions.c.user_id == user_id, versions.c.number < start))
+
+def pack_full(assignments):
+    days = sorted({a[3] for a in assignments})
+    return {'days': days, 'entries': pack_flat(assignments, {d: i for i, d in enumerate(days)})}
+
+def pack_delta(delta):
+    days = sorted({a[3] for a in delta['added'] + delta['removed']} |
+                  {a[3] for pair in delta['moved'] for a in pair})
+    codes = {d: i for i, d in enumerate(days)}
+    moved = []
+    for (s, g, r0, d0, sl0), (_, _, r1, d1, sl1) in delta['moved']:
+        moved.extend((s, g, r0, codes[d0], sl0, r1, codes[d1], sl1))
+    return {'days': days, 'added': pack_flat(delta['added'], codes), 'removed': pack_flat(delta['removed'], codes),
+            'moved': moved}
+
+def pack_flat(assignments, codes):
+    flat = []
+    for s, g, r, d, sl in assignments:
+        flat.extend((s, g, r, codes[d], sl))
+    return flat
+
+def unpack_flat(flat, days):
+    for i in range(0, len(flat), 5):
+        s, g, r, d, sl = flat[i:i + 5]
+        yield (s, g, r, days[d], sl)
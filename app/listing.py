@@ -0,0 +1,167 @@
+import base64
+import json
+import threading
+import time
+
+from sqlalchemy import and_, func, or_
+
+from app import db
+from app.models import Department, Course, StudentGroup, Faculty, Room, Subject
+
+# Paged entity lists for the manage page: name-prefix search, filters,
+# sorting and keyset pagination over (sort column, id), with row counts
+# served from a short-lived per-process cache. Counts are cached per
+# User.timetable_revision, which every entity write bumps in the database,
+# so no process serves a count from before another process's write.
+
+LIST_PAGE_SIZE = 50
+LIST_MAX_PAGE_SIZE = 200
+COUNT_CACHE_TTL = 30
+COUNT_CACHE_MAX_ENTRIES = 10000
+
+# entity -> columns returned, joins needed for them, ?filters and ?sort keys
+LIST_SPECS = {
+    'department': {
+        'model': Department,
+        'columns': (Department.id, Department.name),
+        'joins': (),
+        'filters': {},
+        'sorts': {'name': Department.name},
+    },
+    'course': {
+        'model': Course,
+        'columns': (Course.id, Course.name, Course.department_id,
+                    Department.name.label('department_name')),
+        'joins': ((Department, Course.department_id == Department.id),),
+        'filters': {'department_id': Course.department_id},
+        'sorts': {'name': Course.name},
+    },
+    'group': {
+        'model': StudentGroup,
+        'columns': (StudentGroup.id, StudentGroup.name, StudentGroup.size, StudentGroup.course_id,
+                    Course.name.label('course_name')),
+        'joins': ((Course, StudentGroup.course_id == Course.id),),
+        'filters': {'course_id': StudentGroup.course_id},
+        'sorts': {'name': StudentGroup.name, 'size': StudentGroup.size},
+    },
+    'faculty': {
+        'model': Faculty,
+        'columns': (Faculty.id, Faculty.name, Faculty.max_hours_per_week, Faculty.department_id),
+        'joins': (),
+        'filters': {'department_id': Faculty.department_id},
+        'sorts': {'name': Faculty.name, 'max_hours_per_week': Faculty.max_hours_per_week},
+    },
+    'room': {
+        'model': Room,
+        'columns': (Room.id, Room.name, Room.capacity, Room.type),
+        'joins': (),
+        'filters': {'type': Room.type},
+        'sorts': {'name': Room.name, 'capacity': Room.capacity},
+    },
+    'subject': {
+        'model': Subject,
+        'columns': (Subject.id, Subject.name, Subject.hours_per_week, Subject.is_lab, Subject.is_shared,
+                    Subject.course_id, Subject.faculty_id, func.coalesce(Faculty.name, 'Unassigned').label('faculty_name')),
+        # Outer join: subjects may have no faculty
+        'joins': ((Faculty, Subject.faculty_id == Faculty.id, True),),
+        'filters': {'course_id': Subject.course_id, 'faculty_id': Subject.faculty_id, 'is_lab': Subject.is_lab,
+                    'is_shared': Subject.is_shared},
+        'sorts': {'name': Subject.name, 'hours_per_week': Subject.hours_per_week},
+    },
+}
+
+_counts = {}
+_counts_lock = threading.Lock()
+
+def list_page(entity, user_id, revision, args):
+    """
+    One page of `entity` rows for the tenant at `revision` (its User.timetable_revision).
+    Raises ValueError on bad arguments.
+    args: q (name prefix), <filter>=<value>, sort, order (asc|desc), limit, cursor.
+    """
+    spec = LIST_SPECS[entity]
+    model = spec['model']
+
+    query = db.session.query(*spec['columns']).select_from(model)
+    for target, onclause, *outer in spec['joins']:
+        query = query.outerjoin(target, onclause) if outer else query.join(target, onclause)
+    query = query.filter(model.user_id == user_id)
+
+    signature = []
+    prefix = (args.get('q') or '').strip()
+    if prefix:
+        escaped = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_')
+        query = query.filter(model.name.ilike(escaped + '%', escape='\\'))
+        signature.append(('q', prefix.lower()))
+    for key, column in spec['filters'].items():
+        if args.get(key) not in (None, ''):
+            value = _parse_filter(column, args[key])
+            query = query.filter(column == value)
+            signature.append((key, value))
+
+    total = _cached_count((user_id, revision, entity, tuple(signature)), query)
+
+    sort_key = args.get('sort') or 'name'
+    if sort_key not in spec['sorts']:
+        raise ValueError(f"Cannot sort {entity} by {sort_key}")
+    sort_column = spec['sorts'][sort_key]
+    descending = args.get('order') == 'desc'
+    try:
+        limit = min(max(int(args.get('limit') or LIST_PAGE_SIZE), 1), LIST_MAX_PAGE_SIZE)
+    except ValueError:
+        raise ValueError("limit must be a number")
+
+    if args.get('cursor'):
+        value, last_id = _decode_cursor(args['cursor'])
+        if descending:
+            query = query.filter(or_(sort_column < value, and_(sort_column == value, model.id < last_id)))
+        else:
+            query = query.filter(or_(sort_column > value, and_(sort_column == value, model.id > last_id)))
+    if descending:
+        query = query.order_by(sort_column.desc(), model.id.desc())
+    else:
+        query = query.order_by(sort_column, model.id)
+
+    rows = query.limit(limit + 1).all()
+    items = [dict(row._mapping) for row in rows[:limit]]
+    next_cursor = None
+    if len(rows) > limit:
+        next_cursor = _encode_cursor(items[-1][sort_key], items[-1]['id'])
+    return {"items": items, "total": total, "next_cursor": next_cursor}
+
+def tenant_count(user_id, revision, entity):
+    """Unfiltered row count for the tenant at `revision`, from the cache when fresh."""
+    model = LIST_SPECS[entity]['model']
+    return _cached_count((user_id, revision, entity, ()), model.query.filter_by(user_id=user_id))
+
+def _cached_count(key, query):
+    now = time.monotonic()
+    with _counts_lock:
+        cached = _counts.get(key)
+    if cached and now - cached[1] < COUNT_CACHE_TTL:
+        return cached[0]
+    count = query.order_by(None).count()
+    with _counts_lock:
+        if len(_counts) >= COUNT_CACHE_MAX_ENTRIES:
+            _counts.clear()
+        _counts[key] = (count, now)
+    return count
+
+def _parse_filter(column, raw):
+    python_type = column.type.python_type
+    if python_type is bool:
+        return raw.lower() in ('true', '1', 'yes')
+    try:
+        return python_type(raw)
+    except ValueError:
+        raise ValueError(f"Invalid value for {column.key}: {raw}")
+
+def _encode_cursor(value, last_id):
+    return base64.urlsafe_b64encode(json.dumps([value, last_id]).encode()).decode()
+
+def _decode_cursor(cursor):
+    try:
+        value, last_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return value, int(last_id)
+    except (ValueError, TypeError):
+        raise ValueError("Invalid cursor")
@@ -0,0 +1,204 @@
+import http.cookiejar
+import itertools
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from werkzeug.security import generate_password_hash
+
+from app import db
+from app.models import User
+from app.snapshot import delete_tenant, load_snapshot, restore_tenant
+
+# HTTP load harness: synthetic tenants restored in bulk from a snapshot, and
+# virtual users each logged in as one of them, sending a weighted mix of read,
+# write and solve requests to a running server. Per endpoint it reports
+# latency percentiles, throughput, error rates and the SQL statements per
+# request (from the X-DB-Queries header, see QUERY_COUNT_HEADER).
+
+LOAD_TENANT_PREFIX = 'load-'
+LOAD_TENANT_PASSWORD = 'load-test'
+
+# name -> (method, path, kind); kind picks the request body
+ENDPOINTS = {
+    'timetable': ('GET', '/timetable', 'read'),
+    'manage': ('GET', '/manage', 'read'),
+    'view_all': ('GET', '/api/view/all', 'read'),
+    'import_finalize': ('POST', '/api/import/finalize', 'write'),
+    'generate': ('POST', '/generate-timetable', 'solve'),
+}
+DEFAULT_MIX = {'timetable': 3, 'manage': 2, 'view_all': 3, 'import_finalize': 1, 'generate': 1}
+
+def provision_tenants(count, snapshot_path):
+    """
+    Makes sure tenants load-0 .. load-<count-1> exist, each holding a copy of
+    the snapshot (caller needs an app context). Existing ones are recreated,
+    so every run starts from the same data. Returns their usernames.
+    """
+    snapshot = load_snapshot(snapshot_path)
+    # One hash for all of them: hashing a password per tenant would dominate provisioning
+    password_hash = generate_password_hash(LOAD_TENANT_PASSWORD)
+    usernames = [f'{LOAD_TENANT_PREFIX}{i}' for i in range(count)]
+    for (user_id,) in db.session.query(User.id).filter(User.username.in_(usernames)):
+        delete_tenant(user_id)
+    for username in usernames:
+        user = User(username=username, password_hash=password_hash)
+        db.session.add(user)
+        db.session.flush()
+        restore_tenant(snapshot, user.id)
+    db.session.commit()
+    return usernames
+
+def parse_mix(spec):
+    """'timetable=3,generate=1' -> {'timetable': 3, 'generate': 1}."""
+    mix = {}
+    for part in filter(None, (p.strip() for p in spec.split(','))):
+        name, _, weight = part.partition('=')
+        if name not in ENDPOINTS:
+            raise ValueError(f"Unknown endpoint '{name}' (choose from {', '.join(ENDPOINTS)})")
+        mix[name] = float(weight or 1)
+    if not mix or not any(mix.values()):
+        raise ValueError("The mix needs at least one endpoint with a positive weight")
+    return mix
+
+def run_load(base_url, usernames, mix, concurrency, duration=None, total_requests=None, seed=0):
+    """
+    Runs `concurrency` virtual users against `base_url` until `duration`
+    seconds pass or `total_requests` have been sent. Returns (samples,
+    elapsed): samples are (endpoint, status, seconds, db_queries), with
+    status 0 for a request that got no HTTP response.
+    """
+    names = list(mix)
+    weights = [mix[name] for name in names]
+    samples = []
+    lock = threading.Lock()
+    sent = itertools.count()
+    deadline = time.monotonic() + duration if duration else None
+
+    def virtual_user(number):
+        rnd = random.Random(seed * 1000 + number)
+        opener = login(base_url, usernames[number % len(usernames)])
+        while True:
+            if deadline is not None and time.monotonic() >= deadline:
+                return
+            if total_requests is not None and next(sent) >= total_requests:
+                return
+            name = rnd.choices(names, weights)[0]
+            sample = (name, *send(opener, base_url, name))
+            with lock:
+                samples.append(sample)
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        for future in [pool.submit(virtual_user, n) for n in range(concurrency)]:
+            future.result()
+    return samples, time.monotonic() - started
+
+def login(base_url, username):
+    """An opener holding the session cookie of `username`."""
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()))
+    form = urllib.parse.urlencode({'username': username, 'password': LOAD_TENANT_PASSWORD}).encode()
+    with opener.open(base_url + '/login', data=form, timeout=30) as response:
+        if not response.geturl().endswith('/manage'):
+            raise RuntimeError(f"Could not log in as {username}")
+    return opener
+
+def send(opener, base_url, name):
+    """Sends one request to endpoint `name`; returns (status, seconds, db_queries)."""
+    method, path, kind = ENDPOINTS[name]
+    data, headers = None, {}
+    if kind == 'write':
+        # A new room per request, as an append-mode import
+        room = {'Name': f'Load {uuid.uuid4().hex[:8]}', 'Capacity': 60, 'Type': 'lecture'}
+        data = json.dumps({'type': 'room', 'mode': 'append', 'data': [room]}).encode()
+        headers['Content-Type'] = 'application/json'
+    elif method == 'POST':
+        data = b''
+    request = urllib.request.Request(base_url + path, data=data, headers=headers, method=method)
+
+    started = time.perf_counter()
+    try:
+        with opener.open(request, timeout=300) as response:
+            response.read()
+            status, queries = response.status, response.headers.get('X-DB-Queries')
+    except urllib.error.HTTPError as e:
+        e.read()
+        status, queries = e.code, e.headers.get('X-DB-Queries')
+    except OSError:
+        status, queries = 0, None
+    return status, time.perf_counter() - started, int(queries) if queries is not None else None
+
+def summarize(samples, elapsed, meta=None):
+    """Per-endpoint and overall statistics, rounded so saved results diff cleanly."""
+    by_endpoint = {}
+    for name, status, seconds, queries in samples:
+        by_endpoint.setdefault(name, []).append((status, seconds, queries))
+    endpoints = {name: _stats(rows, elapsed) for name, rows in sorted(by_endpoint.items())}
+    return {
+        'meta': dict(meta or {}, elapsed_s=round(elapsed, 1)),
+        'total': _stats([(s, t, q) for _, s, t, q in samples], elapsed),
+        'endpoints': endpoints,
+    }
+
+def format_summary(summary):
+    header = (f"{'endpoint':<18} {'requests':>8} {'req/s':>7} {'errors':>7} {'p50 ms':>8} {'p90 ms':>8} "
+              f"{'p99 ms':>8} {'max ms':>8} {'queries':>8}")
+    lines = [header, '-' * len(header)]
+    for name, s in list(summary['endpoints'].items()) + [('TOTAL', summary['total'])]:
+        queries = '-' if s['db_queries_mean'] is None else f"{s['db_queries_mean']:.1f}"
+        lines.append(f"{name:<18} {s['requests']:>8} {s['throughput_rps']:>7.1f} {s['error_rate']:>7.1%} "
+                     f"{s['p50_ms']:>8.1f} {s['p90_ms']:>8.1f} {s['p99_ms']:>8.1f} {s['max_ms']:>8.1f} {queries:>8}")
+    return '\n'.join(lines)
+
+def compare_summaries(baseline, current):
+    """Side-by-side p50/p99, error rate and queries per endpoint, with the change in p99."""
+    header = f"{'endpoint':<18} {'p50 ms':>17} {'p99 ms':>17} {'p99 change':>11} {'errors':>15} {'queries':>13}"
+    lines = [header, '-' * len(header)]
+    for name in sorted(set(baseline['endpoints']) | set(current['endpoints'])):
+        old, new = baseline['endpoints'].get(name), current['endpoints'].get(name)
+        if not old or not new:
+            lines.append(f"{name:<18} {'only in ' + ('current' if new else 'baseline'):>17}")
+            continue
+        change = (new['p99_ms'] - old['p99_ms']) / old['p99_ms'] if old['p99_ms'] else 0.0
+        lines.append(f"{name:<18} {old['p50_ms']:>8.1f}{new['p50_ms']:>9.1f} {old['p99_ms']:>8.1f}{new['p99_ms']:>9.1f} "
+                     f"{change:>+11.0%} {old['error_rate']:>7.1%}{new['error_rate']:>8.1%} "
+                     f"{_fmt(old['db_queries_mean']):>6}{_fmt(new['db_queries_mean']):>7}")
+    return '\n'.join(lines)
+
+def _stats(rows, elapsed):
+    latencies = sorted(seconds * 1000 for _, seconds, _ in rows)
+    errors = sum(1 for status, _, _ in rows if status == 0 or status >= 400)
+    queries = [q for _, _, q in rows if q is not None]
+    statuses = {}
+    for status, _, _ in rows:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(rows),
+        'throughput_rps': round(len(rows) / elapsed, 2) if elapsed else 0.0,
+        'errors': errors,
+        'error_rate': round(errors / len(rows), 4) if rows else 0.0,
+        'statuses': statuses,
+        'mean_ms': round(sum(latencies) / len(latencies), 1) if latencies else 0.0,
+        'p50_ms': _percentile(latencies, 50),
+        'p90_ms': _percentile(latencies, 90),
+        'p99_ms': _percentile(latencies, 99),
+        'max_ms': round(latencies[-1], 1) if latencies else 0.0,
+        'db_queries_mean': round(sum(queries) / len(queries), 1) if queries else None,
+        'db_queries_max': max(queries) if queries else None,
+    }
+
+def _percentile(ordered, pct):
+    """Nearest-rank percentile of an ascending list."""
+    if not ordered:
+        return 0.0
+    rank = max(1, -(-pct * len(ordered) // 100))
+    return round(ordered[int(rank) - 1], 1)
+
+def _fmt(value):
+    return '-' if value is None else f'{value:.1f}'
@@ -0,0 +1,143 @@
+import math
+import os
+import statistics
+import threading
+
+from app.models import SolveRun
+from app.solver import MODEL_BASE_MB, estimate_model_footprint, search_workers
+
+# Memory guard for solves: the model's footprint is estimated from entity
+# counts before anything is built, and a solve that would not fit the
+# tenant's SOLVER_MEMORY_BUDGET_MB (or this host's SOLVER_MEMORY_BUDGET_MB
+# environment ceiling) either drops soft-constraint families until it does or
+# is rejected with smaller LIMIT_MAX_* values to try. Peak RSS of every run is
+# recorded on its SolveRun, and the recent ratio of measured to estimated
+# growth scales later estimates.
+
+SERVER_MEMORY_BUDGET_MB = float(os.environ.get('SOLVER_MEMORY_BUDGET_MB') or 0)
+CALIBRATION_RUNS = 50
+RSS_SAMPLE_SECONDS = 0.05
+
+# Soft-constraint families a lean solve may switch off, and their switches.
+# The faculty max-hours penalty stays: it is small and weighs the most.
+LEAN_FAMILIES = {
+    'CONSECUTIVE_PENALTY': 'CONSTRAINT_FACULTY_CONSECUTIVE_ENABLED',
+    'SAME_DAY_MULTI_PENALTY': 'CONSTRAINT_SUBJECT_DISTRIBUTION_ENABLED',
+    'CONSECUTIVE_LABS_WEIGHT': 'CONSTRAINT_LAB_CONSECUTIVE_ENABLED',
+}
+
+class MemoryBudgetExceeded(Exception):
+    """The solve would not fit the memory budget, even in lean mode when allowed."""
+
+    def __init__(self, message, footprint, budget_mb, suggested_limits):
+        super().__init__(message)
+        self.footprint = footprint
+        self.budget_mb = budget_mb
+        self.suggested_limits = suggested_limits
+
+def memory_budget(config):
+    """The tightest of the tenant's and the host's budgets in MB, or 0 for none."""
+    budgets = [b for b in (float(config.get('SOLVER_MEMORY_BUDGET_MB', 0) or 0), SERVER_MEMORY_BUDGET_MB) if b > 0]
+    return min(budgets, default=0)
+
+def fit_memory_budget(config, subjects, groups, rooms, faculties, time_slots):
+    """
+    Returns (config, footprint, dropped) for a solve that fits the budget:
+    the config unchanged, or with the largest soft-constraint families
+    switched off when SOLVER_MEMORY_ACTION is 'lean'. Raises
+    MemoryBudgetExceeded when it cannot be made to fit.
+    """
+    num_workers = search_workers(config)
+    scale = memory_calibration()
+
+    def estimate(cfg):
+        footprint = estimate_model_footprint(subjects, groups, rooms, faculties, time_slots, cfg, num_workers)
+        footprint['memory_mb'] = round(footprint['memory_mb'] * scale, 1)
+        footprint['calibration'] = round(scale, 3)
+        return footprint
+
+    footprint = estimate(config)
+    budget = memory_budget(config)
+    if not budget or footprint['memory_mb'] <= budget:
+        return config, footprint, []
+
+    dropped = []
+    if config.get('SOLVER_MEMORY_ACTION', 'lean') == 'lean':
+        lean_footprint = footprint
+        lean = dict(config)
+        by_size = sorted((family for family in LEAN_FAMILIES if family in footprint['families']),
+                         key=lambda family: -footprint['families'][family]['variables'])
+        for family in by_size:
+            lean[LEAN_FAMILIES[family]] = False
+            dropped.append(family)
+            lean_footprint = estimate(lean)
+            if lean_footprint['memory_mb'] <= budget:
+                return lean, lean_footprint, dropped
+        footprint = lean_footprint
+
+    raise MemoryBudgetExceeded(
+        f"The model needs about {footprint['memory_mb']:.0f} MB, over the {budget:.0f} MB memory budget"
+        + (" even without soft constraints." if dropped else "."),
+        footprint, budget, suggested_limits(footprint, budget, groups, rooms))
+
+def suggested_limits(footprint, budget, groups, rooms):
+    """LIMIT_MAX_GROUPS / LIMIT_MAX_ROOMS to try: the model grows with groups x rooms, so shrink both by sqrt."""
+    share = max(budget - MODEL_BASE_MB, 1) / max(footprint['memory_mb'] - MODEL_BASE_MB, 1)
+    shrink = math.sqrt(min(share, 1.0))
+    return {'LIMIT_MAX_GROUPS': max(1, int(len(groups) * shrink)),
+            'LIMIT_MAX_ROOMS': max(1, int(len(rooms) * shrink))}
+
+def memory_calibration():
+    """
+    Median measured/estimated memory growth over the last runs, 1.0 until
+    there are any. Small models are left out: their fixed overhead, mostly
+    paid once per process, would dominate the ratio.
+    """
+    rows = (SolveRun.query.with_entities(SolveRun.memory_growth_mb, SolveRun.estimated_mb)
+            .filter(SolveRun.memory_growth_mb > 0, SolveRun.estimated_mb >= 2 * MODEL_BASE_MB)
+            .order_by(SolveRun.id.desc()).limit(CALIBRATION_RUNS).all())
+    if not rows:
+        return 1.0
+    # Clamped so one odd run (say, several solves sharing the process) cannot skew it far
+    return min(max(statistics.median(growth / estimated for growth, estimated in rows), 0.5), 4.0)
+
+class PeakRSS:
+    """
+    Samples this process's resident set size while the block runs:
+    `peak_mb` is the highest seen and `growth_mb` how far it rose above the
+    starting value. Solves running concurrently in the process are included.
+    """
+
+    def __init__(self):
+        self.start_mb = self.peak_mb = self.growth_mb = 0.0
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def __enter__(self):
+        self.start_mb = self.peak_mb = current_rss_mb()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._done.set()
+        self._thread.join()
+        self.peak_mb = max(self.peak_mb, current_rss_mb())
+        self.growth_mb = self.peak_mb - self.start_mb
+        return False
+
+    def _sample(self):
+        while not self._done.wait(RSS_SAMPLE_SECONDS):
+            self.peak_mb = max(self.peak_mb, current_rss_mb())
+
+def current_rss_mb():
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+    except (OSError, ValueError, IndexError):
+        pass
+    try:
+        import resource
+    except ImportError:  # Windows
+        return 0.0
+    # No procfs (macOS): the lifetime peak is the best available
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
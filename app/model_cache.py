@@ -0,0 +1,154 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+# Settings that change the shape of the model (variables/constraints) and
+# therefore belong in the cache key, with the defaults the solver assumes.
+# Penalty weights are deliberately absent: they only touch the objective.
+STRUCTURAL_SETTINGS = {
+    'LECTURES_IN_LABS': False,
+    'MAX_CONSECUTIVE_LECTURES': 3,
+    'CONSTRAINT_LAB_CONSECUTIVE_ENABLED': True,
+    'CONSTRAINT_FACULTY_MAX_HOURS_ENABLED': True,
+    'CONSTRAINT_FACULTY_CONSECUTIVE_ENABLED': True,
+    'CONSTRAINT_SUBJECT_DISTRIBUTION_ENABLED': True,
+    # Cliques of subjects sharing enrolled students (see app.enrollment)
+    'SUBJECT_CONFLICTS': [],
+}
+
+def structural_key(subjects, groups, rooms, faculties, time_slots, config):
+    """
+    Hashes everything the compiled model depends on: the entity attributes
+    the solver reads, the time grid and the structural settings.
+    Names are left out, so renaming an entity keeps its cached model.
+    """
+    payload = {
+        'subjects': [(s.id, s.course_id, s.hours_per_week, s.faculty_id, bool(s.is_lab), bool(s.is_shared))
+                     for s in subjects],
+        'groups': [(g.id, g.course_id, g.size) for g in groups],
+        'rooms': [(r.id, r.capacity, r.type) for r in rooms],
+        'faculties': [(f.id, f.max_hours_per_week) for f in faculties],
+        'time_slots': sorted((ts.day, ts.slot_number) for ts in time_slots),
+        'settings': {k: config.get(k, default) for k, default in STRUCTURAL_SETTINGS.items()},
+    }
+    return _digest(payload)
+
+def solution_fingerprint(subjects, groups, rooms, faculties, time_slots, config):
+    """
+    Hashes the full solver input, names and penalty weights included, so two
+    generates with equal fingerprints would produce the same timetable.
+    SOLVER_TIME_LIMIT is excluded: callers compare time budgets themselves.
+    """
+    payload = {
+        'subjects': sorted((s.id, s.name, s.course_id, s.hours_per_week, s.faculty_id, bool(s.is_lab),
+                            bool(s.is_shared)) for s in subjects),
+        'groups': sorted((g.id, g.name, g.course_id, g.size) for g in groups),
+        'rooms': sorted((r.id, r.name, r.capacity, r.type) for r in rooms),
+        'faculties': sorted((f.id, f.name, f.max_hours_per_week) for f in faculties),
+        'time_slots': sorted((ts.day, ts.slot_number) for ts in time_slots),
+        'config': {k: v for k, v in config.items() if k not in ('SOLVER_TIME_LIMIT', 'LAST_SOLVER_SCORE')},
+    }
+    return _digest(payload)
+
+def _digest(payload):
+    raw = json.dumps(payload, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode('utf-8')).hexdigest()
+
+class ModelCache:
+    """
+    In-memory LRU of compiled models, bounded by entry count and by total
+    serialized proto size, with an optional on-disk second tier.
+    """
+
+    def __init__(self, max_entries=16, max_bytes=256 * 1024 * 1024, disk_dir=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            compiled = self._entries.get(key)
+            if compiled is not None:
+                self._entries.move_to_end(key)
+                return compiled
+
+        compiled = self._load_from_disk(key)
+        if compiled is not None:
+            self._remember(key, compiled)
+        return compiled
+
+    def put(self, key, compiled):
+        self._remember(key, compiled)
+        self._save_to_disk(key, compiled)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remember(self, key, compiled):
+        size = len(compiled['proto'])
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._bytes -= len(self._entries.pop(key)['proto'])
+            self._entries[key] = compiled
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self._bytes -= len(evicted['proto'])
+
+    def _disk_paths(self, key):
+        # Raw model proto plus a JSON file with its index and digest; nothing is unpickled
+        return os.path.join(self.disk_dir, f'{key}.pb'), os.path.join(self.disk_dir, f'{key}.json')
+
+    def _load_from_disk(self, key):
+        if not self.disk_dir:
+            return None
+        proto_path, meta_path = self._disk_paths(key)
+        try:
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            with open(proto_path, 'rb') as f:
+                proto = f.read()
+        except (OSError, ValueError):
+            return None
+        if not isinstance(meta, dict) or meta.get('sha256') != hashlib.sha256(proto).hexdigest():
+            return None
+        try:
+            return {'proto': proto, 'index': meta['index'],
+                    'variables': int(meta['variables']), 'constraints': int(meta['constraints'])}
+        except (KeyError, TypeError, ValueError):
+            return None
+
+    def _save_to_disk(self, key, compiled):
+        if not self.disk_dir:
+            return
+        meta = {'sha256': hashlib.sha256(compiled['proto']).hexdigest(), 'index': compiled['index'],
+                'variables': compiled['variables'], 'constraints': compiled['constraints']}
+        proto_path, meta_path = self._disk_paths(key)
+        try:
+            os.makedirs(self.disk_dir, exist_ok=True)
+            # Write then rename so concurrent workers never read a partial file
+            _replace(proto_path, compiled['proto'])
+            _replace(meta_path, json.dumps(meta, separators=(',', ':')).encode('utf-8'))
+        except OSError as e:
+            print(f"Model cache: could not write to disk tier: {e}")
+
+def _replace(path, data):
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+model_cache = ModelCache(
+    max_entries=int(os.environ.get('MODEL_CACHE_MAX_ENTRIES', 16)),
+    max_bytes=int(os.environ.get('MODEL_CACHE_MAX_MB', 256)) * 1024 * 1024,
+    disk_dir=os.environ.get('MODEL_CACHE_DIR') or None
+)
@@ -1,3 +1,4 @@
+from datetime import datetime
 from app import db
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
@@ -7,12 +8,17 @@ class User(UserMixin, db.Model):
     username = db.Column(db.String(64), unique=True, nullable=False)
     password_hash = db.Column(db.String(256))
     is_demo = db.Column(db.Boolean, default=False)
+    # Bumped on every timetable write; manual edits check it to detect concurrent changes
+    timetable_revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # Demo tenants only: when the visitor was last seen, so idle copies can be pruned
+    last_active_at = db.Column(db.DateTime)
 
     def set_password(self, password):
         self.password_hash = generate_password_hash(password)
 
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        # Per-session demo tenants have no password
+        return bool(self.password_hash) and check_password_hash(self.password_hash, password)
 
 class Department(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -21,6 +27,8 @@ class Department(db.Model):
     faculties = db.relationship('Faculty', backref='department', lazy=True)
     courses = db.relationship('Course', backref='department', lazy=True)
 
+    __table_args__ = (db.Index('ix_department_user_name', 'user_id', 'name', 'id'),)
+
 class Faculty(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
@@ -29,6 +37,8 @@ class Faculty(db.Model):
     max_hours_per_week = db.Column(db.Integer, default=20)
     subjects = db.relationship('Subject', backref='faculty', lazy=True)
 
+    __table_args__ = (db.Index('ix_faculty_user_name', 'user_id', 'name', 'id'),)
+
 class Course(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
@@ -37,6 +47,8 @@ class Course(db.Model):
     groups = db.relationship('StudentGroup', backref='course', lazy=True)
     subjects = db.relationship('Subject', backref='course', lazy=True)
 
+    __table_args__ = (db.Index('ix_course_user_name', 'user_id', 'name', 'id'),)
+
 class StudentGroup(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
@@ -44,6 +56,8 @@ class StudentGroup(db.Model):
     course_id = db.Column(db.Integer, db.ForeignKey('course.id'), nullable=False)
     size = db.Column(db.Integer, nullable=False)
 
+    __table_args__ = (db.Index('ix_student_group_user_name', 'user_id', 'name', 'id'),)
+
 class Room(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
@@ -51,6 +65,8 @@ class Room(db.Model):
     capacity = db.Column(db.Integer, nullable=False)
     type = db.Column(db.String(20), nullable=False)
 
+    __table_args__ = (db.Index('ix_room_user_name', 'user_id', 'name', 'id'),)
+
 class Subject(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
@@ -59,6 +75,19 @@ class Subject(db.Model):
     hours_per_week = db.Column(db.Integer, nullable=False)
     faculty_id = db.Column(db.Integer, db.ForeignKey('faculty.id'), nullable=True) 
     is_lab = db.Column(db.Boolean, default=False)
+    # Taught once to all groups of the course together, in a room that seats them all
+    is_shared = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
+
+    __table_args__ = (db.Index('ix_subject_user_name', 'user_id', 'name', 'id'),)
+
+class Enrollment(db.Model):
+    """A student taking a subject (electives); subjects sharing students must not overlap."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    student = db.Column(db.String(64), nullable=False)
+    subject_id = db.Column(db.Integer, db.ForeignKey('subject.id', ondelete='CASCADE'), nullable=False)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'student', 'subject_id', name='_user_student_subject_uc'),)
 
 class TimeSlot(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -76,6 +105,8 @@ class TimetableEntry(db.Model):
     day = db.Column(db.String(20), nullable=False)
     slot = db.Column(db.Integer, nullable=False)
     group_id = db.Column(db.Integer, db.ForeignKey('student_group.id'), nullable=False) 
+    # Pinned entries are kept fixed by later solves
+    pinned = db.Column(db.Boolean, nullable=False, default=False, server_default=db.false())
     
     subject = db.relationship('Subject')
     room = db.relationship('Room')
@@ -89,3 +120,137 @@ class SystemSetting(db.Model):
     description = db.Column(db.String(255))
     
     __table_args__ = (db.UniqueConstraint('user_id', 'key', name='_user_setting_uc'),)
+
+class TimetableVersion(db.Model):
+    """A saved timetable, stored as a delta against the version before it or, every so often, in full."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    number = db.Column(db.Integer, nullable=False) # 1, 2, ... per tenant
+    base = db.Column(db.Integer) # number of the version the delta applies to, NULL for a full copy
+    source = db.Column(db.String(20), nullable=False) # generate, batch, scenario, rollback, edit
+    entry_count = db.Column(db.Integer, nullable=False)
+    obj_value = db.Column(db.Float)
+    # JSON of flat integer lists, see app.history
+    payload = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'number', name='_user_version_uc'),)
+
+class SolutionMemo(db.Model):
+    """Last solver result per tenant, keyed by a fingerprint of its inputs."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.Integer, nullable=False)
+    time_limit = db.Column(db.Float, nullable=False)
+    obj_value = db.Column(db.Float)
+    # JSON list of [subject_id, room_id, group_id, day, slot]
+    entries = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (db.UniqueConstraint('user_id', 'fingerprint', name='_user_fingerprint_uc'),)
+
+class TimetableDraft(db.Model):
+    """A what-if scenario result kept aside until it is promoted to TimetableEntry."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    overrides = db.Column(db.Text, nullable=False) # JSON of the settings varied
+    status = db.Column(db.Integer, nullable=False)
+    obj_value = db.Column(db.Float)
+    penalties = db.Column(db.Text) # JSON of weighted penalty per family
+    solve_time = db.Column(db.Float)
+    # JSON list of [subject_id, room_id, group_id, day, slot]
+    entries = db.Column(db.Text, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class SolveJob(db.Model):
+    """A queued timetable generation, claimed and run by a standalone solver worker."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True) # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=3)
+    run_after = db.Column(db.DateTime) # retry backoff
+    worker_id = db.Column(db.String(100))
+    heartbeat_at = db.Column(db.DateTime)
+    lease_expires_at = db.Column(db.DateTime)
+    result = db.Column(db.Text) # JSON response payload
+    result_code = db.Column(db.Integer)
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+class SolveRun(db.Model):
+    """One solver run and how its time budget was spent, kept to tune the budget settings."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True, index=True)
+    fingerprint = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.Integer, nullable=False)
+    obj_value = db.Column(db.Float)
+    best_bound = db.Column(db.Float)
+    variables = db.Column(db.Integer)
+    constraints = db.Column(db.Integer)
+    time_limit = db.Column(db.Float) # limit the run ended under, after any extensions
+    solve_time = db.Column(db.Float)
+    stop_reason = db.Column(db.String(20)) # optimal, gap, stagnation, time_limit, infeasible
+    budget = db.Column(db.Text) # JSON of the budget policy and its outcome
+    estimated_mb = db.Column(db.Float) # memory the footprint estimator predicted
+    peak_rss_mb = db.Column(db.Float)
+    memory_growth_mb = db.Column(db.Float) # peak RSS above the process's RSS when the run started
+    dropped_families = db.Column(db.String(200)) # soft-constraint families a lean solve switched off
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class ExportJob(db.Model):
+    """A zip export written to disk in the background for download later."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    by = db.Column(db.String(20), nullable=False) # 'group' or 'faculty'
+    format = db.Column(db.String(10), nullable=False) # 'csv' or 'ics'
+    status = db.Column(db.String(20), nullable=False, default='queued') # queued/running/done/failed/expired
+    path = db.Column(db.String(255))
+    error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+class Term(db.Model):
+    """A teaching term: the weekly template timetable repeated for `weeks` weeks, changed by its exceptions."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    name = db.Column(db.String(100), nullable=False)
+    start_date = db.Column(db.Date, nullable=False) # any day of week 1
+    weeks = db.Column(db.Integer, nullable=False)
+    # JSON of the template week's assignments, packed as in app.history
+    template = db.Column(db.Text, nullable=False)
+    template_entries = db.Column(db.Integer, nullable=False)
+    planned_at = db.Column(db.DateTime)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class TermException(db.Model):
+    """A change to some weeks of a term: no classes, a day off, a closed room or a subject not held."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    term_id = db.Column(db.Integer, db.ForeignKey('term.id'), nullable=False, index=True)
+    kind = db.Column(db.String(20), nullable=False) # no_classes, day_off, room_closed, subject_off
+    weeks = db.Column(db.String(100), nullable=False) # e.g. '7', '3-4,9', 'even'
+    day = db.Column(db.String(20)) # day_off, or room_closed for one day only
+    # Plain ids: the entities may be deleted later, planning skips what no longer exists
+    room_id = db.Column(db.Integer)
+    subject_id = db.Column(db.Integer)
+    note = db.Column(db.String(100)) # e.g. 'Exam week'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+class TermOverride(db.Model):
+    """The planned changes to a term's template for all the weeks that share one set of exceptions."""
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=True)
+    term_id = db.Column(db.Integer, db.ForeignKey('term.id'), nullable=False, index=True)
+    weeks = db.Column(db.Text, nullable=False) # JSON list of week numbers
+    exceptions = db.Column(db.Text, nullable=False) # JSON list of the TermException ids it was planned for
+    # JSON delta against the template as in app.history, plus 'unplaced' (or just {"cancelled": true})
+    payload = db.Column(db.Text, nullable=False)
+    moved = db.Column(db.Integer, nullable=False, default=0)
+    unplaced = db.Column(db.Integer, nullable=False, default=0)
+    solve_time = db.Column(db.Float)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -0,0 +1,179 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from ortools.sat.python import cp_model
+
+from app.solver import (PENALTY_WEIGHTS, apply_hint, fix_variables, instantiate_model, new_solver,
+                        search_workers, set_objective, solver_outcome)
+
+# Penalty families the "hard_only" strategy ignores; only the faculty
+# max-hours excess stays in its objective.
+SOFT_PENALTIES = [k for k in PENALTY_WEIGHTS if k != 'MAX_HOURS_PENALTY']
+
+def portfolio_strategies(size, has_hint):
+    """
+    The first `size` strategies to race: the default search, a restricted
+    model with the soft penalties switched off, a warm start from the
+    previous timetable (when there is one), then reseeded searches.
+    """
+    strategies = [{'name': 'default'}, {'name': 'hard_only', 'hard_only': True}]
+    if has_hint:
+        strategies.append({'name': 'warm_start', 'warm_start': True})
+    seed = 1
+    while len(strategies) < size:
+        strategies.append({'name': f'seed_{seed}', 'params': {'random_seed': seed, 'randomize_search': True}})
+        seed += 1
+    return strategies[:size]
+
+def race_portfolio(compiled, config, size, hint=None, stats=None, pinned=None):
+    """
+    Runs several strategies on the compiled model concurrently within one
+    SOLVER_TIME_LIMIT, each with the `pinned` variables fixed to 1. All of them stop as soon as one proves optimality
+    (or infeasibility) or any reaches SOLVER_TARGET_OBJECTIVE. A full-objective
+    strategy that starts searching once another has found a timetable only
+    looks for ones at least as good; strategies already searching keep
+    their own incumbent, as CP-SAT cannot tighten a running search.
+    Returns the best outcome in the same shape as solver_outcome().
+    """
+    strategies = portfolio_strategies(size, bool(hint))
+    target = config.get('SOLVER_TARGET_OBJECTIVE', -1)
+    race = _Race(target if target is not None and target >= 0 else None)
+    deadline = time.monotonic() + float(config.get('SOLVER_TIME_LIMIT', 30))
+    # Share the cores instead of every strategy starting one search worker per core
+    num_workers = max(1, search_workers(config) // len(strategies))
+
+    with ThreadPoolExecutor(max_workers=len(strategies)) as pool:
+        futures = [pool.submit(_run_strategy, strategy, compiled, config, hint, pinned or [],
+                               num_workers, race, deadline)
+                   for strategy in strategies]
+        outcomes = [f.result() for f in futures]
+
+    finished = [(s, o) for s, o in zip(strategies, outcomes) if o is not None]
+    solved = [(s, o) for s, o in finished if o['values'] is not None]
+
+    if solved:
+        winner, best = min(solved, key=lambda so: so[1]['obj_value'])
+        best = dict(best)
+        # hard_only's optimum is not the full model's; only full-objective runs prove optimality
+        proven = any(o['status'] == cp_model.OPTIMAL and not s.get('hard_only') for s, o in finished)
+        best['status'] = cp_model.OPTIMAL if proven else cp_model.FEASIBLE
+    else:
+        winner = None
+        statuses = [o['status'] for _, o in finished]
+        for status in (cp_model.INFEASIBLE, cp_model.MODEL_INVALID):
+            if status in statuses:
+                break
+        else:
+            status = cp_model.UNKNOWN
+        best = {'status': status, 'values': None, 'obj_value': None, 'best_bound': None,
+                'wall_time': max((o['wall_time'] for _, o in finished), default=0.0)}
+
+    if stats is not None:
+        stats['portfolio'] = [
+            {'strategy': s['name'], 'status': int(o['status']), 'objective': o['obj_value'],
+             'bound': o.get('bound'), 'wall_time': o['wall_time']}
+            for s, o in finished
+        ]
+        stats['portfolio_winner'] = winner['name'] if winner else None
+    return best
+
+class _Race:
+    """Best objective found by any racing strategy so far, and their common stop switch."""
+
+    def __init__(self, target):
+        self.target = target
+        self.best = None
+        self.stopped = threading.Event()
+        self._solvers = []
+        self._lock = threading.Lock()
+
+    def register(self, solver):
+        """Tracks a solver so stop() can interrupt it. False if the race is already over."""
+        with self._lock:
+            if self.stopped.is_set():
+                return False
+            self._solvers.append(solver)
+            return True
+
+    def offer(self, objective):
+        with self._lock:
+            if self.best is None or objective < self.best:
+                self.best = objective
+        if self.target is not None and objective <= self.target:
+            self.stop()
+
+    def stop(self):
+        with self._lock:
+            self.stopped.set()
+            solvers = list(self._solvers)
+        for solver in solvers:
+            solver.StopSearch()
+
+class _IncumbentCallback(cp_model.CpSolverSolutionCallback):
+    def __init__(self, race):
+        cp_model.CpSolverSolutionCallback.__init__(self)
+        self._race = race
+
+    def on_solution_callback(self):
+        self._race.offer(self.ObjectiveValue())
+
+def _run_strategy(strategy, compiled, config, hint, pinned, num_workers, race, deadline):
+    model = instantiate_model(compiled)
+    fix_variables(model, pinned)
+    if strategy.get('hard_only'):
+        set_objective(model, compiled['index'], {**config, **{k: 0 for k in SOFT_PENALTIES}})
+    else:
+        set_objective(model, compiled['index'], config)
+    if strategy.get('warm_start'):
+        apply_hint(model, hint)
+    bound = None if strategy.get('hard_only') else race.best
+    if bound is not None:
+        # Integer penalties, so exactly the timetables scoring <= bound; the incumbent is one,
+        # and an optimum found under it is optimal for the whole model
+        model.Proto().objective.domain[:] = [0, int(bound)]
+
+    solver = new_solver(config, num_workers)
+    solver.parameters.max_time_in_seconds = max(0.0, deadline - time.monotonic())
+    for name, value in strategy.get('params', {}).items():
+        setattr(solver.parameters, name, value)
+    if not race.register(solver):
+        return None
+
+    if strategy.get('hard_only'):
+        outcome = solver_outcome(solver, solver.Solve(model))
+        if outcome['values'] is None or race.stopped.is_set():
+            return outcome
+        return _rescore(compiled, config, outcome, race, deadline)
+
+    outcome = solver_outcome(solver, solver.Solve(model, _IncumbentCallback(race)))
+    outcome['bound'] = bound
+    if outcome['status'] in (cp_model.OPTIMAL, cp_model.INFEASIBLE):
+        race.stop()
+    return outcome
+
+def _rescore(compiled, config, outcome, race, deadline):
+    """
+    Prices a hard_only solution under the full objective by re-solving the
+    full model with every assignment variable fixed to that solution.
+    """
+    values = outcome['values']
+    fixed = [(i, values[i]) for event in compiled['index']['events'] if event['x_start'] is not None
+             for i in range(event['x_start'], event['x_start'] + _event_var_count(compiled['index'], event))]
+    model = instantiate_model(compiled)
+    set_objective(model, compiled['index'], config)
+    apply_hint(model, fixed)
+
+    solver = new_solver(config, 1)
+    solver.parameters.max_time_in_seconds = max(0.0, deadline - time.monotonic())
+    solver.parameters.fix_variables_to_their_hinted_value = True
+    rescored = solver_outcome(solver, solver.Solve(model))
+    if rescored['values'] is None:
+        return outcome
+    race.offer(rescored['obj_value'])
+    rescored['status'] = cp_model.FEASIBLE
+    rescored['wall_time'] += outcome['wall_time']
+    return rescored
+
+def _event_var_count(index, event):
+    return len(index['days']) * len(index['slots']) * len(event['valid_rooms'])
@@ -0,0 +1,223 @@
+import itertools
+import os
+import sys
+import threading
+import time
+from collections import Counter, deque
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request, template_rendered, before_render_template
+from flask_login import current_user
+from sqlalchemy import event
+
+# Opt-in request profiling (PROFILING_ENABLED) for the main and auth
+# blueprints. Each request records its wall time, SQL statements and SQL time,
+# template render time and, for solves, the time spent in each solver phase.
+# The totals go out in a Server-Timing header (shown by browser dev tools) and
+# the last PROFILING_BUFFER_SIZE profiles of this process are kept in memory
+# for /api/admin/profiles. A profiling admin can add ?profile=1 (or an
+# X-Profile: 1 header) to any request to also get a sampling profile of where
+# its Python time went. When disabled nothing is registered at all.
+
+PROFILED_BLUEPRINTS = ('main', 'auth')
+SLOW_STATEMENTS_KEPT = 5
+SAMPLED_STACKS_KEPT = 40
+
+_ids = itertools.count(1)
+_lock = threading.Lock()
+
+def init_profiling(app, db):
+    """Hooks the profiler into the app when PROFILING_ENABLED is set (needs an app context)."""
+    if not app.config.get('PROFILING_ENABLED'):
+        return
+    app.extensions['request_profiles'] = deque(maxlen=app.config['PROFILING_BUFFER_SIZE'])
+
+    for engine in db.engines.values():
+        event.listen(engine, 'before_cursor_execute', _before_statement)
+        event.listen(engine, 'after_cursor_execute', _after_statement)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
+
+    @app.before_request
+    def _start_profile():
+        if request.blueprint not in PROFILED_BLUEPRINTS:
+            return
+        g.profile = {
+            'started': time.perf_counter(),
+            'sql_count': 0,
+            'sql_time': 0.0,
+            'slow_sql': [],
+            'render_time': 0.0,
+            'phases': {},
+        }
+        if request.args.get('profile') == '1' or request.headers.get('X-Profile') == '1':
+            # Resolving current_user loads the user, so only look when asked to sample
+            if is_profiling_admin(app):
+                g.profile['sampler'] = StackSampler(app.config['PROFILING_SAMPLE_INTERVAL_MS'] / 1000)
+                g.profile['sampler'].start()
+
+    @app.after_request
+    def _finish_profile(response):
+        profile = g.pop('profile', None)
+        if profile is None:
+            return response
+        wall_time = time.perf_counter() - profile['started']
+        sampler = profile.get('sampler')
+        if sampler:
+            sampler.stop()
+
+        record = {
+            'id': next(_ids),
+            'pid': os.getpid(),
+            'at': time.time(),
+            'method': request.method,
+            'path': request.path,
+            'endpoint': request.endpoint,
+            'status': response.status_code,
+            # Only if the view loaded the user already; looking it up here would add a query
+            'user_id': getattr(g.get('_login_user'), 'id', None),
+            'wall_ms': _ms(wall_time),
+            'sql_count': profile['sql_count'],
+            'sql_ms': _ms(profile['sql_time']),
+            'render_ms': _ms(profile['render_time']),
+            'phases_ms': {name: _ms(seconds) for name, seconds in profile['phases'].items()},
+            'slow_sql': [{'ms': _ms(seconds), 'statement': statement}
+                         for seconds, statement in sorted(profile['slow_sql'], reverse=True)],
+        }
+        # Whatever is left once SQL and templates are accounted for is Python in the view
+        record['python_ms'] = round(max(record['wall_ms'] - record['sql_ms'] - record['render_ms'], 0.0), 2)
+        if sampler:
+            record['samples'] = sampler.report()
+        with _lock:
+            app.extensions['request_profiles'].append(record)
+
+        timings = [f'total;dur={record["wall_ms"]}',
+                   f'sql;dur={record["sql_ms"]};desc="{record["sql_count"]} queries"',
+                   f'render;dur={record["render_ms"]}']
+        timings += [f'{name};dur={ms}' for name, ms in record['phases_ms'].items()]
+        response.headers['Server-Timing'] = ', '.join(timings)
+        response.headers['X-Profile-Id'] = str(record['id'])
+        return response
+
+def is_profiling_admin(app):
+    return current_user.is_authenticated and current_user.username in app.config['PROFILING_ADMINS']
+
+def recent_profiles(app, limit=50, endpoint=None, min_ms=0, slowest=False):
+    """This process's buffered profiles, newest (or slowest) first, without their samples."""
+    with _lock:
+        profiles = list(app.extensions.get('request_profiles', ()))
+    profiles = [p for p in reversed(profiles)
+                if (endpoint is None or p['endpoint'] == endpoint) and p['wall_ms'] >= min_ms]
+    if slowest:
+        profiles.sort(key=lambda p: -p['wall_ms'])
+    return [{k: v for k, v in p.items() if k != 'samples'} | {'sampled': 'samples' in p}
+            for p in profiles[:limit]]
+
+def find_profile(app, profile_id):
+    with _lock:
+        return next((p for p in app.extensions.get('request_profiles', ()) if p['id'] == profile_id), None)
+
+@contextmanager
+def phase(name):
+    """Times the block as solver phase `name` of the request being profiled; free otherwise."""
+    profile = g.get('profile') if has_request_context() else None
+    if profile is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        record_phase(name, time.perf_counter() - started)
+
+def record_phase(name, seconds):
+    """Adds `seconds` measured elsewhere (e.g. solver stats) to phase `name`."""
+    profile = g.get('profile') if has_request_context() else None
+    if profile is not None and seconds is not None:
+        profile['phases'][name] = profile['phases'].get(name, 0.0) + seconds
+
+class StackSampler:
+    """
+    Samples the calling thread's Python stack every `interval` seconds from a
+    background thread. Time inside C code (the CP-SAT search, the database
+    driver) shows up on the Python frame that called it.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.samples = 0
+        self.stacks = Counter()
+        self._target = threading.get_ident()
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._done.set()
+        self._thread.join()
+
+    def report(self):
+        """Sample counts per function (inclusive and self) and the most common stacks, root first."""
+        inclusive, own = Counter(), Counter()
+        for stack, count in self.stacks.items():
+            for frame in set(stack):
+                inclusive[frame] += count
+            own[stack[-1]] += count
+        return {
+            'interval_ms': _ms(self.interval),
+            'count': self.samples,
+            'functions': [{'function': frame, 'samples': count, 'self': own[frame]}
+                          for frame, count in inclusive.most_common(SAMPLED_STACKS_KEPT)],
+            'stacks': [{'stack': ';'.join(stack), 'samples': count}
+                       for stack, count in self.stacks.most_common(SAMPLED_STACKS_KEPT)],
+        }
+
+    def _sample(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self._target)
+            stack = []
+            while frame is not None:
+                stack.append(f'{_short_path(frame.f_code.co_filename)}:{frame.f_code.co_name}')
+                frame = frame.f_back
+            if stack:
+                self.samples += 1
+                self.stacks[tuple(reversed(stack))] += 1
+
+def _before_statement(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and has_request_context() and 'profile' in g:
+        context._profile_started = time.perf_counter()
+
+def _after_statement(conn, cursor, statement, parameters, context, executemany):
+    started = getattr(context, '_profile_started', None)
+    if started is None or not has_request_context() or 'profile' not in g:
+        return
+    seconds = time.perf_counter() - started
+    profile = g.profile
+    profile['sql_count'] += 1
+    profile['sql_time'] += seconds
+    slow = profile['slow_sql']
+    if len(slow) < SLOW_STATEMENTS_KEPT or seconds > min(slow)[0]:
+        if len(slow) >= SLOW_STATEMENTS_KEPT:
+            slow.remove(min(slow))
+        slow.append((seconds, ' '.join(statement.split())[:300]))
+
+def _before_render(sender, template, context, **extra):
+    if 'profile' in g:
+        g.profile.setdefault('render_started', []).append(time.perf_counter())
+
+def _after_render(sender, template, context, **extra):
+    started = g.profile.get('render_started') if 'profile' in g else None
+    if started:
+        g.profile['render_time'] += time.perf_counter() - started.pop()
+
+def _short_path(filename):
+    for marker in ('site-packages' + os.sep, os.sep + 'app' + os.sep):
+        head, found, tail = filename.rpartition(marker)
+        if found:
+            return tail if marker.startswith('site') else 'app/' + tail
+    return os.path.basename(filename)
+
+def _ms(seconds):
+    return round(seconds * 1000, 2)
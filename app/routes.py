@@ -1,15 +1,70 @@
-from flask import Blueprint, request, jsonify, render_template, redirect, url_for, flash
+from flask import (Blueprint, request, jsonify, render_template, redirect, url_for, flash, current_app,
+                   Response, stream_with_context, send_file)
+import calendar
 import csv
 import io
+import json
+import os
+from datetime import datetime, timedelta
+from sqlalchemy import func, insert
 from app import db
-from app.models import (Department, Faculty, Course, StudentGroup, 
-                        Room, Subject, TimetableEntry, SystemSetting, TimeSlot)
-from app.solver import solve_timetable, analyze_constraints
-from ortools.sat.python import cp_model
+from app.models import (User, Department, Faculty, Course, StudentGroup, 
+                        Room, Subject, Enrollment, TimetableEntry, SystemSetting, TimeSlot, TimetableDraft,
+                        SolveJob, SolveRun, ExportJob, TimetableVersion, Term, TermException, TermOverride)
+from app.model_cache import solution_fingerprint
+from app.scheduler import solve_scheduler, SolveQuotaExceeded
+from app.db_pool import read_only, pool_metrics
+from app.profiling import phase, is_profiling_admin, recent_profiles, find_profile
+from app.editing import StaleTimetable, bump_revision, move_entry, swap_entries
+from app.enrollment import conflict_edges_query, conflict_cliques
+from app.history import load_version, diff_assignments, rollback_timetable
+from app.listing import LIST_SPECS, list_page, tenant_count
+from app.export import (EXPORT_FORMATS, EXPORT_GROUPINGS, export_rows, csv_chunks, ics_chunks,
+                        zip_chunks, start_export_job, expire_export_jobs)
 from flask_login import login_required, current_user
 
 main = Blueprint('main', __name__)
 
+# Seed data is built once at import; seeding a tenant costs one lookup and
+# writes only what it is missing.
+DEFAULT_SETTINGS = (
+    ('CONSECUTIVE_LABS_WEIGHT', '100', 'Penalty for fragmented lab slots'),
+    ('MAX_HOURS_PENALTY', '500', 'Penalty for exceeding faculty max hours'),
+    ('CONSECUTIVE_PENALTY', '10', 'Penalty for too many consecutive lectures'),
+    ('SAME_DAY_MULTI_PENALTY', '10', 'Penalty for multiple lectures of same subject on same day'),
+    ('LECTURES_IN_LABS', 'False', 'Allow lectures to be scheduled in lab rooms'),
+    ('MAX_CONSECUTIVE_LECTURES', '3', 'Max lectures a faculty can teach in a row'),
+    ('SOLVER_TIME_LIMIT', '30', 'Max seconds the solver will run (Max 60 recommended)'),
+    ('SOLVER_PORTFOLIO_SIZE', '0', 'Race this many solver strategies in parallel (0 or 1 for a single solve)'),
+    ('SOLVER_TARGET_OBJECTIVE', '-1', 'Stop solving once a timetable scores at or below this (-1 to disable)'),
+    ('SOLVER_STAGED', 'False', 'Solve in stages: faculty hour overruns first, then the soft penalties'),
+    ('SOLVER_STAGE_TIME_SHARE', '0.3', 'Share of the remaining time limit each non-final stage may use'),
+    ('SOLVER_ADAPTIVE_BUDGET', 'False', 'Size the time limit to the model and stop early once it stops improving'),
+    ('SOLVER_MIN_TIME_LIMIT', '5', 'Shortest adaptive time limit in seconds'),
+    ('SOLVER_BUDGET_UNITS_PER_SECOND', '5000', 'Model variables plus constraints per second of adaptive time limit'),
+    ('SOLVER_STAGNATION_SECONDS', '10', 'Stop once the best timetable has not improved for this long (0 to disable)'),
+    ('SOLVER_GAP_LIMIT', '0', 'Stop once within this relative gap of the best bound, e.g. 0.05 (0 to disable)'),
+    ('SOLVER_MAX_TIME_LIMIT', '60', 'Keep extending an adaptive run that is still improving up to this many seconds'),
+    ('SOLVER_MEMORY_BUDGET_MB', '0', 'Memory a solve may use in MB, estimated before building the model (0 for no limit)'),
+    ('SOLVER_MEMORY_ACTION', 'lean', 'Over the memory budget: lean (drop soft-constraint families, then reject) or reject'),
+    ('TERM_REPAIR_TIME_LIMIT', '10', 'Max seconds to re-place the classes of each kind of exception week in a term'),
+    ('LIMIT_MAX_FACULTIES', '0', 'Limit number of faculties for routine (0 for all)'),
+    ('LIMIT_MAX_GROUPS', '0', 'Limit number of student groups for routine (0 for all)'),
+    ('LIMIT_MAX_SUBJECTS', '0', 'Limit number of subjects for routine (0 for all)'),
+    ('LIMIT_MAX_ROOMS', '0', 'Limit number of rooms for routine (0 for all)'),
+    ('CONSTRAINT_LAB_CONSECUTIVE_ENABLED', 'True', 'Enable consecutive lab slot constraints'),
+    ('CONSTRAINT_FACULTY_MAX_HOURS_ENABLED', 'True', 'Enforce faculty weekly hour limits'),
+    ('CONSTRAINT_FACULTY_CONSECUTIVE_ENABLED', 'True', 'Enforce limits on consecutive lectures'),
+    ('CONSTRAINT_SUBJECT_DISTRIBUTION_ENABLED', 'True', 'Distribute subjects across different days'),
+    ('LAST_SOLVER_SCORE', '0', 'Last optimization score')
+)
+DEFAULT_TIME_SLOTS = tuple({'day': day, 'slot_number': slot}
+                           for day in ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday')
+                           for slot in range(1, 9))
+
+GRID_PAGE_SIZE = 20
+GRID_MAX_PAGE_SIZE = 100
+
 @main.route('/')
 def index():
     if not current_user.is_authenticated:
@@ -17,15 +72,13 @@ def index():
         
     _seed_default_settings()
     _seed_time_slots()
-    if current_user.username == 'demo_institution':
-        _seed_demo_data()
 
     # Fetch stats for the logged-in user
     stats = { 
-        'faculty': Faculty.query.filter_by(user_id=current_user.id).count(),
-        'courses': Course.query.filter_by(user_id=current_user.id).count(),
-        'rooms': Room.query.filter_by(user_id=current_user.id).count(),
-        'subjects': Subject.query.filter_by(user_id=current_user.id).count()
+        'faculty': tenant_count(current_user.id, current_user.timetable_revision, 'faculty'),
+        'courses': tenant_count(current_user.id, current_user.timetable_revision, 'course'),
+        'rooms': tenant_count(current_user.id, current_user.timetable_revision, 'room'),
+        'subjects': tenant_count(current_user.id, current_user.timetable_revision, 'subject')
     }
     settings = SystemSetting.query.filter_by(user_id=current_user.id).all()
     return render_template('index.html', stats=stats, settings=settings)
@@ -35,23 +88,40 @@ def index():
 @login_required
 def manage():
     _seed_default_settings()
+    # Tables are paged in from /api/<entity>/list; only the form dropdowns are rendered here
     data = {
-        'departments': Department.query.filter_by(user_id=current_user.id).all(),
-        'courses': Course.query.filter_by(user_id=current_user.id).all(),
-        'groups': StudentGroup.query.filter_by(user_id=current_user.id).all(),
-        'faculty': Faculty.query.filter_by(user_id=current_user.id).all(),
-        'rooms': Room.query.filter_by(user_id=current_user.id).all(),
-        'subjects': Subject.query.filter_by(user_id=current_user.id).all()
+        'departments': db.session.query(Department.id, Department.name)
+                       .filter_by(user_id=current_user.id).order_by(Department.name).all(),
+        'courses': db.session.query(Course.id, Course.name)
+                   .filter_by(user_id=current_user.id).order_by(Course.name).all(),
+        'faculty': db.session.query(Faculty.id, Faculty.name)
+                   .filter_by(user_id=current_user.id).order_by(Faculty.name).all()
     }
     settings = SystemSetting.query.filter_by(user_id=current_user.id).all()
     return render_template('manage.html', data=data, settings=settings)
 
+@main.route('/api/<entity>/list', methods=['GET'])
+@login_required
+def list_entities(entity):
+    """
+    Paged rows for the manage page: ?q=<name prefix>&sort=<field>&order=asc|desc
+    &limit=<n>&cursor=<next_cursor>, plus per-entity filters (e.g. course_id).
+    """
+    if entity not in LIST_SPECS:
+        return jsonify({"status": "error", "message": f"Unknown entity: {entity}"}), 404
+    try:
+        page = list_page(entity, current_user.id, current_user.timetable_revision, request.args)
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    return jsonify({"status": "success", **page})
+
 @main.route('/api/department/add', methods=['POST'])
 @login_required
 def add_department():
     name = request.form.get('name')
     d = Department(name=name, user_id=current_user.id)
     db.session.add(d)
+    bump_revision(current_user.id)
     db.session.commit()
     return jsonify({"status": "success", "item": {"id": d.id, "name": d.name}})
 
@@ -63,6 +133,7 @@ def delete_department(id):
     if Faculty.query.filter_by(department_id=id).first() or Course.query.filter_by(department_id=id).first():
         return jsonify({"status": "error", "message": "Department has associated faculty or courses"}), 400
     db.session.delete(d)
+    bump_revision(current_user.id)
     db.session.commit()
     return jsonify({"status": "success"})
 
@@ -73,6 +144,7 @@ def add_course():
     dept_id = request.form.get('department_id')
     c = Course(name=name, department_id=dept_id, user_id=current_user.id)
     db.session.add(c)
+    bump_revision(current_user.id)
     db.session.commit()
     return jsonify({"status": "success", "item": {"id": c.id, "name": c.name}})
 
@@ -83,6 +155,7 @@ def delete_course(id):
     if StudentGroup.query.filter_by(course_id=id).first() or Subject.query.filter_by(course_id=id).first():
         return jsonify({"status": "error", "message": "Course has associated groups or subjects"}), 400
     db.session.delete(c)
+    bump_revision(current_user.id)
     db.session.commit()
     return jsonify({"status": "success"})
 
@@ -94,6 +167,7 @@ def add_group():
     size = request.form.get('size')
     g = StudentGroup(name=name, course_id=course_id, size=size, user_id=current_user.id)
     db.session.add(g)
+    bump_revision(current_user.id)
     db.session.commit()
     return jsonify({"status": "success", "item": {"id": g.id, "name": g.name}})
 
@@ -102,158 +176,142 @@ def add_group():
 def delete_group(id):
     g = StudentGroup.query.filter_by(id=id, user_id=current_user.id).first_or_404()
     db.session.delete(g)
+    bump_revision(current_user.id)
     db.session.commit()
     return jsonify({"status": "success"})
 
 @main.route('/timetable')
 @login_required
+@read_only
 def view_timetable():
-    # Filtering
+    # The grids themselves are fetched page by page from /api/timetable/grid
     filter_type = request.args.get('type')
     filter_value = request.args.get('value')
-    
-    # Base queries filtered by user
-    all_groups = StudentGroup.query.filter_by(user_id=current_user.id).all()
-    all_days = [d[0] for d in db.session.query(TimeSlot.day).filter_by(user_id=current_user.id).distinct().all()]
-    if not all_days:
-        all_days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
-    
-    all_slots = [s[0] for s in db.session.query(TimeSlot.slot_number).filter_by(user_id=current_user.id).distinct().order_by(TimeSlot.slot_number).all()]
-    if not all_slots:
-        all_slots = list(range(1, 9))
 
-    query = TimetableEntry.query.filter_by(user_id=current_user.id)
-    
-    if filter_type and filter_value:
-        if filter_type == 'faculty':
-            query = query.join(Subject).filter(Subject.faculty_id == filter_value)
-        elif filter_type == 'room':
-            query = query.filter(TimetableEntry.room_id == filter_value)
-        elif filter_type == 'group':
-            query = query.filter(TimetableEntry.group_id == filter_value)
-            
-    entries = query.all()
-    
-    # Structure: group_name -> day -> slot -> entry
-    grouped_schedule = {}
-    
-    # Initialize structure
-    active_groups = all_groups
-    if filter_type == 'group' and filter_value:
-        active_groups = [g for g in all_groups if g.id == int(filter_value)]
-
-    for group in active_groups:
-        grouped_schedule[group.name] = {}
-        for day in all_days:
-            grouped_schedule[group.name][day] = {}
-            for slot in all_slots:
-                grouped_schedule[group.name][day][slot] = None
-
-    # Fill data
-    for e in entries:
-        g_name = e.group.name
-        if g_name in grouped_schedule:
-            if e.day in grouped_schedule[g_name]:
-                grouped_schedule[g_name][e.day][e.slot] = {
-                    "subject": e.subject.name,
-                    "faculty": e.subject.faculty.name if e.subject.faculty else "N/A",
-                    "room": e.room.name
-                }
-    
     # Fetch solver score
     score_setting = SystemSetting.query.filter_by(user_id=current_user.id, key='LAST_SOLVER_SCORE').first()
     score = float(score_setting.value) if score_setting else 0.0
 
     # Pass filter options
     filter_options = {
-        'faculty': Faculty.query.filter_by(user_id=current_user.id).all(),
-        'groups': all_groups,
-        'rooms': Room.query.filter_by(user_id=current_user.id).all()
+        'faculty': [{"id": f.id, "name": f.name} for f in
+                    db.session.query(Faculty.id, Faculty.name).filter_by(user_id=current_user.id).order_by(Faculty.name)],
+        'group': [{"id": g.id, "name": g.name} for g in
+                  db.session.query(StudentGroup.id, StudentGroup.name).filter_by(user_id=current_user.id).order_by(StudentGroup.name)],
+        'room': [{"id": r.id, "name": r.name} for r in
+                 db.session.query(Room.id, Room.name).filter_by(user_id=current_user.id).order_by(Room.name)]
     }
-        
-    return render_template('timetable.html', 
-                          grouped_schedule=grouped_schedule, 
-                          days=all_days, 
-                          slots=all_slots,
-                          filter_options=filter_options, 
+
+    return render_template('timetable.html',
+                          filter_options=filter_options,
                           score=score,
                           current_filter={'type': filter_type, 'value': int(filter_value) if filter_value else None})
 
+@main.route('/api/timetable/grid', methods=['GET'])
+@login_required
+@read_only
+def timetable_grid():
+    """
+    One page of group grids, keyset-paginated by group id: ?after=<last id>&limit=<n>,
+    optionally filtered with ?type=group|faculty|room&value=<id>.
+    Each grid is a slots x days matrix of codes: 0 is a free period, n is cells[n - 1],
+    a page-local [subject, faculty, room] triple of indexes into the `subjects`,
+    `faculty` and `rooms` name lists.
+    """
+    after = request.args.get('after', type=int)
+    limit = min(max(request.args.get('limit', GRID_PAGE_SIZE, type=int), 1), GRID_MAX_PAGE_SIZE)
+    filter_type = request.args.get('type')
+    filter_value = request.args.get('value', type=int)
+
+    days = [d for (d,) in db.session.query(TimeSlot.day).filter_by(user_id=current_user.id)
+            .group_by(TimeSlot.day).order_by(func.min(TimeSlot.id))]
+    if not days:
+        days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday', 'Saturday']
+    slots = [s for (s,) in db.session.query(TimeSlot.slot_number).filter_by(user_id=current_user.id)
+             .distinct().order_by(TimeSlot.slot_number)]
+    if not slots:
+        slots = list(range(1, 9))
+
+    groups_query = db.session.query(StudentGroup.id, StudentGroup.name).filter(StudentGroup.user_id == current_user.id)
+    if filter_type == 'group' and filter_value:
+        groups_query = groups_query.filter(StudentGroup.id == filter_value)
+    if after is not None:
+        groups_query = groups_query.filter(StudentGroup.id > after)
+    groups = groups_query.order_by(StudentGroup.id).limit(limit + 1).all()
+    has_more = len(groups) > limit
+    groups = groups[:limit]
+
+    entries_query = (db.session.query(TimetableEntry.group_id, TimetableEntry.day, TimetableEntry.slot,
+                                      Subject.name, Faculty.name, Room.name)
+                     .join(Subject, TimetableEntry.subject_id == Subject.id)
+                     .outerjoin(Faculty, Subject.faculty_id == Faculty.id)
+                     .join(Room, TimetableEntry.room_id == Room.id)
+                     .filter(TimetableEntry.user_id == current_user.id,
+                             TimetableEntry.group_id.in_([g.id for g in groups])))
+    if filter_type == 'faculty' and filter_value:
+        entries_query = entries_query.filter(Subject.faculty_id == filter_value)
+    elif filter_type == 'room' and filter_value:
+        entries_query = entries_query.filter(TimetableEntry.room_id == filter_value)
+
+    # Page-local lookup tables; codes are list positions
+    lookups = {'subjects': {}, 'faculty': {}, 'rooms': {}}
+    cells = {}
+    day_index = {d: i for i, d in enumerate(days)}
+    slot_index = {s: i for i, s in enumerate(slots)}
+    grids = {g.id: [[0] * len(days) for _ in slots] for g in groups}
+    for group_id, day, slot, subject, faculty, room in (entries_query.all() if groups else []):
+        if day not in day_index or slot not in slot_index:
+            continue
+        cell = (lookups['subjects'].setdefault(subject, len(lookups['subjects'])),
+                lookups['faculty'].setdefault(faculty or 'N/A', len(lookups['faculty'])),
+                lookups['rooms'].setdefault(room, len(lookups['rooms'])))
+        grids[group_id][slot_index[slot]][day_index[day]] = cells.setdefault(cell, len(cells) + 1)
+
+    return jsonify({
+        "days": days,
+        "slots": slots,
+        "groups": [{"id": g.id, "name": g.name, "grid": grids[g.id]} for g in groups],
+        "cells": [list(cell) for cell in cells],
+        "subjects": list(lookups['subjects']),
+        "faculty": list(lookups['faculty']),
+        "rooms": list(lookups['rooms']),
+        "next_after": groups[-1].id if has_more else None
+    })
 
 @main.route('/generate-timetable', methods=['POST'])
 @login_required
 def generate():
+    # Solver modules (and OR-Tools) load on first use, not on cold start
+    from app.solver import estimate_model_footprint, search_workers
+    from app.generation import load_solver_inputs, solve_and_save
+    from app.worker import enqueue_job
     try:
         # 1. Fetch current user's settings and data
-        settings = SystemSetting.query.filter_by(user_id=current_user.id).all()
-        config = {s.key: _parse_setting_value(s.value) for s in settings}
-
-        # Helper for user-specific data with limits
-        def _get_limited(model, limit_key):
-            limit = config.get(limit_key, 0)
-            query = model.query.filter_by(user_id=current_user.id)
-            if limit > 0:
-                query = query.limit(limit)
-            return query.all()
-
-        subjects = _get_limited(Subject, 'LIMIT_MAX_SUBJECTS')
-        groups = _get_limited(StudentGroup, 'LIMIT_MAX_GROUPS')
-        rooms = _get_limited(Room, 'LIMIT_MAX_ROOMS')
-        faculties = _get_limited(Faculty, 'LIMIT_MAX_FACULTIES')
-        time_slots = TimeSlot.query.filter_by(user_id=current_user.id).all()
+        with phase('load'):
+            config, subjects, groups, rooms, faculties, time_slots = load_solver_inputs(current_user.id)
         
         if not subjects or not rooms:
              return jsonify({"error": "Insufficient data to generate timetable"}), 400
 
-        # 2. Run Solver
-        status, results, obj_value = solve_timetable(subjects, groups, rooms, faculties, time_slots, config=config)
-
-        if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
-            # 3. Save to DB - isolated by user
-            TimetableEntry.query.filter_by(user_id=current_user.id).delete() 
-            
-            # Save solver score
-            score_setting = SystemSetting.query.filter_by(user_id=current_user.id, key='LAST_SOLVER_SCORE').first()
-            if not score_setting:
-                score_setting = SystemSetting(user_id=current_user.id, key='LAST_SOLVER_SCORE', value=str(obj_value))
-                db.session.add(score_setting)
-            else:
-                score_setting.value = str(obj_value)
-            
-            for r in results:
-                entry = TimetableEntry(
-                    user_id=current_user.id,
-                    subject_id=r['subject_id'],
-                    room_id=r['room_id'],
-                    group_id=r['group_id'],
-                    day=r['day'],
-                    slot=r['slot']
-                )
-                db.session.add(entry)
-            
-            db.session.commit()
-            return jsonify({"status": "Success", "entries_generated": len(results), "solver_status": int(status)})
-        else:
-            # Create a simple mapping for status
-            status_map = {
-                cp_model.UNKNOWN: "UNKNOWN",
-                cp_model.MODEL_INVALID: "MODEL_INVALID",
-                cp_model.FEASIBLE: "FEASIBLE",
-                cp_model.OPTIMAL: "OPTIMAL",
-                cp_model.INFEASIBLE: "INFEASIBLE"
-            }
-            status_name = status_map.get(status, f"UNKNOWN STATUS CODE: {status}")
-            # print(f"DEBUG: Solver returned status: {status} ({status_name})")
-            
-            # Analyze reasons
-            reasons = analyze_constraints(subjects, groups, rooms, faculties, time_slots)
-            
-            return jsonify({
-                "status": "Failed", 
-                "message": f"No solution found. Status: {status_name}",
-                "reasons": reasons
-            }), 400
-
+        fingerprint = solution_fingerprint(subjects, groups, rooms, faculties, time_slots, config)
+        if current_app.config['SOLVER_MODE'] == 'queue':
+            # Hand off to the standalone solver workers; the client polls /api/jobs/<id>
+            job = enqueue_job(current_user.id, fingerprint, current_app.config['SOLVE_JOB_MAX_ATTEMPTS'])
+            return jsonify({"status": "Queued", "job_id": job.id}), 202
+
+        # 2. Queue the solve; concurrent identical requests from this user share one run
+        footprint = estimate_model_footprint(subjects, groups, rooms, faculties, time_slots, config)
+        size = footprint['variables'] + footprint['constraints']
+        try:
+            (payload, code), coalesced = solve_scheduler.run(
+                current_user.id, fingerprint, size,
+                lambda: solve_and_save(current_user.id, config, subjects, groups, rooms, faculties, time_slots, fingerprint),
+                cores=search_workers(config))
+        except SolveQuotaExceeded as e:
+            return jsonify({"status": "Failed", "message": str(e)}), 429, {"Retry-After": str(int(e.retry_after) + 1)}
+        if code == 200:
+            payload = {**payload, "coalesced": coalesced}
+        return jsonify(payload), code
 
     except Exception as e:
         db.session.rollback()
@@ -264,6 +322,191 @@ def generate():
             traceback.print_exc(file=f)
         return jsonify({"error": str(e)}), 500
 
+@main.route('/api/jobs/<int:id>', methods=['GET'])
+@login_required
+def get_solve_job(id):
+    job = SolveJob.query.filter_by(id=id, user_id=current_user.id).first_or_404()
+    output = {"job_id": job.id, "status": job.status, "attempts": job.attempts}
+    if job.result:
+        output["result"] = json.loads(job.result)
+        output["result_code"] = job.result_code
+    if job.error:
+        output["error"] = job.error
+    return jsonify(output)
+
+@main.route('/api/solver/runs', methods=['GET'])
+@login_required
+def list_solve_runs():
+    """Recent solver runs with their time budgets, newest first, for tuning the SOLVER_* budget settings."""
+    limit = min(max(request.args.get('limit', 50, type=int), 1), 200)
+    runs = (SolveRun.query.filter_by(user_id=current_user.id)
+            .order_by(SolveRun.id.desc()).limit(limit).all())
+    return jsonify([{
+        "id": r.id,
+        "status": r.status,
+        "obj_value": r.obj_value,
+        "best_bound": r.best_bound,
+        "variables": r.variables,
+        "constraints": r.constraints,
+        "time_limit": r.time_limit,
+        "solve_time": r.solve_time,
+        "stop_reason": r.stop_reason,
+        "budget": json.loads(r.budget) if r.budget else None,
+        "estimated_mb": r.estimated_mb,
+        "peak_rss_mb": r.peak_rss_mb,
+        "memory_growth_mb": r.memory_growth_mb,
+        "dropped_families": r.dropped_families.split(',') if r.dropped_families else [],
+        "created_at": r.created_at.isoformat()
+    } for r in runs])
+
+@main.route('/api/solver/estimate', methods=['GET'])
+@login_required
+def estimate_solve():
+    """Predicted model size and memory for the current data and settings, and whether it fits the budget."""
+    from app.generation import load_solver_inputs
+    from app.memory_budget import MemoryBudgetExceeded, fit_memory_budget, memory_budget
+    config, subjects, groups, rooms, faculties, time_slots = load_solver_inputs(current_user.id)
+    try:
+        _, footprint, dropped = fit_memory_budget(config, subjects, groups, rooms, faculties, time_slots)
+    except MemoryBudgetExceeded as e:
+        return jsonify({"status": "success", "fits": False, "message": str(e), "estimate": e.footprint,
+                        "memory_budget_mb": e.budget_mb, "suggested_limits": e.suggested_limits})
+    return jsonify({"status": "success", "fits": True, "estimate": footprint,
+                    "memory_budget_mb": memory_budget(config), "dropped_constraints": dropped})
+
+@main.route('/api/scenarios/run', methods=['POST'])
+@login_required
+def run_scenarios():
+    """
+    Solves a grid of setting variants side by side and stores each as a draft.
+    Body: {"grid": {"CONSECUTIVE_PENALTY": [10, 50], ...}} or {"variants": [{...}, ...]}
+    """
+    from app.solver import detach_entities, estimate_model_footprint
+    from app.generation import load_solver_inputs
+    from app.scenarios import expand_grid, pool_layout, validate_variants, run_scenarios as run_scenario_pool
+    payload = request.json or {}
+    try:
+        if 'grid' in payload:
+            variants = expand_grid(payload['grid'])
+        else:
+            variants = validate_variants(payload.get('variants') or [])
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    if not variants:
+        return jsonify({"status": "error", "message": "No scenarios given"}), 400
+
+    config, subjects, groups, rooms, faculties, time_slots = load_solver_inputs(current_user.id)
+    if not subjects or not rooms:
+        return jsonify({"error": "Insufficient data to generate timetable"}), 400
+
+    inputs = detach_entities(subjects, groups, rooms, faculties, time_slots)
+    key = 'scenarios:' + solution_fingerprint(subjects, groups, rooms, faculties, time_slots,
+                                              {**config, 'SCENARIOS': variants})
+    size = 0
+    for overrides in variants:
+        footprint = estimate_model_footprint(subjects, groups, rooms, faculties, time_slots, {**config, **overrides})
+        size += footprint['variables'] + footprint['constraints']
+    workers, cores_per_run = pool_layout(len(variants))
+    try:
+        outcomes, _ = solve_scheduler.run(current_user.id, key, size,
+                                          lambda: run_scenario_pool(inputs, config, variants),
+                                          cores=workers * cores_per_run)
+    except SolveQuotaExceeded as e:
+        return jsonify({"status": "error", "message": str(e)}), 429, {"Retry-After": str(int(e.retry_after) + 1)}
+
+    # Each sweep replaces the tenant's previous drafts
+    TimetableDraft.query.filter_by(user_id=current_user.id).delete()
+    drafts = []
+    for outcome in outcomes:
+        draft = TimetableDraft(
+            user_id=current_user.id,
+            overrides=json.dumps(outcome['overrides']),
+            status=outcome['status'],
+            obj_value=outcome['obj_value'],
+            penalties=json.dumps(outcome['penalties']),
+            solve_time=outcome['solve_time'],
+            entries=json.dumps(outcome['entries'])
+        )
+        db.session.add(draft)
+        drafts.append(draft)
+    db.session.commit()
+
+    return jsonify({"status": "success", "scenarios": [_format_draft(d) for d in drafts]})
+
+@main.route('/api/scenarios', methods=['GET'])
+@login_required
+def list_scenarios():
+    drafts = TimetableDraft.query.filter_by(user_id=current_user.id).order_by(TimetableDraft.id).all()
+    return jsonify({"status": "success", "scenarios": [_format_draft(d) for d in drafts]})
+
+@main.route('/api/scenarios/<int:id>/promote', methods=['POST'])
+@login_required
+def promote_scenario(id):
+    from ortools.sat.python import cp_model
+    from app.generation import save_timetable
+    draft = TimetableDraft.query.filter_by(id=id, user_id=current_user.id).first_or_404()
+    if draft.status not in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+        return jsonify({"status": "error", "message": "Scenario has no solution to promote"}), 400
+
+    results = [dict(zip(('subject_id', 'room_id', 'group_id', 'day', 'slot'), row))
+               for row in json.loads(draft.entries)]
+    save_timetable(current_user.id, results, draft.obj_value, source='scenario')
+
+    # Optionally adopt the scenario's settings as the tenant's live configuration
+    if (request.json or {}).get('apply_settings'):
+        for key, value in json.loads(draft.overrides).items():
+            setting = SystemSetting.query.filter_by(key=key, user_id=current_user.id).first()
+            if setting:
+                setting.value = str(value)
+
+    db.session.commit()
+    return jsonify({"status": "success", "entries_generated": len(results)})
+
+@main.route('/api/solver/metrics', methods=['GET'])
+@login_required
+def solver_metrics():
+    metrics = solve_scheduler.metrics()
+    metrics['tenant_cpu_seconds'] = solve_scheduler.tenant_usage(current_user.id)
+    metrics['tenant_cpu_quota'] = solve_scheduler.cpu_quota
+    return jsonify(metrics)
+
+@main.route('/api/db/metrics', methods=['GET'])
+@login_required
+def db_metrics():
+    return jsonify({
+        "strategy": current_app.config['DB_POOL_STRATEGY'],
+        "engines": pool_metrics(db)
+    })
+
+@main.route('/api/admin/profiles', methods=['GET'])
+@login_required
+def request_profiles():
+    if not current_app.config['PROFILING_ENABLED']:
+        return jsonify({"status": "error", "message": "Profiling is off (set PROFILING_ENABLED=true)"}), 404
+    if not is_profiling_admin(current_app):
+        return jsonify({"status": "error", "message": "Not a profiling admin"}), 403
+    return jsonify({
+        "pid": os.getpid(),
+        "buffer_size": current_app.config['PROFILING_BUFFER_SIZE'],
+        "profiles": recent_profiles(current_app,
+                                    limit=min(request.args.get('limit', 50, type=int), 500),
+                                    endpoint=request.args.get('endpoint'),
+                                    min_ms=request.args.get('min_ms', 0, type=float),
+                                    slowest=request.args.get('sort') == 'slowest')
+    })
+
+@main.route('/api/admin/profiles/<int:profile_id>', methods=['GET'])
+@login_required
+def request_profile(profile_id):
+    if not current_app.config['PROFILING_ENABLED']:
+        return jsonify({"status": "error", "message": "Profiling is off (set PROFILING_ENABLED=true)"}), 404
+    if not is_profiling_admin(current_app):
+        return jsonify({"status": "error", "message": "Not a profiling admin"}), 403
+    profile = find_profile(current_app, profile_id)
+    if profile is None:
+        return jsonify({"status": "error", "message": "Profile not in this process's buffer"}), 404
+    return jsonify(profile)
+
 @main.route('/api/faculty/add', methods=['POST'])
 @login_required
 def add_faculty():
@@ -273,6 +516,7 @@ def add_faculty():
     
     f = Faculty(name=name, department_id=dept_id, max_hours_per_week=max_hours, user_id=current_user.id)
     db.session.add(f)
+    bump_revision(current_user.id)
     db.session.commit()
     return jsonify({
         "status": "success",
@@ -289,6 +533,7 @@ def delete_faculty(id):
     f = Faculty.query.filter_by(id=id, user_id=current_user.id).first_or_404()
     Subject.query.filter_by(faculty_id=id, user_id=current_user.id).delete()
     db.session.delete(f)
+    bump_revision(current_user.id)
     db.session.commit()
     return jsonify({"status": "success"})
 
@@ -316,7 +561,8 @@ def import_preview():
             'group': ['Name', 'Course', 'Size'],
             'faculty': ['Name', 'Department', 'Max Hours'],
             'room': ['Name', 'Capacity', 'Type'],
-            'subject': ['Name', 'Course', 'Faculty', 'Hours', 'Is Lab']
+            'subject': ['Name', 'Course', 'Faculty', 'Hours', 'Is Lab'],
+            'enrollment': ['Student', 'Subject']
         }
         
         if entity_type not in expected_headers:
@@ -358,6 +604,8 @@ def import_finalize():
                 Room.query.filter_by(user_id=current_user.id).delete()
             elif entity_type == 'subject':
                 Subject.query.filter_by(user_id=current_user.id).delete()
+            elif entity_type == 'enrollment':
+                Enrollment.query.filter_by(user_id=current_user.id).delete()
 
         if entity_type == 'department':
             existing = {d.name.lower(): d for d in Department.query.filter_by(user_id=current_user.id).all()}
@@ -419,6 +667,7 @@ def import_finalize():
                 f_name = (row.get('Faculty') or row.get('faculty') or "").lower().strip()
                 hours = row.get('Hours') or row.get('hours') or 3
                 lab = str(row.get('Is Lab') or row.get('is_lab') or "").lower() == 'true'
+                shared = str(row.get('Is Shared') or row.get('is_shared') or "").lower() == 'true'
                 
                 if name and course_name in courses and name.lower() not in existing:
                     s = Subject(
@@ -427,11 +676,29 @@ def import_finalize():
                         faculty_id=faculty.get(f_name), 
                         hours_per_week=hours, 
                         is_lab=lab, 
+                        is_shared=shared,
                         user_id=current_user.id
                     )
                     db.session.add(s)
                     count += 1
 
+        elif entity_type == 'enrollment':
+            # Can be tens of thousands of rows: one bulk insert of the new pairs
+            subjects = {s.name.lower(): s.id for s in Subject.query.filter_by(user_id=current_user.id).all()}
+            existing = set(db.session.query(Enrollment.student, Enrollment.subject_id)
+                           .filter_by(user_id=current_user.id))
+            rows = []
+            for row in data:
+                student = str(row.get('Student') or row.get('student') or "").strip()
+                subject_id = subjects.get((row.get('Subject') or row.get('subject') or "").lower().strip())
+                if student and subject_id and (student, subject_id) not in existing:
+                    existing.add((student, subject_id))
+                    rows.append({'user_id': current_user.id, 'student': student, 'subject_id': subject_id})
+            if rows:
+                db.session.execute(insert(Enrollment), rows)
+            count = len(rows)
+
+        bump_revision(current_user.id)
         db.session.commit()
         return jsonify({"status": "success", "count": count})
     except Exception as e:
@@ -446,6 +713,7 @@ def add_room():
     rtype = request.form.get('type')
     r = Room(name=name, capacity=capacity, type=rtype, user_id=current_user.id)
     db.session.add(r)
+    bump_revision(current_user.id)
     db.session.commit()
     return jsonify({
         "status": "success",
@@ -462,6 +730,7 @@ def add_room():
 def delete_room(id):
     r = Room.query.filter_by(id=id, user_id=current_user.id).first_or_404()
     db.session.delete(r)
+    bump_revision(current_user.id)
     db.session.commit()
     return jsonify({"status": "success"})
 
@@ -473,9 +742,12 @@ def add_subject():
     faculty_id = request.form.get('faculty_id')
     hours = request.form.get('hours')
     is_lab = request.form.get('is_lab') == 'on'
+    is_shared = request.form.get('is_shared') == 'on'
     
-    s = Subject(name=name, course_id=course_id, faculty_id=faculty_id, hours_per_week=hours, is_lab=is_lab, user_id=current_user.id)
+    s = Subject(name=name, course_id=course_id, faculty_id=faculty_id, hours_per_week=hours, is_lab=is_lab,
+                is_shared=is_shared, user_id=current_user.id)
     db.session.add(s)
+    bump_revision(current_user.id)
     db.session.commit()
     return jsonify({
         "status": "success",
@@ -484,7 +756,8 @@ def add_subject():
             "name": s.name,
             "faculty_name": s.faculty.name if s.faculty else 'Unassigned',
             "hours_per_week": s.hours_per_week,
-            "is_lab": s.is_lab
+            "is_lab": s.is_lab,
+            "is_shared": s.is_shared
         }
     })
 
@@ -493,6 +766,7 @@ def add_subject():
 def delete_subject(id):
     s = Subject.query.filter_by(id=id, user_id=current_user.id).first_or_404()
     db.session.delete(s)
+    bump_revision(current_user.id)
     db.session.commit()
     return jsonify({"status": "success"})
 
@@ -500,6 +774,7 @@ def delete_subject(id):
 
 @main.route('/api/view/all', methods=['GET'])
 @login_required
+@read_only
 def get_all_timetable_api():
     entries = TimetableEntry.query.filter_by(user_id=current_user.id).all()
     # restructure by day
@@ -507,11 +782,13 @@ def get_all_timetable_api():
     for e in entries:
         if e.day not in output: output[e.day] = []
         output[e.day].append({
+            "id": e.id,
             "slot": e.slot,
             "subject": e.subject.name,
             "faculty": e.subject.faculty.name if e.subject.faculty else "N/A",
             "room": e.room.name,
-            "group": e.group.name
+            "group": e.group.name,
+            "pinned": e.pinned
         })
     # Sort
     for d in output:
@@ -520,6 +797,7 @@ def get_all_timetable_api():
     return jsonify(output)
 
 @main.route('/faculty/<int:id>', methods=['GET'])
+@read_only
 def get_faculty_timetable(id):
     entries = (TimetableEntry.query
                .join(Subject, TimetableEntry.subject_id == Subject.id)
@@ -530,6 +808,7 @@ def get_faculty_timetable(id):
     
 
 @main.route('/department/<int:id>', methods=['GET'])
+@read_only
 def get_dept_timetable(id):
     entries = (TimetableEntry.query
                .join(Subject)
@@ -539,12 +818,386 @@ def get_dept_timetable(id):
     return jsonify(_format_entries(entries))
 
 @main.route('/group/<int:id>', methods=['GET'])
+@read_only
 def get_group_timetable(id):
     entries = TimetableEntry.query.filter_by(group_id=id).all()
     return jsonify(_format_entries(entries))
 
 
 
+@main.route('/api/enrollment/conflicts', methods=['GET'])
+@login_required
+@read_only
+def enrollment_conflicts():
+    """Size of the elective conflict graph and the clique constraints the solver gets from it."""
+    edges = db.session.execute(conflict_edges_query(current_user.id)).all()
+    cliques = conflict_cliques([(u, v) for u, v, _ in edges])
+    return jsonify({
+        "students": db.session.query(func.count(func.distinct(Enrollment.student)))
+                    .filter_by(user_id=current_user.id).scalar(),
+        "enrollments": Enrollment.query.filter_by(user_id=current_user.id).count(),
+        "conflicting_pairs": len(edges),
+        "cliques": len(cliques),
+        "largest_clique": max((len(c) for c in cliques), default=0),
+        "top_pairs": [{"subjects": [u, v], "students": n} for u, v, n in sorted(edges, key=lambda e: -e[2])[:20]]
+    })
+
+@main.route('/api/analytics', methods=['GET'])
+@login_required
+@read_only
+def timetable_analytics():
+    """Conflicts, penalty terms, utilization, faculty load, idle gaps and heatmaps of the live timetable (or ?version=N)."""
+    from app.analytics import evaluate, Assignment
+    from app.editing import tenant_timetable
+    timetable = tenant_timetable(current_user.id)
+    version = request.args.get('version', type=int)
+    if version is not None:
+        assignments = load_version(db.session.execute, current_user.id, version)
+        if assignments is None:
+            return jsonify({"status": "error", "message": f"Timetable version {version} not found"}), 404
+        timetable['entries'] = [Assignment(*a) for a in assignments]
+    return jsonify({"status": "success", "version": version, **evaluate(**timetable)})
+
+@main.route('/api/analytics/evaluate', methods=['POST'])
+@login_required
+@read_only
+def evaluate_timetable():
+    """
+    Scores a timetable that is not saved, e.g. an import or an edited copy:
+    {"entries": [{"subject_id", "group_id", "room_id", "day", "slot"}, ...]}.
+    """
+    from app.analytics import evaluate, Assignment
+    from app.editing import tenant_timetable
+    entries = (request.json or {}).get('entries')
+    if not isinstance(entries, list):
+        return jsonify({"status": "error", "message": "'entries' must be a list"}), 400
+    assignments = []
+    for i, e in enumerate(entries):
+        try:
+            if not isinstance(e['day'], str):
+                raise TypeError
+            assignments.append(Assignment(int(e['subject_id']), int(e['group_id']), int(e['room_id']),
+                                          e['day'], int(e['slot'])))
+        except (KeyError, TypeError, ValueError):
+            return jsonify({"status": "error", "message": f"Entry {i}: needs integer subject_id, group_id, "
+                                                          f"room_id and slot, and a day"}), 400
+    timetable = tenant_timetable(current_user.id)
+    timetable['entries'] = assignments
+    return jsonify({"status": "success", **evaluate(**timetable)})
+
+@main.route('/api/timetable/entries/<int:id>/move', methods=['POST'])
+@login_required
+def move_timetable_entry(id):
+    """Moves an entry: {"day", "slot", "room_id" (optional), "dry_run" (optional)}."""
+    data = request.json or {}
+    return _run_edit(move_entry, id, data.get('day'), data.get('slot'), data.get('room_id'),
+                     bool(data.get('dry_run')))
+
+@main.route('/api/timetable/entries/swap', methods=['POST'])
+@login_required
+def swap_timetable_entries():
+    """Exchanges the places of two entries: {"first": id, "second": id, "dry_run" (optional)}."""
+    data = request.json or {}
+    return _run_edit(swap_entries, data.get('first'), data.get('second'), bool(data.get('dry_run')))
+
+@main.route('/api/timetable/entries/<int:id>/pin', methods=['POST'])
+@login_required
+def pin_timetable_entry(id):
+    """Pins (or with {"pinned": false} unpins) an entry; solves keep pinned entries where they are."""
+    entry = TimetableEntry.query.filter_by(id=id, user_id=current_user.id).first_or_404()
+    entry.pinned = bool((request.json or {}).get('pinned', True))
+    db.session.commit()
+    return jsonify({"status": "success", "id": entry.id, "pinned": entry.pinned})
+
+@main.route('/api/timetable/versions', methods=['GET'])
+@login_required
+def list_timetable_versions():
+    versions = (TimetableVersion.query.filter_by(user_id=current_user.id)
+                .order_by(TimetableVersion.number.desc()).all())
+    return jsonify([{
+        "number": v.number,
+        "source": v.source,
+        "entries": v.entry_count,
+        "obj_value": v.obj_value,
+        "created_at": v.created_at.isoformat()
+    } for v in versions])
+
+@main.route('/api/timetable/versions/diff', methods=['GET'])
+@login_required
+def diff_timetable_versions():
+    """What changed between two versions: GET ?from=3&to=7 (to defaults to the latest)."""
+    first = request.args.get('from', type=int)
+    second = request.args.get('to', type=int)
+    if second is None:
+        second = db.session.query(func.max(TimetableVersion.number)).filter_by(user_id=current_user.id).scalar()
+    if first is None or second is None:
+        return jsonify({"status": "error", "message": "'from' version is required"}), 400
+
+    old = load_version(db.session.execute, current_user.id, first)
+    new = load_version(db.session.execute, current_user.id, second)
+    if old is None or new is None:
+        return jsonify({"status": "error", "message": f"Version {first if old is None else second} not found"}), 404
+    delta = diff_assignments(old, new)
+    fields = ('subject_id', 'group_id', 'room_id', 'day', 'slot')
+    return jsonify({
+        "from": first,
+        "to": second,
+        "summary": {key: len(items) for key, items in delta.items()},
+        "added": [dict(zip(fields, a)) for a in delta['added']],
+        "removed": [dict(zip(fields, r)) for r in delta['removed']],
+        "moved": [{"before": dict(zip(fields, b)), "after": dict(zip(fields, a))} for b, a in delta['moved']]
+    })
+
+@main.route('/api/timetable/versions/<int:number>/rollback', methods=['POST'])
+@login_required
+def rollback_timetable_version(number):
+    """Restores a past version as the live timetable; the rollback itself becomes the newest version."""
+    try:
+        version, dropped = rollback_timetable(current_user.id, number)
+    except LookupError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+    db.session.commit()
+    return jsonify({"status": "success", "restored": number, "version": version, "dropped": dropped})
+
+def _run_edit(edit, *args):
+    try:
+        result = edit(current_user.id, current_user.timetable_revision, *args)
+    except LookupError as e:
+        return jsonify({"status": "error", "message": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"status": "error", "message": str(e)}), 400
+    except StaleTimetable as e:
+        return jsonify({"status": "error", "message": str(e)}), 409
+    if result['conflicts']:
+        return jsonify({"status": "error", "message": "The change clashes with the timetable",
+                        "conflicts": result['conflicts']}), 409
+    return jsonify({"status": "success", **result})
+
+@main.route('/api/terms', methods=['GET'])
+@login_required
+def list_terms():
+    terms = Term.query.filter_by(user_id=current_user.id).order_by(Term.start_date.desc()).all()
+    return jsonify([_term_json(t) for t in terms])
+
+@main.route('/api/terms', methods=['POST'])
+@login_required
+def create_term():
+    """
+    Starts a term from the current weekly timetable: {"name", "start_date":
+    "YYYY-MM-DD", "weeks", "exceptions": [...] (optional, as for /exceptions)}.
+    """
+    from app.editing import tenant_timetable
+    from app.term import create_term as new_term, add_exception
+    data = request.json or {}
+    try:
+        start_date = datetime.strptime(str(data.get('start_date')), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({"status": "error", "message": "'start_date' must be YYYY-MM-DD"}), 400
+    try:
+        term = new_term(current_user.id, (data.get('name') or '').strip(), start_date, int(data.get('weeks') or 0))
+        days = tenant_timetable(current_user.id)['days'] if data.get('exceptions') else []
+        for exception in data.get('exceptions') or []:
+            add_exception(current_user.id, term, exception, days)
+    except (TypeError, ValueError) as e:
+        db.session.rollback()
+        return jsonify({"status": "error", "message": str(e)}), 400
+    db.session.commit()
+    return jsonify({"status": "success", "term": _term_json(term)})
+
+@main.route('/api/terms/<int:id>', methods=['GET'])
+@login_required
+def get_term(id):
+    term = Term.query.filter_by(id=id, user_id=current_user.id).first_or_404()
+    exceptions = TermException.query.filter_by(term_id=id, user_id=current_user.id).order_by(TermException.id).all()
+    overrides = TermOverride.query.filter_by(term_id=id, user_id=current_user.id).order_by(TermOverride.id).all()
+    return jsonify({
+        **_term_json(term),
+        "exceptions": [{
+            "id": e.id, "kind": e.kind, "weeks": e.weeks, "day": e.day, "room_id": e.room_id,
+            "subject_id": e.subject_id, "note": e.note
+        } for e in exceptions],
+        "overrides": [{
+            "weeks": json.loads(o.weeks), "exceptions": json.loads(o.exceptions), "moved": o.moved,
+            "unplaced": o.unplaced, "solve_time": o.solve_time
+        } for o in overrides]
+    })
+
+@main.route('/api/terms/<int:id>/delete', methods=['POST'])
+@login_required
+def delete_term(id):
+    term = Term.query.filter_by(id=id, user_id=current_user.id).first_or_404()
+    TermOverride.query.filter_by(term_id=id, user_id=current_user.id).delete()
+    TermException.query.filter_by(term_id=id, user_id=current_user.id).delete()
+    db.session.delete(term)
+    db.session.commit()
+    return jsonify({"status": "success"})
+
+@main.route('/api/terms/<int:id>/exceptions', methods=['POST'])
+@login_required
+def add_term_exception(id):
+    """
+    Adds {"kind": no_classes | day_off | room_closed | subject_off, "weeks":
+    "7" / "3-4,9" / "odd" / "even", or "date": "YYYY-MM-DD" for one day,
+    "day", "room_id", "subject_id", "note"}. Re-plan the term afterwards.
+    """
+    from app.editing import tenant_timetable
+    from app.term import add_exception
+    term = Term.query.filter_by(id=id, user_id=current_user.id).first_or_404()
+    try:
+        exception = add_exception(current_user.id, term, request.json or {}, tenant_timetable(current_user.id)['days'])
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"status": "error", "message": str(e)}), 400
+    db.session.commit()
+    return jsonify({"status": "success", "id": exception.id})
+
+@main.route('/api/terms/<int:id>/exceptions/<int:exception_id>/delete', methods=['POST'])
+@login_required
+def delete_term_exception(id, exception_id):
+    exception = TermException.query.filter_by(id=exception_id, term_id=id, user_id=current_user.id).first_or_404()
+    db.session.delete(exception)
+    db.session.commit()
+    return jsonify({"status": "success"})
+
+@main.route('/api/terms/<int:id>/plan', methods=['POST'])
+@login_required
+def plan_term_weeks(id):
+    """Plans the term's exception weeks; {"refresh_template": true} first re-takes the current weekly timetable."""
+    from app.term import plan_term
+    from app.solver import search_workers
+    from app.generation import load_settings
+    term = Term.query.filter_by(id=id, user_id=current_user.id).first_or_404()
+    refresh = bool((request.get_json(silent=True) or {}).get('refresh_template'))
+    try:
+        # Repair solves share the solver slots and the tenant's CPU quota with generates
+        summary, _ = solve_scheduler.run(current_user.id, ('term', id), term.template_entries,
+                                         lambda: plan_term(current_user.id, term, refresh),
+                                         cores=search_workers(load_settings(current_user.id)))
+    except SolveQuotaExceeded as e:
+        return jsonify({"status": "Failed", "message": str(e)}), 429, {"Retry-After": str(int(e.retry_after) + 1)}
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"status": "error", "message": str(e)}), 400
+    db.session.commit()
+    return jsonify({"status": "success", **summary})
+
+@main.route('/api/terms/<int:id>/weeks/<int:week>', methods=['GET'])
+@login_required
+@read_only
+def get_term_week(id, week):
+    """One week of the term: its classes by day with dates, and what changed from the template."""
+    from app.term import term_week, week_start
+    term = Term.query.filter_by(id=id, user_id=current_user.id).first_or_404()
+    if not 1 <= week <= term.weeks:
+        return jsonify({"status": "error", "message": f"The term has weeks 1-{term.weeks}"}), 404
+    plan = term_week(current_user.id, term, week)
+    names = {model: dict(db.session.query(model.id, model.name).filter_by(user_id=current_user.id))
+             for model in (Subject, StudentGroup, Room)}
+    monday = week_start(term, week)
+    day_names = list(calendar.day_name)
+
+    def entry(a):
+        return {"subject_id": a[0], "group_id": a[1], "room_id": a[2], "day": a[3], "slot": a[4],
+                "subject": names[Subject].get(a[0]), "group": names[StudentGroup].get(a[1]),
+                "room": names[Room].get(a[2])}
+
+    by_day = {}
+    for a in sorted(plan['assignments'], key=lambda a: (a[4], a[1])):
+        by_day.setdefault(a[3], []).append(entry(a))
+    changes = plan['changes']
+    return jsonify({
+        "term_id": term.id,
+        "week": week,
+        "dates": {day: (monday + timedelta(days=day_names.index(day))).isoformat()
+                  for day in by_day if day in day_names},
+        "cancelled": plan['cancelled'],
+        "exceptions": plan['exceptions'],
+        "stale": plan['stale'],
+        "days": by_day,
+        "moved": [{"before": entry(b), "after": entry(a)} for b, a in changes['moved']] if changes else [],
+        "removed": [entry(r) for r in changes['removed']] if changes else [],
+        "unplaced": [entry(u) for u in plan['unplaced']]
+    })
+
+def _term_json(term):
+    return {
+        "id": term.id,
+        "name": term.name,
+        "start_date": term.start_date.isoformat(),
+        "weeks": term.weeks,
+        "template_entries": term.template_entries,
+        "planned_at": term.planned_at.isoformat() if term.planned_at else None,
+        "created_at": term.created_at.isoformat() if term.created_at else None
+    }
+
+@main.route('/api/export/timetable.csv', methods=['GET'])
+@login_required
+@read_only
+def export_timetable_csv():
+    rows = export_rows(current_user.id)
+    return Response(stream_with_context(csv_chunks(rows)), mimetype='text/csv',
+                    headers={"Content-Disposition": "attachment; filename=timetable.csv"})
+
+@main.route('/api/export/<by>/<int:id>.ics', methods=['GET'])
+@login_required
+@read_only
+def export_calendar(by, id):
+    if by == 'group':
+        owner = StudentGroup.query.filter_by(id=id, user_id=current_user.id).first_or_404()
+    elif by == 'faculty':
+        owner = Faculty.query.filter_by(id=id, user_id=current_user.id).first_or_404()
+    else:
+        return jsonify({"status": "error", "message": f"Cannot export by {by}"}), 404
+    rows = export_rows(current_user.id, by, id)
+    return Response(stream_with_context(ics_chunks(owner.name, rows)), mimetype='text/calendar',
+                    headers={"Content-Disposition": f"attachment; filename={by}-{id}.ics"})
+
+@main.route('/api/export/zip', methods=['GET'])
+@login_required
+@read_only
+def export_zip():
+    """One file per group or faculty in a streamed zip: ?by=group|faculty&format=csv|ics"""
+    by = request.args.get('by', 'group')
+    fmt = request.args.get('format', 'csv')
+    if by not in EXPORT_GROUPINGS or fmt not in EXPORT_FORMATS:
+        return jsonify({"status": "error", "message": "Invalid export options"}), 400
+    return Response(stream_with_context(zip_chunks(current_user.id, by, fmt)), mimetype='application/zip',
+                    headers={"Content-Disposition": f"attachment; filename=timetable-{by}-{fmt}.zip"})
+
+@main.route('/api/export/jobs', methods=['POST'])
+@login_required
+def create_export_job():
+    """Builds the same zip as /api/export/zip in the background; poll the job, then download it."""
+    payload = request.json or {}
+    by = payload.get('by', 'group')
+    fmt = payload.get('format', 'csv')
+    if by not in EXPORT_GROUPINGS or fmt not in EXPORT_FORMATS:
+        return jsonify({"status": "error", "message": "Invalid export options"}), 400
+    job = start_export_job(current_app._get_current_object(), current_user.id, by, fmt)
+    return jsonify({"status": "Queued", "job_id": job.id}), 202
+
+@main.route('/api/export/jobs/<int:id>', methods=['GET'])
+@login_required
+def get_export_job(id):
+    expire_export_jobs()
+    job = ExportJob.query.filter_by(id=id, user_id=current_user.id).first_or_404()
+    output = {"job_id": job.id, "status": job.status, "by": job.by, "format": job.format}
+    if job.status == 'done':
+        output["download_url"] = url_for('main.download_export', id=job.id)
+    if job.error:
+        output["error"] = job.error
+    return jsonify(output)
+
+@main.route('/api/export/jobs/<int:id>/download', methods=['GET'])
+@login_required
+def download_export(id):
+    job = ExportJob.query.filter(ExportJob.id == id, ExportJob.user_id == current_user.id,
+                                 ExportJob.status.in_(('done', 'expired'))).first_or_404()
+    if not job.path or not os.path.exists(job.path):
+        return jsonify({"status": "error", "message": "Export file is no longer available"}), 410
+    return send_file(job.path, mimetype='application/zip', as_attachment=True,
+                     download_name=f"timetable-{job.by}-{job.format}.zip")
+
 @main.route('/master-control')
 @login_required
 def master_control():
@@ -560,6 +1213,7 @@ def update_settings():
         setting = SystemSetting.query.filter_by(key=key, user_id=current_user.id).first()
         if setting:
             setting.value = str(value)
+    bump_revision(current_user.id)
     db.session.commit()
     return jsonify({"status": "success"})
 
@@ -622,134 +1276,62 @@ def natural_language_control():
             new_setting = SystemSetting(key=key, value=str(val), user_id=current_user.id)
             db.session.add(new_setting)
     
+    bump_revision(current_user.id)
     db.session.commit()
     return jsonify({"status": "success", "message": "Constraint updated successfully!"})
 
 def _seed_time_slots():
     if not current_user.is_authenticated:
         return
-    if TimeSlot.query.filter_by(user_id=current_user.id).first():
-        return
-        
-    days = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
-    for day in days:
-        for slot in range(1, 9):
-            ts = TimeSlot(day=day, slot_number=slot, user_id=current_user.id)
-            db.session.add(ts)
-    db.session.commit()
-
-def _seed_demo_data():
-    if not current_user.is_authenticated or current_user.username != 'demo_institution':
-        return
-    if Faculty.query.filter_by(user_id=current_user.id).first():
-        return
-
-    # Departments
-    cs = Department(name="Computer Science", user_id=current_user.id)
-    ee = Department(name="Electrical Engineering", user_id=current_user.id)
-    db.session.add_all([cs, ee])
-    db.session.commit()
-
-    # Faculty - CS
-    f1 = Faculty(name="Dr. Sarah Johnson", department_id=cs.id, max_hours_per_week=20, user_id=current_user.id)
-    f2 = Faculty(name="Prof. Michael Chen", department_id=cs.id, max_hours_per_week=18, user_id=current_user.id)
-    f3 = Faculty(name="Dr. Alan Turing", department_id=cs.id, max_hours_per_week=15, user_id=current_user.id)
-    f4 = Faculty(name="Grace Hopper", department_id=cs.id, max_hours_per_week=18, user_id=current_user.id)
-    
-    # Faculty - EE
-    f5 = Faculty(name="Dr. Emily Davis", department_id=ee.id, max_hours_per_week=22, user_id=current_user.id)
-    f6 = Faculty(name="Nikola Tesla", department_id=ee.id, max_hours_per_week=20, user_id=current_user.id)
-    f7 = Faculty(name="James Maxwell", department_id=ee.id, max_hours_per_week=15, user_id=current_user.id)
-    
-    db.session.add_all([f1, f2, f3, f4, f5, f6, f7])
-    db.session.commit()
-
-    # Courses & Groups
-    c1 = Course(name="B.Tech CS", department_id=cs.id, user_id=current_user.id)
-    c2 = Course(name="B.Tech EE", department_id=ee.id, user_id=current_user.id)
-    db.session.add_all([c1, c2])
-    db.session.commit()
-
-    g1 = StudentGroup(name="CS-2024", course_id=c1.id, size=60, user_id=current_user.id)
-    g2 = StudentGroup(name="CS-2023", course_id=c1.id, size=55, user_id=current_user.id)
-    g3 = StudentGroup(name="EE-2024", course_id=c2.id, size=45, user_id=current_user.id)
-    g4 = StudentGroup(name="EE-2023", course_id=c2.id, size=40, user_id=current_user.id)
-    db.session.add_all([g1, g2, g3, g4])
-    db.session.commit()
-
-    # Rooms
-    r1 = Room(name="Lecture Hall 1", capacity=100, type="lecture", user_id=current_user.id)
-    r2 = Room(name="CS Lab Alpha", capacity=75, type="lab", user_id=current_user.id)
-    r3 = Room(name="EE Lab Beta", capacity=60, type="lab", user_id=current_user.id)
-    r4 = Room(name="Seminar Room 1", capacity=50, type="lecture", user_id=current_user.id)
-    db.session.add_all([r1, r2, r3, r4])
-    db.session.commit()
-
-    # Subjects - CS
-    s1 = Subject(name="Deep Learning", course_id=c1.id, hours_per_week=4, faculty_id=f1.id, is_lab=False, user_id=current_user.id)
-    s2 = Subject(name="Data Structures", course_id=c1.id, hours_per_week=3, faculty_id=f2.id, is_lab=False, user_id=current_user.id)
-    s3 = Subject(name="AI Lab", course_id=c1.id, hours_per_week=2, faculty_id=f1.id, is_lab=True, user_id=current_user.id)
-    s4 = Subject(name="Operating Systems", course_id=c1.id, hours_per_week=3, faculty_id=f3.id, is_lab=False, user_id=current_user.id)
-    s5 = Subject(name="Database Systems", course_id=c1.id, hours_per_week=3, faculty_id=f4.id, is_lab=False, user_id=current_user.id)
-    
-    # Subjects - EE
-    s6 = Subject(name="Power Systems", course_id=c2.id, hours_per_week=4, faculty_id=f5.id, is_lab=False, user_id=current_user.id)
-    s7 = Subject(name="Control Theory", course_id=c2.id, hours_per_week=3, faculty_id=f6.id, is_lab=False, user_id=current_user.id)
-    s8 = Subject(name="Electromagnetism", course_id=c2.id, hours_per_week=3, faculty_id=f7.id, is_lab=False, user_id=current_user.id)
-    s9 = Subject(name="Circuit Design", course_id=c2.id, hours_per_week=3, faculty_id=f6.id, is_lab=True, user_id=current_user.id)
-    
-    db.session.add_all([s1, s2, s3, s4, s5, s6, s7, s8, s9])
-    db.session.commit()
-
-def _parse_setting_value(val):
-    if val.lower() == 'true': return True
-    if val.lower() == 'false': return False
-    try:
-        if '.' in val: return float(val)
-        return int(val)
-    except:
-        return val
+    if not db.session.query(TimeSlot.id).filter_by(user_id=current_user.id).first():
+        db.session.execute(insert(TimeSlot), [{**row, 'user_id': current_user.id} for row in DEFAULT_TIME_SLOTS])
+        bump_revision(current_user.id)
+        db.session.commit()
 
 def _seed_default_settings():
     if not current_user.is_authenticated:
         return
-        
-    defaults = [
-        ('CONSECUTIVE_LABS_WEIGHT', '100', 'Penalty for fragmented lab slots'),
-        ('MAX_HOURS_PENALTY', '500', 'Penalty for exceeding faculty max hours'),
-        ('CONSECUTIVE_PENALTY', '10', 'Penalty for too many consecutive lectures'),
-        ('SAME_DAY_MULTI_PENALTY', '10', 'Penalty for multiple lectures of same subject on same day'),
-        ('LECTURES_IN_LABS', 'False', 'Allow lectures to be scheduled in lab rooms'),
-        ('MAX_CONSECUTIVE_LECTURES', '3', 'Max lectures a faculty can teach in a row'),
-        ('SOLVER_TIME_LIMIT', '30', 'Max seconds the solver will run (Max 60 recommended)'),
-        ('LIMIT_MAX_FACULTIES', '0', 'Limit number of faculties for routine (0 for all)'),
-        ('LIMIT_MAX_GROUPS', '0', 'Limit number of student groups for routine (0 for all)'),
-        ('LIMIT_MAX_SUBJECTS', '0', 'Limit number of subjects for routine (0 for all)'),
-        ('LIMIT_MAX_ROOMS', '0', 'Limit number of rooms for routine (0 for all)'),
-        ('CONSTRAINT_LAB_CONSECUTIVE_ENABLED', 'True', 'Enable consecutive lab slot constraints'),
-        ('CONSTRAINT_FACULTY_MAX_HOURS_ENABLED', 'True', 'Enforce faculty weekly hour limits'),
-        ('CONSTRAINT_FACULTY_CONSECUTIVE_ENABLED', 'True', 'Enforce limits on consecutive lectures'),
-        ('CONSTRAINT_SUBJECT_DISTRIBUTION_ENABLED', 'True', 'Distribute subjects across different days'),
-        ('LAST_SOLVER_SCORE', '0', 'Last optimization score')
-    ]
-    for key, val, desc in defaults:
-        setting = SystemSetting.query.filter_by(key=key, user_id=current_user.id).first()
+
+    # One query for everything the tenant already has; writes only when something is missing or stale
+    existing = {s.key: s for s in SystemSetting.query.filter_by(user_id=current_user.id).all()}
+    missing = changed = False
+    for key, val, desc in DEFAULT_SETTINGS:
+        setting = existing.get(key)
         if not setting:
             db.session.add(SystemSetting(key=key, value=val, description=desc, user_id=current_user.id))
+            missing = True
         elif setting.description != desc:
             setting.description = desc
-    db.session.commit()
+            changed = True
+    if missing:
+        bump_revision(current_user.id)
+    if missing or changed:
+        db.session.commit()
+
+def _format_draft(draft):
+    from app.generation import SOLVER_STATUS_NAMES
+    return {
+        "id": draft.id,
+        "overrides": json.loads(draft.overrides),
+        "status": SOLVER_STATUS_NAMES.get(draft.status, str(draft.status)),
+        "objective": draft.obj_value,
+        "penalties": json.loads(draft.penalties or '{}'),
+        "solve_time": round(draft.solve_time or 0, 3),
+        "entries": len(json.loads(draft.entries))
+    }
 
 def _format_entries(entries):
     output = {}
     for e in entries:
         if e.day not in output: output[e.day] = []
         output[e.day].append({
+            "id": e.id,
             "slot": e.slot,
             "subject": e.subject.name,
             "faculty": e.subject.faculty.name if e.subject.faculty else "N/A",
             "room": e.room.name,
-            "group": e.group.name
+            "group": e.group.name,
+            "pinned": e.pinned
         })
     for d in output:
         output[d].sort(key=lambda x: x['slot'])
@@ -0,0 +1,113 @@
+import itertools
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from app.solver import solve_timetable
+
+# Settings a what-if scenario may override: (type, smallest, largest allowed value)
+TUNABLE_SETTINGS = {
+    'CONSECUTIVE_LABS_WEIGHT': (int, 0, 1000000),
+    'MAX_HOURS_PENALTY': (int, 0, 1000000),
+    'CONSECUTIVE_PENALTY': (int, 0, 1000000),
+    'SAME_DAY_MULTI_PENALTY': (int, 0, 1000000),
+    'MAX_CONSECUTIVE_LECTURES': (int, 1, 24),
+    'LECTURES_IN_LABS': (bool, None, None),
+    'SOLVER_TIME_LIMIT': (float, 0.1, 600),
+    'CONSTRAINT_LAB_CONSECUTIVE_ENABLED': (bool, None, None),
+    'CONSTRAINT_FACULTY_MAX_HOURS_ENABLED': (bool, None, None),
+    'CONSTRAINT_FACULTY_CONSECUTIVE_ENABLED': (bool, None, None),
+    'CONSTRAINT_SUBJECT_DISTRIBUTION_ENABLED': (bool, None, None),
+}
+
+MAX_VARIANTS = int(os.environ.get('SCENARIO_MAX_VARIANTS', 32))
+MAX_WORKERS = int(os.environ.get('SCENARIO_MAX_WORKERS', min(4, os.cpu_count() or 1)))
+
+def expand_grid(grid):
+    """
+    Expands {"KEY": [v1, v2], ...} into the list of all override combinations.
+    Raises ValueError for unknown keys, bad values or grids larger than MAX_VARIANTS.
+    """
+    if not isinstance(grid, dict):
+        raise ValueError("'grid' must map settings to lists of values")
+    keys = sorted(grid)
+    value_lists = [grid[k] if isinstance(grid[k], list) else [grid[k]] for k in keys]
+    size = 1
+    for values in value_lists:
+        size *= len(values)
+    if size > MAX_VARIANTS:
+        raise ValueError(f"{size} scenarios requested (max {MAX_VARIANTS})")
+    return validate_variants([dict(zip(keys, combo)) for combo in itertools.product(*value_lists)])
+
+def validate_variants(variants):
+    """
+    The variants with every value converted to its setting's type. Raises
+    ValueError for non-tunable keys, values of the wrong type or out of
+    range, or more than MAX_VARIANTS scenarios.
+    """
+    if not isinstance(variants, list) or not all(isinstance(v, dict) for v in variants):
+        raise ValueError("'variants' must be a list of setting overrides")
+    unknown = sorted({k for v in variants for k in v if k not in TUNABLE_SETTINGS})
+    if unknown:
+        raise ValueError(f"Settings cannot be varied: {', '.join(unknown)}")
+    if len(variants) > MAX_VARIANTS:
+        raise ValueError(f"{len(variants)} scenarios requested (max {MAX_VARIANTS})")
+    return [{key: _setting_value(key, value) for key, value in v.items()} for v in variants]
+
+def _setting_value(key, value):
+    kind, low, high = TUNABLE_SETTINGS[key]
+    if kind is bool:
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, str) and value.lower() in ('true', 'false'):
+            return value.lower() == 'true'
+        raise ValueError(f"{key} must be true or false, got {value!r}")
+    # JSON booleans are ints to Python, but never a sensible weight or limit
+    if isinstance(value, bool) or not isinstance(value, (int, float, str)):
+        raise ValueError(f"{key} must be a number, got {value!r}")
+    try:
+        number = float(value)
+    except ValueError:
+        raise ValueError(f"{key} must be a number, got {value!r}")
+    if kind is int and not number.is_integer():
+        raise ValueError(f"{key} must be a whole number, got {value!r}")
+    if not low <= number <= high:
+        raise ValueError(f"{key} must be between {low} and {high}, got {value!r}")
+    return int(number) if kind is int else number
+
+def pool_layout(n_variants):
+    """(pool processes, search workers per run) for a sweep of n_variants."""
+    workers = max(1, min(MAX_WORKERS, n_variants))
+    # Share the cores between pool processes instead of every CP-SAT run
+    # starting one search worker per core.
+    return workers, max(1, (os.cpu_count() or 1) // workers)
+
+def run_scenarios(inputs, base_config, variants):
+    """
+    Solves every variant of base_config concurrently in a bounded process pool.
+    `inputs` are the detached (picklable) solver entities. Returns one result
+    dict per variant, in order.
+    """
+    workers, cores_per_run = pool_layout(len(variants))
+    jobs = [(inputs, {**base_config, **overrides, 'SOLVER_NUM_WORKERS': cores_per_run})
+            for overrides in variants]
+
+    # spawn rather than fork: the web process may already hold solver threads
+    with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as pool:
+        outcomes = list(pool.map(_solve_variant, jobs))
+
+    for overrides, outcome in zip(variants, outcomes):
+        outcome['overrides'] = overrides
+    return outcomes
+
+def _solve_variant(job):
+    inputs, config = job
+    stats = {}
+    status, results, obj_value = solve_timetable(*inputs, config=config, stats=stats)
+    return {
+        'status': int(status),
+        'obj_value': obj_value,
+        'penalties': stats.get('penalties', {}),
+        'solve_time': stats['build_time'] + stats['solve_time'],
+        'entries': [[r['subject_id'], r['room_id'], r['group_id'], r['day'], r['slot']] for r in results],
+    }
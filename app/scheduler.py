@@ -0,0 +1,133 @@
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+
+class SolveQuotaExceeded(Exception):
+    """Raised when a tenant has used up its solver CPU-seconds for the current window."""
+
+    def __init__(self, retry_after):
+        super().__init__(f"Solver quota exceeded. Try again in {int(retry_after) + 1} seconds.")
+        self.retry_after = retry_after
+
+class SolveScheduler:
+    """
+    Admission control for solver runs inside one host process.
+
+    - Single-flight: concurrent requests with the same (tenant, key) share
+      one run; followers wait for the owner's result instead of solving again.
+    - At most `max_concurrent` runs execute at once; the rest queue,
+      smallest model first (FIFO among equal sizes).
+    - Each tenant may spend `cpu_quota` CPU-seconds per `quota_window`
+      seconds (0 disables the quota).
+    """
+
+    def __init__(self, max_concurrent, cpu_quota=0, quota_window=3600):
+        self.max_concurrent = max_concurrent
+        self.cpu_quota = cpu_quota
+        self.quota_window = quota_window
+        self._cond = threading.Condition()
+        self._queue = []
+        self._seq = itertools.count()
+        self._inflight = {}
+        self._running = 0
+        self._usage = {}
+        self._waits = deque(maxlen=500)
+        self._counters = {'completed': 0, 'coalesced': 0, 'rejected': 0}
+
+    def run(self, tenant_id, key, size, fn, cores):
+        """
+        Runs fn() under the scheduler and returns (result, coalesced).
+        `size` orders the queue; `cores`, the search workers fn's solves run
+        with, converts wall time into CPU-seconds charged against the tenant's quota.
+        """
+        with self._cond:
+            ticket = self._inflight.get((tenant_id, key))
+            if ticket is not None:
+                self._counters['coalesced'] += 1
+                owner = False
+            else:
+                self._check_quota(tenant_id)
+                ticket = _Ticket()
+                self._inflight[(tenant_id, key)] = ticket
+                heapq.heappush(self._queue, (size, next(self._seq), ticket))
+                owner = True
+                queued_at = time.monotonic()
+                while self._queue[0][2] is not ticket or self._running >= self.max_concurrent:
+                    self._cond.wait()
+                heapq.heappop(self._queue)
+                self._running += 1
+                self._waits.append(time.monotonic() - queued_at)
+                # Let the next queued job re-check whether a slot is still free
+                self._cond.notify_all()
+
+        if not owner:
+            ticket.done.wait()
+        else:
+            started_at = time.monotonic()
+            try:
+                ticket.result = fn()
+            except Exception as e:
+                ticket.error = e
+            finally:
+                elapsed = time.monotonic() - started_at
+                with self._cond:
+                    self._running -= 1
+                    del self._inflight[(tenant_id, key)]
+                    self._usage.setdefault(tenant_id, deque()).append((time.monotonic(), elapsed * cores))
+                    self._counters['completed'] += 1
+                    self._cond.notify_all()
+                ticket.done.set()
+
+        if ticket.error is not None:
+            raise ticket.error
+        return ticket.result, not owner
+
+    def tenant_usage(self, tenant_id):
+        """CPU-seconds the tenant has used in the current quota window."""
+        with self._cond:
+            return self._window_usage(tenant_id)
+
+    def metrics(self):
+        with self._cond:
+            waits = sorted(self._waits)
+            return {
+                'queue_depth': len(self._queue),
+                'running': self._running,
+                'max_concurrent': self.max_concurrent,
+                'in_flight': len(self._inflight),
+                'wait_time_avg': sum(waits) / len(waits) if waits else 0.0,
+                'wait_time_p95': waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                'wait_time_max': waits[-1] if waits else 0.0,
+                **self._counters
+            }
+
+    def _window_usage(self, tenant_id):
+        usage = self._usage.get(tenant_id)
+        if not usage:
+            return 0.0
+        cutoff = time.monotonic() - self.quota_window
+        while usage and usage[0][0] < cutoff:
+            usage.popleft()
+        return sum(cpu for _, cpu in usage)
+
+    def _check_quota(self, tenant_id):
+        if not self.cpu_quota or self._window_usage(tenant_id) < self.cpu_quota:
+            return
+        self._counters['rejected'] += 1
+        oldest = self._usage[tenant_id][0][0]
+        raise SolveQuotaExceeded(oldest + self.quota_window - time.monotonic())
+
+class _Ticket:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+solve_scheduler = SolveScheduler(
+    max_concurrent=int(os.environ.get('SOLVER_MAX_CONCURRENT') or os.cpu_count() or 1),
+    cpu_quota=float(os.environ.get('SOLVER_TENANT_CPU_QUOTA') or 0),
+    quota_window=float(os.environ.get('SOLVER_QUOTA_WINDOW') or 3600)
+)
@@ -0,0 +1,125 @@
+import functools
+import json
+import os
+import secrets
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert, or_, select
+
+from app import db
+from app.models import (User, Department, Faculty, Course, StudentGroup, Room, Subject, Enrollment, TimeSlot,
+                        SystemSetting, TimetableEntry, TimetableVersion, SolutionMemo, TimetableDraft, SolveJob,
+                        SolveRun, ExportJob, Term, TermException, TermOverride)
+
+# A snapshot is a whole institution (entities, settings, time slots and the
+# solved timetable) as compact JSON: per table, a column list and row lists.
+# Restoring inserts each table in bulk into another tenant, remapping ids.
+
+SNAPSHOT_VERSION = 1
+
+# Parents before children, so foreign keys can be remapped as rows go in
+SNAPSHOT_MODELS = (Department, Faculty, Course, StudentGroup, Room, Subject, Enrollment, TimeSlot,
+                   SystemSetting, TimetableEntry)
+
+# Per-tenant rows that are not part of a snapshot but go when the tenant does
+TRANSIENT_MODELS = (TimetableVersion, SolutionMemo, TimetableDraft, SolveJob, SolveRun, ExportJob,
+                    Term, TermException, TermOverride)
+
+DEMO_SNAPSHOT = os.path.join(os.path.dirname(__file__), 'data', 'demo_institution.json')
+# Demo tenants nobody has used for this long are deleted; activity is
+# recorded at most once per DEMO_ACTIVITY_INTERVAL per tenant
+DEMO_IDLE_HOURS = float(os.environ.get('DEMO_IDLE_HOURS') or 24)
+DEMO_ACTIVITY_INTERVAL = timedelta(minutes=5)
+
+def _foreign_keys(table):
+    """column name -> referenced table name, ignoring the tenant column."""
+    return {fk.parent.name: fk.column.table.name for fk in table.foreign_keys
+            if fk.column.table.name != User.__tablename__}
+
+_REFERENCED = {target for model in SNAPSHOT_MODELS for target in _foreign_keys(model.__table__).values()}
+
+def dump_tenant(user_id):
+    tables = {}
+    for model in SNAPSHOT_MODELS:
+        table = model.__table__
+        columns = [c for c in table.columns if c.name != 'user_id']
+        rows = db.session.execute(select(*columns).where(table.c.user_id == user_id).order_by(table.c.id))
+        tables[table.name] = {'columns': [c.name for c in columns], 'rows': [list(row) for row in rows]}
+    return {'version': SNAPSHOT_VERSION, 'tables': tables}
+
+def save_snapshot(snapshot, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(snapshot, f, separators=(',', ':'))
+
+@functools.lru_cache(maxsize=8)
+def load_snapshot(path):
+    with open(path, encoding='utf-8') as f:
+        snapshot = json.load(f)
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        raise ValueError(f"Unsupported snapshot version: {snapshot.get('version')}")
+    return snapshot
+
+def restore_tenant(snapshot, user_id):
+    """
+    Inserts the snapshot's rows for `user_id`: one bulk INSERT per table,
+    with RETURNING for the tables other rows point at (caller commits).
+    """
+    id_maps = {}
+    for model in SNAPSHOT_MODELS:
+        table = model.__table__
+        data = snapshot['tables'].get(table.name)
+        if not data or not data['rows']:
+            id_maps[table.name] = {}
+            continue
+
+        foreign_keys = _foreign_keys(table)
+        old_ids, rows = [], []
+        for values in data['rows']:
+            row = dict(zip(data['columns'], values))
+            old_ids.append(row.pop('id'))
+            for column, target in foreign_keys.items():
+                if row.get(column) is not None:
+                    row[column] = id_maps[target][row[column]]
+            row['user_id'] = user_id
+            rows.append(row)
+
+        if table.name in _REFERENCED:
+            new_ids = db.session.execute(
+                insert(table).returning(table.c.id, sort_by_parameter_order=True), rows).scalars().all()
+            id_maps[table.name] = dict(zip(old_ids, new_ids))
+        else:
+            db.session.execute(insert(table), rows)
+
+def delete_tenant(user_id):
+    """Removes the tenant's rows and the user itself (caller commits)."""
+    for model in reversed(SNAPSHOT_MODELS + TRANSIENT_MODELS):
+        db.session.execute(model.__table__.delete().where(model.__table__.c.user_id == user_id))
+    db.session.execute(User.__table__.delete().where(User.__table__.c.id == user_id))
+
+def create_demo_tenant():
+    """A private copy of the demo institution for one visitor, in a single transaction."""
+    now = datetime.utcnow()
+    user = User(username=f'demo-{secrets.token_hex(6)}', is_demo=True, last_active_at=now)
+    db.session.add(user)
+    db.session.flush()
+    restore_tenant(load_snapshot(DEMO_SNAPSHOT), user.id)
+
+    # Drop the demo tenants that have gone idle (those from before activity was recorded too)
+    stale = (db.session.query(User.id)
+             .filter(User.is_demo.is_(True), User.username.like('demo-%'),
+                     or_(User.last_active_at.is_(None),
+                         User.last_active_at < now - timedelta(hours=DEMO_IDLE_HOURS)))
+             .all())
+    for (stale_id,) in stale:
+        delete_tenant(stale_id)
+
+    db.session.commit()
+    return user
+
+def record_demo_activity(user):
+    """Marks a demo tenant as in use, writing at most once per DEMO_ACTIVITY_INTERVAL."""
+    now = datetime.utcnow()
+    if user.last_active_at is not None and now - user.last_active_at < DEMO_ACTIVITY_INTERVAL:
+        return
+    User.query.filter_by(id=user.id).update({'last_active_at': now})
+    db.session.commit()
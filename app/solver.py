@@ -1,19 +1,286 @@
+import os
+import time
+from types import SimpleNamespace
 from ortools.sat.python import cp_model
+from app.model_cache import model_cache, structural_key
 
-def solve_timetable(subjects, groups, rooms, faculties, time_slots, config=None):
+DEFAULT_CONFIG = {
+    'CONSECUTIVE_LABS_WEIGHT': 100,
+    'MAX_HOURS_PENALTY': 500,
+    'CONSECUTIVE_PENALTY': 10,
+    'SAME_DAY_MULTI_PENALTY': 10,
+    'LECTURES_IN_LABS': False,
+    'MAX_CONSECUTIVE_LECTURES': 3
+}
+
+# Objective weight setting -> default, one per soft-penalty family.
+# Only these change between solves that share a cached model.
+PENALTY_WEIGHTS = {
+    'MAX_HOURS_PENALTY': 500,
+    'CONSECUTIVE_PENALTY': 10,
+    'CONSECUTIVE_LABS_WEIGHT': 100,
+    'SAME_DAY_MULTI_PENALTY': 10,
+}
+
+def solve_timetable(subjects, groups, rooms, faculties, time_slots, config=None, stats=None, hint=None):
     """
     Solves the timetable scheduling problem with dynamic configuration.
+    The compiled model is reused from the model cache when only the
+    penalty weights changed since the last solve.
+    `hint` is an optional previous timetable as (subject_id, group_id,
+    room_id, day, slot) tuples to warm-start from; config['PINNED_ENTRIES']
+    lists assignments in the same shape that the solution must keep.
+    With SOLVER_ADAPTIVE_BUDGET a single solve runs under app.budget's
+    size-based, early-stopping time limit instead of SOLVER_TIME_LIMIT.
+    If a `stats` dict is passed it is filled with solve diagnostics.
     """
     if config is None:
-        config = {
-            'CONSECUTIVE_LABS_WEIGHT': 100,
-            'MAX_HOURS_PENALTY': 500,
-            'CONSECUTIVE_PENALTY': 10,
-            'SAME_DAY_MULTI_PENALTY': 10,
-            'LECTURES_IN_LABS': False,
-            'MAX_CONSECUTIVE_LECTURES': 3
-        }
+        config = dict(DEFAULT_CONFIG)
+    start_time = time.perf_counter()
+
+    key = structural_key(subjects, groups, rooms, faculties, time_slots, config)
+    compiled = model_cache.get(key)
+    cache_hit = compiled is not None
+    if compiled is None:
+        compiled = build_model(subjects, groups, rooms, faculties, time_slots, config)
+        model_cache.put(key, compiled)
+    hint_values = hint_assignment(compiled['index'], hint) if hint else None
+    pinned = pinned_variables(compiled['index'], config.get('PINNED_ENTRIES') or [])
+    build_time = time.perf_counter() - start_time
+
+    # --- Solve ---
+    portfolio_size = int(config.get('SOLVER_PORTFOLIO_SIZE', 0) or 0)
+    if config.get('SOLVER_STAGED'):
+        from app.staged import staged_solve
+        outcome = staged_solve(compiled, config, hint_values, stats, pinned)
+    elif portfolio_size > 1:
+        from app.portfolio import race_portfolio
+        outcome = race_portfolio(compiled, config, portfolio_size, hint_values, stats, pinned)
+    else:
+        model = instantiate_model(compiled)
+        set_objective(model, compiled['index'], config)
+        fix_variables(model, pinned)
+        if hint_values:
+            apply_hint(model, hint_values)
+        solver = new_solver(config)
+        if config.get('SOLVER_ADAPTIVE_BUDGET'):
+            from app.budget import budget_policy, solve_with_budget
+            policy = budget_policy(compiled, config)
+            status, run = solve_with_budget(solver, model, policy)
+            if stats is not None:
+                stats['budget'] = {**policy, **run}
+            outcome = solver_outcome(solver, status)
+        else:
+            outcome = solver_outcome(solver, solver.Solve(model))
+
+    status = outcome['status']
+    obj_value = outcome['obj_value']
+    results = []
+    if outcome['values'] is not None:
+        results = decode_solution(compiled['index'], outcome['values'], subjects, groups, rooms, faculties)
+        if stats is not None:
+            stats['penalties'] = penalty_breakdown(compiled['index'], outcome['values'], config)
+
+    if stats is not None:
+        stats['model_cache_hit'] = cache_hit
+        stats['variables'] = compiled['variables']
+        stats['constraints'] = compiled['constraints']
+        stats['build_time'] = build_time
+        stats['solve_time'] = outcome['wall_time']
+        stats['best_bound'] = outcome['best_bound']
+    return status, results, obj_value
+
+def search_workers(config):
+    """Search workers a solve under this config runs (CP-SAT uses every core when unset)."""
+    return int(config.get('SOLVER_NUM_WORKERS') or os.cpu_count() or 1)
+
+def new_solver(config, num_workers=None):
+    """CpSolver with the time limit and worker count from config."""
+    solver = cp_model.CpSolver()
+    solver.parameters.max_time_in_seconds = float(config.get('SOLVER_TIME_LIMIT', 30))
+    num_workers = num_workers or config.get('SOLVER_NUM_WORKERS')
+    if num_workers:
+        solver.parameters.num_workers = int(num_workers)
+    return solver
+
+def solver_outcome(solver, status):
+    """Snapshot of a finished solve, independent of the solver object."""
+    solved = status == cp_model.OPTIMAL or status == cp_model.FEASIBLE
+    return {
+        'status': status,
+        'values': list(solver.ResponseProto().solution) if solved else None,
+        'obj_value': solver.ObjectiveValue() if solved else None,
+        'best_bound': solver.BestObjectiveBound() if solved else None,
+        'wall_time': solver.WallTime()
+    }
+
+def hint_assignment(index, assignments):
+    """
+    Turns (subject_id, group_id, room_id, day, slot) tuples into a hint
+    over every assignment variable: 1 where assigned, 0 elsewhere.
+    """
+    wanted = set(tuple(a) for a in assignments)
+    slots_per_day = len(index['slots'])
+    hint = []
+    for event in index['events']:
+        if event['x_start'] is None:
+            continue
+        n_rooms = len(event['valid_rooms'])
+        for d, day in enumerate(index['days']):
+            for sl, slot in enumerate(index['slots']):
+                base = event['x_start'] + (d * slots_per_day + sl) * n_rooms
+                for r_pos, r_id in enumerate(event['valid_rooms']):
+                    assigned = any((event['subject_id'], group_id, r_id, day, slot) in wanted
+                                   for group_id in event['group_ids'])
+                    hint.append((base + r_pos, 1 if assigned else 0))
+    return hint
+
+def pinned_variables(index, pins):
+    """
+    Proto indexes of the assignment variables for (subject_id, group_id,
+    room_id, day, slot) pins. Pins the model has no variable for (the room
+    no longer fits, the slot was removed) are dropped.
+    """
+    events = {(e['subject_id'], group_id): e for e in index['events'] if e['x_start'] is not None
+              for group_id in e['group_ids']}
+    day_pos = {day: d for d, day in enumerate(index['days'])}
+    slot_pos = {slot: sl for sl, slot in enumerate(index['slots'])}
+    slots_per_day = len(index['slots'])
+    var_indexes = []
+    for subject_id, group_id, room_id, day, slot in pins:
+        event = events.get((subject_id, group_id))
+        if event is None or room_id not in event['valid_rooms'] or day not in day_pos or slot not in slot_pos:
+            continue
+        base = event['x_start'] + (day_pos[day] * slots_per_day + slot_pos[slot]) * len(event['valid_rooms'])
+        var_indexes.append(base + event['valid_rooms'].index(room_id))
+    return var_indexes
+
+def fix_variables(model, var_indexes):
+    """Fixes the given Boolean variables of the model to 1."""
+    for var_index in var_indexes:
+        domain = model.Proto().variables[var_index].domain
+        del domain[:]
+        domain.extend([1, 1])
+
+def apply_hint(model, hint):
+    """Sets the model's solution hint from (var_index, value) pairs."""
+    solution_hint = model.Proto().solution_hint
+    solution_hint.Clear()
+    solution_hint.vars.extend(var_index for var_index, _ in hint)
+    solution_hint.values.extend(value for _, value in hint)
+
+def penalty_breakdown(index, values, config):
+    """Weighted contribution of each soft-penalty family to the objective."""
+    return {
+        weight_key: config.get(weight_key, default) * sum(values[i] for i in index['penalties'][weight_key])
+        for weight_key, default in PENALTY_WEIGHTS.items()
+    }
+
+# Rough memory of building and solving a model, from measured peak RSS
+# growth: a fixed overhead plus a per-variable and per-constraint cost, and a
+# further per-variable cost for every search worker beyond the first.
+MODEL_BASE_MB = 24
+MODEL_KB_PER_VARIABLE = 1.7
+MODEL_KB_PER_CONSTRAINT = 1.0
+MODEL_KB_PER_VARIABLE_PER_EXTRA_WORKER = 0.25
+
+def estimate_model_footprint(subjects, groups, rooms, faculties, time_slots, config, num_workers=1):
+    """
+    Variable and constraint counts build_model would produce for these
+    inputs and settings, per family, plus the expected memory in MB,
+    counted from entity sizes alone without building anything.
+    """
+    if time_slots:
+        num_days = len(set(ts.day for ts in time_slots))
+        slots_per_day = len(set(ts.slot_number for ts in time_slots))
+    else:
+        num_days, slots_per_day = 6, 8
+    periods = num_days * slots_per_day
+    lectures_in_labs = config.get('LECTURES_IN_LABS', False)
+
+    groups_by_course = {}
+    for g in groups:
+        groups_by_course.setdefault(g.course_id, []).append(g)
+    events = []  # (subject, group ids, valid room ids)
+    for s in subjects:
+        course_groups = groups_by_course.get(s.course_id, [])
+        if not course_groups:
+            continue
+        for members in ([course_groups] if s.is_shared else [[g] for g in course_groups]):
+            size = sum(g.size for g in members)
+            valid = [r.id for r in rooms
+                     if not (s.is_lab and r.type != 'lab')
+                     and not (not s.is_lab and r.type == 'lab' and not lectures_in_labs)
+                     and r.capacity >= size]
+            events.append((s, [g.id for g in members], valid))
+
+    busy_groups = {g_id for _, members, _ in events for g_id in members}
+    busy_faculties = {s.faculty_id for s, _, _ in events if s.faculty_id is not None} & {f.id for f in faculties}
+    used_rooms = {r_id for _, _, valid in events for r_id in valid}
+    n_events = len(events)
+
+    families = {}  # family -> (variables, constraints)
+    families['assignment'] = (sum(len(valid) for _, _, valid in events) * periods, 0)
+    families['occupancy'] = (n_events * periods + n_events * num_days
+                             + (len(busy_groups) + len(busy_faculties)) * periods,
+                             n_events * periods + n_events * num_days
+                             + (len(busy_groups) + len(busy_faculties)) * periods)
+    families['hard'] = (0, n_events + len(used_rooms) * periods)
+
+    cliques = config.get('SUBJECT_CONFLICTS') or []
+    if cliques:
+        sections = {}
+        for s, _, _ in events:
+            sections[s.id] = sections.get(s.id, 0) + 1
+        in_cliques = {subject_id for clique in cliques for subject_id in clique}
+        split = sum(1 for subject_id in in_cliques if sections.get(subject_id, 0) > 1)
+        # build_model skips cliques with fewer than two scheduled subjects
+        constrained = sum(1 for clique in cliques if sum(1 for subject_id in clique if subject_id in sections) > 1)
+        families['electives'] = (split * periods, split * periods + constrained * periods)
+
+    if config.get('CONSTRAINT_FACULTY_MAX_HOURS_ENABLED', True):
+        families['MAX_HOURS_PENALTY'] = (len(busy_faculties), len(busy_faculties))
+    max_consecutive = config.get('MAX_CONSECUTIVE_LECTURES', 3)
+    if config.get('CONSTRAINT_FACULTY_CONSECUTIVE_ENABLED', True):
+        windows = len(busy_faculties) * num_days * max(0, slots_per_day - max_consecutive)
+        families['CONSECUTIVE_PENALTY'] = (windows, 2 * windows)
+    if config.get('CONSTRAINT_LAB_CONSECUTIVE_ENABLED', True):
+        labs = sum(1 for s, _, _ in events if s.is_lab) * num_days * max(0, slots_per_day - 2)
+        families['CONSECUTIVE_LABS_WEIGHT'] = (labs, 2 * labs)
+    if config.get('CONSTRAINT_SUBJECT_DISTRIBUTION_ENABLED', True):
+        spread = sum(1 for s, _, _ in events if not s.is_lab and s.hours_per_week <= num_days) * num_days
+        families['SAME_DAY_MULTI_PENALTY'] = (spread, 2 * spread)
+
+    variables = sum(v for v, _ in families.values())
+    constraints = sum(c for _, c in families.values())
+    extra_workers = max(int(num_workers or 1) - 1, 0)
+    kb_per_variable = MODEL_KB_PER_VARIABLE + extra_workers * MODEL_KB_PER_VARIABLE_PER_EXTRA_WORKER
+    memory_mb = MODEL_BASE_MB + (variables * kb_per_variable + constraints * MODEL_KB_PER_CONSTRAINT) / 1024
+    return {'variables': variables, 'constraints': constraints, 'memory_mb': round(memory_mb, 1),
+            'families': {name: {'variables': v, 'constraints': c} for name, (v, c) in families.items()}}
+
+def detach_entities(subjects, groups, rooms, faculties, time_slots):
+    """
+    Copies the attributes the solver reads into plain records, so inputs
+    can be pickled to worker processes without their ORM session.
+    """
+    return (
+        [SimpleNamespace(id=s.id, name=s.name, course_id=s.course_id, hours_per_week=s.hours_per_week,
+                         faculty_id=s.faculty_id, is_lab=bool(s.is_lab), is_shared=bool(s.is_shared))
+         for s in subjects],
+        [SimpleNamespace(id=g.id, name=g.name, course_id=g.course_id, size=g.size) for g in groups],
+        [SimpleNamespace(id=r.id, name=r.name, capacity=r.capacity, type=r.type) for r in rooms],
+        [SimpleNamespace(id=f.id, name=f.name, max_hours_per_week=f.max_hours_per_week) for f in faculties],
+        [SimpleNamespace(day=ts.day, slot_number=ts.slot_number,
+                         start_time=ts.start_time, end_time=ts.end_time) for ts in time_slots],
+    )
 
+def build_model(subjects, groups, rooms, faculties, time_slots, config):
+    """
+    Builds the structural CP-SAT model (variables and constraints, no objective).
+    Returns a cacheable dict: the serialized model proto plus a plain-data
+    index locating the assignment and penalty variables by proto index.
+    """
     model = cp_model.CpModel()
 
     # Determine time grid from time_slots or defaults
@@ -37,10 +304,13 @@ def solve_timetable(subjects, groups, rooms, faculties, time_slots, config=None)
         course_groups = [g for g in groups if g.course_id == s.course_id]
         if not course_groups:
              continue
-        for g in course_groups:
+        # A shared subject is one combined section attended by every group of its course
+        sections = [course_groups] if s.is_shared else [[g] for g in course_groups]
+        for members in sections:
              class_events.append({
                  'subject': s,
-                 'group': g,
+                 'groups': members,
+                 'size': sum(g.size for g in members),
                  'hours': s.hours_per_week,
                  'faculty_id': s.faculty_id
              })
@@ -49,14 +319,13 @@ def solve_timetable(subjects, groups, rooms, faculties, time_slots, config=None)
     x = {}
     for e_idx, event in enumerate(class_events):
         s = event['subject']
-        g = event['group']
         
         event_valid_rooms = []
         for r in rooms:
             if s.is_lab and r.type != 'lab': continue
             # If config allows, lectures can happen in labs
             if not s.is_lab and r.type == 'lab' and not config.get('LECTURES_IN_LABS', False): continue
-            if r.capacity < g.size: continue
+            if r.capacity < event['size']: continue
             event_valid_rooms.append(r.id)
             
         event['valid_rooms'] = event_valid_rooms
@@ -66,151 +335,231 @@ def solve_timetable(subjects, groups, rooms, faculties, time_slots, config=None)
                 for r_id in event_valid_rooms:
                     x[(e_idx, d, sl, r_id)] = model.NewBoolVar(f'x_e{e_idx}_d{d}_s{sl}_r{r_id}')
 
+    # Index events by the entity they occupy so each aggregate below only
+    # visits its own events instead of rescanning the whole event list.
+    events_by_group = {}
+    events_by_faculty = {}
+    events_by_room = {}
+    for e_idx, event in enumerate(class_events):
+        for g in event['groups']:
+            events_by_group.setdefault(g.id, []).append(e_idx)
+        if event['faculty_id'] is not None:
+            events_by_faculty.setdefault(event['faculty_id'], []).append(e_idx)
+        for r_id in event['valid_rooms']:
+            events_by_room.setdefault(r_id, []).append(e_idx)
+
+    # --- Occupancy aggregates ---
+    # Every constraint family and penalty below is written against these
+    # instead of re-summing the raw room-level x variables.
+
+    # at[e, d, sl]: event e is held (in any room) at day d, slot sl
+    at = {}
+    for e_idx, event in enumerate(class_events):
+        for d in all_days:
+            for sl in all_slots:
+                at[(e_idx, d, sl)] = model.NewBoolVar(f'at_e{e_idx}_d{d}_s{sl}')
+                model.Add(at[(e_idx, d, sl)] == sum(x[(e_idx, d, sl, r)] for r in event['valid_rooms']))
+
+    # event_day_count[e, d]: number of hours of event e on day d
+    event_day_count = {}
+    for e_idx, event in enumerate(class_events):
+        for d in all_days:
+            event_day_count[(e_idx, d)] = model.NewIntVar(0, slots_per_day, f'day_count_e{e_idx}_d{d}')
+            model.Add(event_day_count[(e_idx, d)] == sum(at[(e_idx, d, sl)] for sl in all_slots))
+
+    # group_busy[g, d, sl] / faculty_busy[f, d, sl]: being Boolean, they also
+    # carry the "one class at a time" limit for groups and faculty.
+    group_busy = {}
+    for g in groups:
+        g_events = events_by_group.get(g.id, [])
+        if not g_events:
+            continue
+        for d in all_days:
+            for sl in all_slots:
+                group_busy[(g.id, d, sl)] = model.NewBoolVar(f'group_busy_g{g.id}_d{d}_s{sl}')
+                model.Add(group_busy[(g.id, d, sl)] == sum(at[(e_idx, d, sl)] for e_idx in g_events))
+
+    faculty_busy = {}
+    for f in faculties:
+        f_events = events_by_faculty.get(f.id, [])
+        if not f_events:
+            continue
+        for d in all_days:
+            for sl in all_slots:
+                faculty_busy[(f.id, d, sl)] = model.NewBoolVar(f'faculty_busy_f{f.id}_d{d}_s{sl}')
+                model.Add(faculty_busy[(f.id, d, sl)] == sum(at[(e_idx, d, sl)] for e_idx in f_events))
+
     # --- Constraints ---
 
     # 1. Each event assigned exactly 'hours' times
     for e_idx, event in enumerate(class_events):
-        model.Add(sum(x[(e_idx, d, sl, r)] 
-                      for d in all_days 
-                      for sl in all_slots 
-                      for r in event['valid_rooms']) == event['hours'])
+        model.Add(sum(event_day_count[(e_idx, d)] for d in all_days) == event['hours'])
 
     # 2. A room cannot host two classes at same time
     for d in all_days:
         for sl in all_slots:
             for r in rooms:
-                room_assignments = []
-                for e_idx, event in enumerate(class_events):
-                    if r.id in event['valid_rooms']:
-                        room_assignments.append(x[(e_idx, d, sl, r.id)])
-                model.Add(sum(room_assignments) <= 1)
+                room_assignments = [x[(e_idx, d, sl, r.id)] for e_idx in events_by_room.get(r.id, [])]
+                if room_assignments:
+                    model.AddAtMostOne(room_assignments)
 
     # 3. A student group cannot attend two classes at same time
-    for g in groups:
-        for d in all_days:
-            for sl in all_slots:
-                group_assignments = []
-                for e_idx, event in enumerate(class_events):
-                    if event['group'].id == g.id:
-                        for r in event['valid_rooms']:
-                            group_assignments.append(x[(e_idx, d, sl, r)])
-                model.Add(sum(group_assignments) <= 1)
-
     # 4. Faculty cannot teach two classes at same time
-    for f in faculties:
+    # (both enforced by the Boolean group_busy / faculty_busy aggregates above)
+
+    # 5. Subjects sharing enrolled students (electives) never run at the same time:
+    # one AtMostOne per clique of the conflict graph and period
+    conflict_cliques = config.get('SUBJECT_CONFLICTS') or []
+    if conflict_cliques:
+        events_by_subject = {}
+        for e_idx, event in enumerate(class_events):
+            events_by_subject.setdefault(event['subject'].id, []).append(e_idx)
+        subject_busy = {}
         for d in all_days:
             for sl in all_slots:
-                faculty_assignments = []
-                for e_idx, event in enumerate(class_events):
-                    if event['faculty_id'] == f.id:
-                        for r in event['valid_rooms']:
-                            faculty_assignments.append(x[(e_idx, d, sl, r)])
-                model.Add(sum(faculty_assignments) <= 1)
-
-    # 5. Heavy penalty for exceeding faculty weekly hours limit (now a soft constraint but very heavy)
-    obj_terms = []
+                for clique in conflict_cliques:
+                    members = []
+                    for subject_id in clique:
+                        s_events = events_by_subject.get(subject_id)
+                        if not s_events:
+                            continue
+                        if len(s_events) == 1:
+                            members.append(at[(s_events[0], d, sl)])
+                            continue
+                        # A subject taught to several groups separately is busy if any section is
+                        if (subject_id, d, sl) not in subject_busy:
+                            busy = model.NewBoolVar(f'subject_busy_s{subject_id}_d{d}_s{sl}')
+                            model.AddMaxEquality(busy, [at[(e_idx, d, sl)] for e_idx in s_events])
+                            subject_busy[(subject_id, d, sl)] = busy
+                        members.append(subject_busy[(subject_id, d, sl)])
+                    if len(members) > 1:
+                        model.AddAtMostOne(members)
+
+    # 6. Heavy penalty for exceeding faculty weekly hours limit (now a soft constraint but very heavy)
+    penalties = {weight_key: [] for weight_key in PENALTY_WEIGHTS}
     if config.get('CONSTRAINT_FACULTY_MAX_HOURS_ENABLED', True):
         for f in faculties:
-            faculty_total_hours = []
-            for e_idx, event in enumerate(class_events):
-                if event['faculty_id'] == f.id:
-                     for d in all_days:
-                        for sl in all_slots:
-                            for r in event['valid_rooms']:
-                                faculty_total_hours.append(x[(e_idx, d, sl, r)])
-            if faculty_total_hours:
-                 excess_hours = model.NewIntVar(0, slots_per_day * num_days, f'excess_hours_f{f.id}')
-                 model.Add(excess_hours >= sum(faculty_total_hours) - f.max_hours_per_week)
-                 obj_terms.append(excess_hours * config.get('MAX_HOURS_PENALTY', 500))
-
-    # --- Soft Constraints & Objective ---
-    consecutive_penalty_weight = config.get('CONSECUTIVE_PENALTY', 10)
-    same_day_multi_penalty_weight = config.get('SAME_DAY_MULTI_PENALTY', 10)
+            if f.id not in events_by_faculty:
+                continue
+            faculty_total_hours = sum(faculty_busy[(f.id, d, sl)] for d in all_days for sl in all_slots)
+            excess_hours = model.NewIntVar(0, slots_per_day * num_days, f'excess_hours_f{f.id}')
+            model.Add(excess_hours >= faculty_total_hours - f.max_hours_per_week)
+            penalties['MAX_HOURS_PENALTY'].append(excess_hours.Index())
+
+    # --- Soft Constraints ---
     max_consecutive = config.get('MAX_CONSECUTIVE_LECTURES', 3)
 
     # 1. Avoid > MAX_CONSECUTIVE lectures
     if config.get('CONSTRAINT_FACULTY_CONSECUTIVE_ENABLED', True):
         for f in faculties:
+            if f.id not in events_by_faculty:
+                continue
             for d in all_days:
                 for start_slot in range(slots_per_day - max_consecutive):
-                    window_assignments = []
-                    for delta in range(max_consecutive + 1):
-                        sl = start_slot + delta
-                        for e_idx, event in enumerate(class_events):
-                             if event['faculty_id'] == f.id:
-                                 for r in event['valid_rooms']:
-                                     window_assignments.append(x[(e_idx, d, sl, r)])
+                    window_load = sum(faculty_busy[(f.id, d, start_slot + delta)]
+                                      for delta in range(max_consecutive + 1))
                     
                     is_overworked = model.NewBoolVar(f'overwork_f{f.id}_d{d}_s{start_slot}')
-                    model.Add(sum(window_assignments) > max_consecutive).OnlyEnforceIf(is_overworked)
-                    model.Add(sum(window_assignments) <= max_consecutive).OnlyEnforceIf(is_overworked.Not())
-                    obj_terms.append(is_overworked * consecutive_penalty_weight)
+                    model.Add(window_load > max_consecutive).OnlyEnforceIf(is_overworked)
+                    model.Add(window_load <= max_consecutive).OnlyEnforceIf(is_overworked.Not())
+                    penalties['CONSECUTIVE_PENALTY'].append(is_overworked.Index())
 
     # 2. Distribute subject hours or group them (if Lab)
     for e_idx, event in enumerate(class_events):
         s = event['subject']
         for d in all_days:
-            day_assignments = []
-            for sl in all_slots:
-                for r in event['valid_rooms']:
-                    day_assignments.append(x[(e_idx, d, sl, r)])
-            
             if s.is_lab and config.get('CONSTRAINT_LAB_CONSECUTIVE_ENABLED', True):
                 # For labs, we WANT them together if scheduled on same day
                 # We penalize fragmentation: if scheduled at sl and sl+2 but NOT sl+1
                 for sl in range(slots_per_day - 2):
                     # fragments = is_sl AND (NOT is_sl+1) AND is_sl+2
-                    at_sl = model.NewBoolVar(f'at_sl_{e_idx}_{d}_{sl}')
-                    model.Add(at_sl == sum(x[(e_idx, d, sl, r)] for r in event['valid_rooms']))
-                    
-                    at_sl_plus_1 = model.NewBoolVar(f'at_sl1_{e_idx}_{d}_{sl}')
-                    model.Add(at_sl_plus_1 == sum(x[(e_idx, d, sl+1, r)] for r in event['valid_rooms']))
-                    
-                    at_sl_plus_2 = model.NewBoolVar(f'at_sl2_{e_idx}_{d}_{sl}')
-                    model.Add(at_sl_plus_2 == sum(x[(e_idx, d, sl+2, r)] for r in event['valid_rooms']))
-                    
                     is_fragmented = model.NewBoolVar(f'fragment_{e_idx}_{d}_{sl}')
-                    # (at_sl AND NOT at_sl1 AND at_sl2) -> is_fragmented
-                    model.AddBoolAnd([at_sl, at_sl_plus_1.Not(), at_sl_plus_2]).OnlyEnforceIf(is_fragmented)
-                    obj_terms.append(is_fragmented * config.get('CONSECUTIVE_LABS_WEIGHT', 100))
+                    # (at_sl AND NOT at_sl1 AND at_sl2) <-> is_fragmented
+                    pattern = [at[(e_idx, d, sl)], at[(e_idx, d, sl + 1)].Not(), at[(e_idx, d, sl + 2)]]
+                    model.AddBoolAnd(pattern).OnlyEnforceIf(is_fragmented)
+                    model.AddBoolOr([lit.Not() for lit in pattern] + [is_fragmented])
+                    penalties['CONSECUTIVE_LABS_WEIGHT'].append(is_fragmented.Index())
             elif not s.is_lab and config.get('CONSTRAINT_SUBJECT_DISTRIBUTION_ENABLED', True):
                 # For lectures, we generally want to distribute them (avoid > 1 per day if hours <= days)
                 if event['hours'] <= num_days:
                     is_clustered = model.NewBoolVar(f'cluster_e{e_idx}_d{d}')
-                    model.Add(sum(day_assignments) > 1).OnlyEnforceIf(is_clustered)
-                    model.Add(sum(day_assignments) <= 1).OnlyEnforceIf(is_clustered.Not())
-                    obj_terms.append(is_clustered * same_day_multi_penalty_weight)
+                    model.Add(event_day_count[(e_idx, d)] > 1).OnlyEnforceIf(is_clustered)
+                    model.Add(event_day_count[(e_idx, d)] <= 1).OnlyEnforceIf(is_clustered.Not())
+                    penalties['SAME_DAY_MULTI_PENALTY'].append(is_clustered.Index())
 
-    model.Minimize(sum(obj_terms))
+    # Assignment variables are created event by event in (day, slot, room)
+    # order, so one start offset per event is enough to locate any of them.
+    index = {
+        'days': days_map,
+        'slots': slots_map,
+        'events': [
+            {
+                'subject_id': event['subject'].id,
+                'group_ids': [g.id for g in event['groups']],
+                'faculty_id': event['faculty_id'],
+                'valid_rooms': event['valid_rooms'],
+                'x_start': x[(e_idx, 0, 0, event['valid_rooms'][0])].Index() if event['valid_rooms'] else None
+            }
+            for e_idx, event in enumerate(class_events)
+        ],
+        'penalties': penalties
+    }
+    proto = model.Proto()
+    return {'proto': proto.SerializeToString(), 'index': index,
+            'variables': len(proto.variables), 'constraints': len(proto.constraints)}
 
-    # --- Solve ---
-    solver = cp_model.CpSolver()
-    solver.parameters.max_time_in_seconds = float(config.get('SOLVER_TIME_LIMIT', 30))
-    status = solver.Solve(model)
+def instantiate_model(compiled):
+    """Returns a fresh CpModel holding a copy of a compiled model."""
+    model = cp_model.CpModel()
+    model.Proto().ParseFromString(compiled['proto'])
+    return model
+
+def set_objective(model, index, config):
+    """(Re)writes the objective as the config-weighted sum of the penalty variables."""
+    objective = model.Proto().objective
+    objective.Clear()
+    for weight_key, default in PENALTY_WEIGHTS.items():
+        weight = config.get(weight_key, default)
+        for var_index in index['penalties'][weight_key]:
+            objective.vars.append(var_index)
+            objective.coeffs.append(weight)
+
+def decode_solution(index, values, subjects, groups, rooms, faculties):
+    """Turns solver variable values into timetable entries."""
+    subject_by_id = {s.id: s for s in subjects}
+    group_by_id = {g.id: g for g in groups}
+    room_names = {r.id: r.name for r in rooms}
+    faculty_names = {f.id: f.name for f in faculties}
+    slots_per_day = len(index['slots'])
 
     results = []
-    obj_value = None
-    if status == cp_model.OPTIMAL or status == cp_model.FEASIBLE:
-        obj_value = solver.ObjectiveValue()
-        for e_idx, event in enumerate(class_events):
-            for d in all_days:
-                for sl in all_slots:
-                    for r_id in event['valid_rooms']:
-                        if solver.Value(x[(e_idx, d, sl, r_id)]):
+    for event in index['events']:
+        if event['x_start'] is None:
+            continue
+        subject = subject_by_id[event['subject_id']]
+        members = [group_by_id[group_id] for group_id in event['group_ids']]
+        n_rooms = len(event['valid_rooms'])
+        for d, day in enumerate(index['days']):
+            for sl, slot in enumerate(index['slots']):
+                base = event['x_start'] + (d * slots_per_day + sl) * n_rooms
+                for r_pos, r_id in enumerate(event['valid_rooms']):
+                    if values[base + r_pos]:
+                        # One entry per attending group; a shared section has several
+                        for group in members:
                             results.append({
-                                'day': days_map[d],
-                                'slot': slots_map[sl],
-                                'subject': event['subject'].name,
-                                'room': next(r.name for r in rooms if r.id == r_id),
-                                'faculty': next(f.name for f in faculties if f.id == event['faculty_id']),
-                                'group': event['group'].name,
-                                'subject_id': event['subject'].id,
+                                'day': day,
+                                'slot': slot,
+                                'subject': subject.name,
+                                'room': room_names[r_id],
+                                'faculty': faculty_names.get(event['faculty_id'], 'N/A'),
+                                'group': group.name,
+                                'subject_id': subject.id,
                                 'room_id': r_id,
-                                'group_id': event['group'].id,
+                                'group_id': group.id,
                                 'day_idx': d, 
                                 'slot_idx': sl
                             })
-    return status, results, obj_value
+    return results
 
 def analyze_constraints(subjects, groups, rooms, faculties, time_slots):
     """
@@ -234,7 +583,7 @@ def analyze_constraints(subjects, groups, rooms, faculties, time_slots):
     for s in subjects:
         course_groups = [g for g in groups if g.course_id == s.course_id]
         if course_groups:
-             total_course_hours += s.hours_per_week * len(course_groups)
+             total_course_hours += s.hours_per_week * (1 if s.is_shared else len(course_groups))
     
     total_room_slots = len(rooms) * total_slots
     if total_course_hours > total_room_slots:
@@ -246,7 +595,7 @@ def analyze_constraints(subjects, groups, rooms, faculties, time_slots):
     for s in subjects:
          course_groups = [g for g in groups if g.course_id == s.course_id]
          if course_groups:
-             hrs = s.hours_per_week * len(course_groups)
+             hrs = s.hours_per_week * (1 if s.is_shared else len(course_groups))
              if s.is_lab: lab_hours += hrs
              else: lecture_hours += hrs
              
@@ -285,4 +634,13 @@ def analyze_constraints(subjects, groups, rooms, faculties, time_slots):
         if has_lecture and g.size > max_lecture_capacity:
             reasons.append(f"CRITICAL: Group '{g.name}' (Size: {g.size}) is too large for any Lecture room (Max Cap: {max_lecture_capacity}).")
 
+    # 5. Shared sections need a room for all their groups at once
+    for s in subjects:
+        if not s.is_shared:
+            continue
+        combined = sum(g.size for g in groups if g.course_id == s.course_id)
+        max_capacity = max_lab_capacity if s.is_lab else max_lecture_capacity
+        if combined > max_capacity:
+            reasons.append(f"CRITICAL: Shared subject '{s.name}' seats {combined} students together, but the largest {'Lab' if s.is_lab else 'Lecture'} room holds {max_capacity}.")
+
     return reasons
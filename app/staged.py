@@ -0,0 +1,78 @@
+import time
+
+from ortools.sat.python import cp_model
+
+from app.portfolio import SOFT_PENALTIES
+from app.solver import (PENALTY_WEIGHTS, apply_hint, fix_variables, instantiate_model, new_solver,
+                        penalty_breakdown, set_objective, solver_outcome)
+
+# Lexicographic solving: each stage minimizes only its penalty families, then
+# its result becomes an upper bound for every later stage, which starts from
+# the previous solution. Faculty max-hours excess goes first, so the search is
+# not spent trading it against the small soft penalties.
+OBJECTIVE_STAGES = (('MAX_HOURS_PENALTY',), tuple(SOFT_PENALTIES))
+
+def staged_solve(compiled, config, hint=None, stats=None, pinned=None):
+    """
+    Solves the compiled model stage by stage within one SOLVER_TIME_LIMIT.
+    Every stage but the last gets SOLVER_STAGE_TIME_SHARE of the time left,
+    and the last gets the rest, so a stage proven optimal early hands its
+    time on. Returns the outcome in the same shape as solver_outcome(), with
+    the objective priced under the full weighted sum. A lexicographic optimum
+    need not be optimal for that sum, so a solution is only ever FEASIBLE and
+    has no best_bound.
+    """
+    index = compiled['index']
+    share = min(max(float(config.get('SOLVER_STAGE_TIME_SHARE', 0.3)), 0.05), 0.95)
+    deadline = time.monotonic() + float(config.get('SOLVER_TIME_LIMIT', 30))
+
+    model = instantiate_model(compiled)
+    fix_variables(model, pinned or [])
+    if hint:
+        apply_hint(model, hint)
+
+    best, report, wall_time = None, [], 0.0
+    for number, families in enumerate(OBJECTIVE_STAGES, 1):
+        stage_config = {**config, **{k: 0 for k in PENALTY_WEIGHTS if k not in families}}
+        set_objective(model, index, stage_config)
+
+        solver = new_solver(config)
+        remaining = max(0.0, deadline - time.monotonic())
+        solver.parameters.max_time_in_seconds = remaining if number == len(OBJECTIVE_STAGES) else remaining * share
+        outcome = solver_outcome(solver, solver.Solve(model))
+        wall_time += outcome['wall_time']
+        report.append({'stage': number, 'penalties': list(families), 'status': int(outcome['status']),
+                       'objective': outcome['obj_value'], 'wall_time': outcome['wall_time']})
+
+        if outcome['values'] is None:
+            if outcome['status'] in (cp_model.INFEASIBLE, cp_model.MODEL_INVALID) or number == len(OBJECTIVE_STAGES):
+                break
+            # No solution within this stage's share: go on unbounded with the time left
+            continue
+
+        best = outcome
+        # Later stages may not do worse on this stage's penalties, and start from its solution
+        _bound_objective(model, index, stage_config, outcome['obj_value'])
+        apply_hint(model, list(enumerate(outcome['values'])))
+
+    if best is None:
+        best = dict(outcome)
+    else:
+        best = dict(best, status=cp_model.FEASIBLE, best_bound=None)
+        best['obj_value'] = sum(penalty_breakdown(index, best['values'], config).values())
+    best['wall_time'] = wall_time
+    if stats is not None:
+        stats['stages'] = report
+    return best
+
+def _bound_objective(model, index, config, upper):
+    """Adds `weighted penalties <= upper` for the families weighted in `config`."""
+    linear = model.Proto().constraints.add().linear
+    for weight_key, default in PENALTY_WEIGHTS.items():
+        weight = config.get(weight_key, default)
+        if not weight:
+            continue
+        for var_index in index['penalties'][weight_key]:
+            linear.vars.append(var_index)
+            linear.coeffs.append(weight)
+    linear.domain.extend([0, int(round(upper))])
@@ -0,0 +1,350 @@
+import calendar
+import json
+from datetime import datetime, timedelta
+
+from ortools.sat.python import cp_model
+
+from app import db
+from app.editing import tenant_timetable
+from app.history import apply_payload, diff_assignments, pack_delta, pack_flat, pack_full, unpack_flat
+from app.models import Term, TermException, TermOverride, TimetableEntry
+from app.profiling import record_phase
+from app.solver import new_solver
+
+# Term planning: a term is the tenant's weekly timetable (the template) plus
+# exceptions that apply to some of its weeks. Weeks with the same set of
+# exceptions get one plan: the classes an exception displaces (a day off, a
+# closed room) are re-placed by a small CP-SAT repair model around the rest
+# of the template, which stays fixed. Each plan is stored as one
+# TermOverride, a delta against the template, so a term costs one template
+# plus one delta per distinct kind of week, however many weeks it has.
+
+EXCEPTION_KINDS = ('no_classes', 'day_off', 'room_closed', 'subject_off')
+MAX_TERM_WEEKS = 60
+
+# Repair objective: a class left unplaced outweighs any move, and moving it
+# to another day outweighs another slot, which outweighs another room
+UNPLACED_COST = 100
+DAY_CHANGE_COST = 4
+SAME_DAY_REPEAT_COST = 3
+SLOT_CHANGE_COST = 2
+ROOM_CHANGE_COST = 1
+
+def parse_weeks(spec, term_weeks):
+    """'3', '3-5,9', 'odd', 'even' or 'all' -> sorted week numbers within 1..term_weeks."""
+    weeks = set()
+    for part in filter(None, (p.strip().lower() for p in str(spec).split(','))):
+        if part in ('all', 'odd', 'even'):
+            weeks.update(w for w in range(1, term_weeks + 1)
+                         if part == 'all' or (w % 2 == 1) == (part == 'odd'))
+            continue
+        first, _, last = part.partition('-')
+        try:
+            first, last = int(first), int(last or first)
+        except ValueError:
+            raise ValueError(f"Invalid weeks: '{part}'")
+        if not 1 <= first <= last <= term_weeks:
+            raise ValueError(f"Weeks '{part}' are outside the term's 1-{term_weeks}")
+        weeks.update(range(first, last + 1))
+    if not weeks:
+        raise ValueError("No weeks given")
+    return sorted(weeks)
+
+def live_assignments(user_id):
+    return {tuple(row) for row in db.session.query(TimetableEntry.subject_id, TimetableEntry.group_id,
+                                                   TimetableEntry.room_id, TimetableEntry.day, TimetableEntry.slot)
+            .filter_by(user_id=user_id)}
+
+def create_term(user_id, name, start_date, weeks):
+    """A new term whose template is the current timetable (caller commits). Raises ValueError."""
+    if not name:
+        raise ValueError("A term needs a name")
+    if not 1 <= weeks <= MAX_TERM_WEEKS:
+        raise ValueError(f"A term has 1 to {MAX_TERM_WEEKS} weeks")
+    template = live_assignments(user_id)
+    if not template:
+        raise ValueError("Generate a weekly timetable first; it becomes the term's template")
+    term = Term(user_id=user_id, name=name, start_date=start_date, weeks=weeks,
+                template=json.dumps(pack_full(template), separators=(',', ':')), template_entries=len(template))
+    db.session.add(term)
+    db.session.flush()
+    return term
+
+def add_exception(user_id, term, data, days):
+    """
+    Adds an exception from request data: kind, weeks (or a date, which
+    stands for its week and day), day, room_id, subject_id, note (caller
+    commits). Raises ValueError.
+    """
+    kind = data.get('kind')
+    if kind not in EXCEPTION_KINDS:
+        raise ValueError(f"Unknown exception kind '{kind}' (choose from {', '.join(EXCEPTION_KINDS)})")
+    weeks, day = data.get('weeks'), data.get('day') or None
+    if data.get('date'):
+        try:
+            on = datetime.strptime(data['date'], '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError("Dates are YYYY-MM-DD")
+        weeks = str((on - week_start(term, 1)).days // 7 + 1)
+        day = calendar.day_name[on.weekday()]
+    parse_weeks(weeks or '', term.weeks)
+
+    room_id = _int(data.get('room_id'))
+    subject_id = _int(data.get('subject_id'))
+    if kind == 'day_off' and day is None:
+        raise ValueError("A day off needs a day (or a date)")
+    if day is not None and day not in days:
+        raise ValueError(f"'{day}' is not a day of the timetable")
+    if kind == 'room_closed' and room_id is None:
+        raise ValueError("A room closure needs a room_id")
+    if kind == 'subject_off' and subject_id is None:
+        raise ValueError("A subject exception needs a subject_id")
+
+    exception = TermException(user_id=user_id, term_id=term.id, kind=kind, weeks=str(weeks), day=day,
+                              room_id=room_id if kind == 'room_closed' else None,
+                              subject_id=subject_id if kind == 'subject_off' else None,
+                              note=(data.get('note') or '')[:100] or None)
+    db.session.add(exception)
+    db.session.flush()
+    return exception
+
+def week_start(term, week):
+    """The Monday of the term's `week`."""
+    return term.start_date - timedelta(days=term.start_date.weekday()) + timedelta(weeks=week - 1)
+
+def week_signatures(term, exceptions):
+    """week -> ids of the exceptions that apply to it, for every week of the term."""
+    signatures = {week: [] for week in range(1, term.weeks + 1)}
+    for exception in sorted(exceptions, key=lambda e: e.id):
+        try:
+            weeks = parse_weeks(exception.weeks, term.weeks)
+        except ValueError:
+            continue
+        for week in weeks:
+            signatures[week].append(exception.id)
+    return signatures
+
+def plan_term(user_id, term, refresh_template=False):
+    """
+    Plans every week of the term and replaces its stored overrides (caller
+    commits). Weeks without exceptions follow the template and store nothing.
+    """
+    if refresh_template:
+        template = live_assignments(user_id)
+        if not template:
+            raise ValueError("There is no weekly timetable to use as the template")
+        term.template = json.dumps(pack_full(template), separators=(',', ':'))
+        term.template_entries = len(template)
+    template = apply_payload(set(), json.loads(term.template))
+    timetable = tenant_timetable(user_id)
+    exceptions = {e.id: e for e in TermException.query.filter_by(term_id=term.id, user_id=user_id)}
+
+    variants = {}
+    for week, signature in week_signatures(term, exceptions.values()).items():
+        if signature:
+            variants.setdefault(tuple(signature), []).append(week)
+
+    TermOverride.query.filter_by(term_id=term.id, user_id=user_id).delete()
+    time_limit = float(timetable['config'].get('TERM_REPAIR_TIME_LIMIT', 10))
+    planned, stored, expanded = [], len(template), len(template) * (term.weeks - sum(map(len, variants.values())))
+    for signature, weeks in variants.items():
+        week = repair_week(timetable, template, [exceptions[i] for i in signature], time_limit)
+        if week['cancelled']:
+            payload = {'cancelled': True}
+        else:
+            payload = pack_delta(diff_assignments(template, week['assignments']))
+            codes = {day: i for i, day in enumerate(payload['days'])}
+            payload['unplaced'] = pack_flat(week['unplaced'], codes)
+        db.session.add(TermOverride(user_id=user_id, term_id=term.id,
+                                    weeks=json.dumps(weeks, separators=(',', ':')),
+                                    exceptions=json.dumps(list(signature), separators=(',', ':')),
+                                    payload=json.dumps(payload, separators=(',', ':')),
+                                    moved=len(week['moved']), unplaced=len(week['unplaced']),
+                                    solve_time=week['solve_time']))
+        record_phase('repair', week['solve_time'])
+        stored += sum(len(v) // 5 for k, v in payload.items() if k in ('added', 'removed', 'unplaced'))
+        stored += len(payload.get('moved', ())) // 8
+        expanded += len(week['assignments']) * len(weeks)
+        planned.append({
+            'weeks': weeks,
+            'exceptions': list(signature),
+            'cancelled': week['cancelled'],
+            'dropped': len(week['dropped']),
+            'moved': len(week['moved']),
+            'unplaced': len(week['unplaced']),
+            'repair_variables': week['variables'],
+            'solve_time': round(week['solve_time'], 3),
+        })
+    term.planned_at = datetime.utcnow()
+    return {
+        'weeks': term.weeks,
+        'template_entries': len(template),
+        'template_weeks': term.weeks - sum(len(p['weeks']) for p in planned),
+        'variants': planned,
+        'solve_time': round(sum(p['solve_time'] for p in planned), 3),
+        # Assignments kept for the term, against writing out every week
+        'stored_assignments': stored,
+        'expanded_assignments': expanded,
+    }
+
+def term_week(user_id, term, week):
+    """
+    The assignments of one week of the term, with what changed from the
+    template. `stale` means the term's exceptions changed since it was planned.
+    """
+    template = apply_payload(set(), json.loads(term.template))
+    signature = week_signatures(term, TermException.query.filter_by(term_id=term.id, user_id=user_id))[week]
+    override = next((o for o in TermOverride.query.filter_by(term_id=term.id, user_id=user_id)
+                     if week in json.loads(o.weeks)), None)
+    planned_for = json.loads(override.exceptions) if override else []
+    if override is None:
+        assignments, unplaced, cancelled = template, [], False
+    else:
+        payload = json.loads(override.payload)
+        cancelled = bool(payload.get('cancelled'))
+        assignments = set() if cancelled else apply_payload(template, payload)
+        unplaced = [] if cancelled else list(unpack_flat(payload['unplaced'], payload['days']))
+    return {
+        'assignments': assignments,
+        'changes': diff_assignments(template, assignments) if override and not cancelled else None,
+        'unplaced': unplaced,
+        'cancelled': cancelled,
+        'exceptions': signature,
+        'stale': planned_for != signature,
+    }
+
+def repair_week(timetable, template, exceptions, time_limit):
+    """
+    One week of the template under `exceptions` (TermException rows).
+    Classes on a day off or in a closed room are moved elsewhere in the
+    week by a repair model in which everything else stays where it is;
+    those with nowhere left to go are unplaced. `timetable` is
+    editing.tenant_timetable() output.
+    """
+    if any(e.kind == 'no_classes' for e in exceptions):
+        return {'assignments': set(), 'cancelled': True, 'dropped': sorted(template), 'moved': [],
+                'unplaced': [], 'variables': 0, 'solve_time': 0.0}
+
+    days, slots, config = timetable['days'], timetable['slots'], timetable['config']
+    subjects = {s.id: s for s in timetable['subjects']}
+    groups = {g.id: g for g in timetable['groups']}
+    rooms = {r.id: r for r in timetable['rooms']}
+    days_off = {e.day for e in exceptions if e.kind == 'day_off'}
+    closed = {}
+    for e in exceptions:
+        if e.kind == 'room_closed':
+            closed.setdefault(e.room_id, set()).add(e.day)
+    subjects_off = {e.subject_id for e in exceptions if e.kind == 'subject_off'}
+
+    def room_closed(room_id, day):
+        return room_id in closed and (None in closed[room_id] or day in closed[room_id])
+
+    # Classes of entities deleted since the template was taken are dropped too
+    dropped = {a for a in template if a[0] in subjects_off or a[0] not in subjects
+               or a[1] not in groups or a[2] not in rooms}
+    displaced = {a for a in template - dropped if a[3] in days_off or room_closed(a[2], a[3])}
+    kept = template - dropped - displaced
+
+    # Everything busy in the fixed part of the week
+    room_busy, group_busy, faculty_busy, subject_busy, event_days = set(), set(), set(), set(), set()
+    for s, g, r, day, slot in kept:
+        room_busy.add((r, day, slot))
+        group_busy.add((g, day, slot))
+        if subjects[s].faculty_id is not None:
+            faculty_busy.add((subjects[s].faculty_id, day, slot))
+        subject_busy.add((s, day, slot))
+        event_days.add((s, g, day))
+    conflicting = {}
+    for clique in timetable['conflict_cliques']:
+        for subject_id in clique:
+            conflicting.setdefault(subject_id, set()).update(c for c in clique if c != subject_id)
+
+    # A shared subject's groups in one room and slot are one section and move together
+    sections = {}
+    for s, g, r, day, slot in displaced:
+        key = (s, r, day, slot) if subjects[s].is_shared else (s, r, day, slot, g)
+        sections.setdefault(key, []).append(g)
+    lectures_in_labs = config.get('LECTURES_IN_LABS', False)
+
+    model = cp_model.CpModel()
+    choices, unplaced_vars, costs = [], {}, []
+    by_room, by_group, by_faculty, by_subject = {}, {}, {}, {}
+    for key, members in sections.items():
+        s, r0, day0, slot0 = key[:4]
+        subject = subjects[s]
+        size = sum(groups[g].size for g in members)
+        options = []
+        for day in days:
+            if day in days_off:
+                continue
+            for slot in slots:
+                if any((g, day, slot) in group_busy for g in members):
+                    continue
+                if subject.faculty_id is not None and (subject.faculty_id, day, slot) in faculty_busy:
+                    continue
+                if any((other, day, slot) in subject_busy for other in conflicting.get(s, ())):
+                    continue
+                for room in rooms.values():
+                    if ((subject.is_lab and room.type != 'lab')
+                            or (not subject.is_lab and room.type == 'lab' and not lectures_in_labs)
+                            or room.capacity < size or room_closed(room.id, day)
+                            or (room.id, day, slot) in room_busy):
+                        continue
+                    x = model.NewBoolVar('')
+                    options.append(x)
+                    choices.append((x, key, (room.id, day, slot)))
+                    cost = ((DAY_CHANGE_COST if day != day0 else 0) + (SLOT_CHANGE_COST if slot != slot0 else 0)
+                            + (ROOM_CHANGE_COST if room.id != r0 else 0)
+                            + (SAME_DAY_REPEAT_COST if any((s, g, day) in event_days for g in members) else 0))
+                    if cost:
+                        costs.append(cost * x)
+                    by_room.setdefault((room.id, day, slot), []).append(x)
+                    for g in members:
+                        by_group.setdefault((g, day, slot), []).append(x)
+                    if subject.faculty_id is not None:
+                        by_faculty.setdefault((subject.faculty_id, day, slot), []).append(x)
+                    by_subject.setdefault((s, day, slot), []).append(x)
+        unplaced = model.NewBoolVar('')
+        model.AddExactlyOne(options + [unplaced])
+        unplaced_vars[key] = unplaced
+
+    for options in (*by_room.values(), *by_group.values(), *by_faculty.values()):
+        if len(options) > 1:
+            model.AddAtMostOne(options)
+    # Subjects sharing students: at most one of them held in any slot
+    for (s, day, slot), options in by_subject.items():
+        for other in conflicting.get(s, ()):
+            if other > s and (other, day, slot) in by_subject:
+                held, other_held = model.NewBoolVar(''), model.NewBoolVar('')
+                model.AddMaxEquality(held, options)
+                model.AddMaxEquality(other_held, by_subject[(other, day, slot)])
+                model.AddBoolOr([held.Not(), other_held.Not()])
+    model.Minimize(UNPLACED_COST * sum(unplaced_vars.values()) + sum(costs))
+
+    placed, solve_time = {}, 0.0
+    if sections:
+        solver = new_solver(dict(config, SOLVER_TIME_LIMIT=time_limit))
+        status = solver.Solve(model)
+        solve_time = solver.WallTime()
+        if status in (cp_model.OPTIMAL, cp_model.FEASIBLE):
+            placed = {key: place for x, key, place in choices if solver.Value(x)}
+
+    assignments, moved, unplaced = set(kept), [], []
+    for key, members in sections.items():
+        s, r0, day0, slot0 = key[:4]
+        for g in members:
+            before = (s, g, r0, day0, slot0)
+            if key in placed:
+                after = (s, g, *placed[key])
+                assignments.add(after)
+                moved.append((before, after))
+            else:
+                unplaced.append(before)
+    return {'assignments': assignments, 'cancelled': False, 'dropped': sorted(dropped), 'moved': moved,
+            'unplaced': unplaced, 'variables': len(choices), 'solve_time': solve_time}
+
+def _int(value):
+    try:
+        return int(value) if value not in (None, '') else None
+    except (TypeError, ValueError):
+        raise ValueError(f"Invalid id: {value}")
@@ -0,0 +1,188 @@
+import json
+import os
+import socket
+import tempfile
+import threading
+import time
+import traceback
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+from sqlalchemy import and_, or_
+
+from app import db
+from app.models import SolveJob
+from app.generation import load_solver_inputs, solve_and_save
+from app.model_cache import solution_fingerprint
+
+try:
+    import fcntl
+except ImportError: # Windows
+    fcntl = None
+    import msvcrt
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+def enqueue_job(user_id, fingerprint, max_attempts=3):
+    """Queues a generation for the user, reusing an active job for the same inputs."""
+    job = (SolveJob.query
+           .filter(SolveJob.user_id == user_id,
+                   SolveJob.fingerprint == fingerprint,
+                   SolveJob.status.in_(ACTIVE_STATUSES))
+           .first())
+    if job:
+        return job
+    job = SolveJob(user_id=user_id, fingerprint=fingerprint, status='queued', max_attempts=max_attempts)
+    db.session.add(job)
+    db.session.commit()
+    return job
+
+def claim_job(worker_id, lease_seconds):
+    """
+    Atomically takes the oldest runnable job: queued and past its retry
+    backoff, or running with an expired lease (its worker died).
+    Postgres uses SELECT ... FOR UPDATE SKIP LOCKED; SQLite has no row
+    locks, so claims are serialized with a file lock instead.
+    """
+    with _claim_lock():
+        while True:
+            now = datetime.utcnow()
+            job = (SolveJob.query
+                   .filter(or_(and_(SolveJob.status == 'queued',
+                                    or_(SolveJob.run_after.is_(None), SolveJob.run_after <= now)),
+                               and_(SolveJob.status == 'running', SolveJob.lease_expires_at < now)))
+                   .order_by(SolveJob.id)
+                   .with_for_update(skip_locked=True)
+                   .first())
+            if job is None:
+                db.session.commit()
+                return None
+
+            if job.attempts >= job.max_attempts:
+                # Lease expired on the last attempt
+                job.status = 'failed'
+                job.error = job.error or 'Worker lease expired'
+                job.finished_at = now
+                db.session.commit()
+                continue
+
+            job.status = 'running'
+            job.worker_id = worker_id
+            job.attempts += 1
+            job.started_at = now
+            job.heartbeat_at = now
+            job.lease_expires_at = now + timedelta(seconds=lease_seconds)
+            db.session.commit()
+            return job
+
+def run_job(app, job, worker_id, lease_seconds):
+    job_id, user_id = job.id, job.user_id
+    heartbeat = _Heartbeat(app, job_id, worker_id, lease_seconds)
+    heartbeat.start()
+    try:
+        config, subjects, groups, rooms, faculties, time_slots = load_solver_inputs(user_id)
+        if not subjects or not rooms:
+            payload, code = {"error": "Insufficient data to generate timetable"}, 400
+        else:
+            fingerprint = solution_fingerprint(subjects, groups, rooms, faculties, time_slots, config)
+            payload, code = solve_and_save(user_id, config, subjects, groups, rooms, faculties, time_slots,
+                                           fingerprint, still_owner=lambda: _owns(job_id, worker_id))
+        if code != 409:
+            _finish(job_id, worker_id, 'done' if code == 200 else 'failed', payload, code)
+    except Exception as e:
+        db.session.rollback()
+        traceback.print_exc()
+        _retry_or_fail(job_id, worker_id, str(e))
+    finally:
+        heartbeat.stop()
+
+def run_worker(app, worker_id=None, poll_interval=2.0, drain=False):
+    """Claims and runs jobs forever (or, with drain, until the queue is empty)."""
+    worker_id = worker_id or f'{socket.gethostname()}:{os.getpid()}'
+    lease_seconds = app.config['SOLVE_JOB_LEASE_SECONDS']
+    with app.app_context():
+        print(f"Solver worker {worker_id} started.")
+        while True:
+            job = claim_job(worker_id, lease_seconds)
+            if job is not None:
+                print(f"Worker {worker_id}: running job {job.id} (attempt {job.attempts}).")
+                run_job(app, job, worker_id, lease_seconds)
+            elif drain:
+                return
+            else:
+                time.sleep(poll_interval)
+
+def _owns(job_id, worker_id):
+    return SolveJob.query.filter_by(id=job_id, worker_id=worker_id, status='running').count() > 0
+
+def _finish(job_id, worker_id, status, payload, code):
+    SolveJob.query.filter_by(id=job_id, worker_id=worker_id, status='running').update({
+        'status': status,
+        'result': json.dumps(payload),
+        'result_code': code,
+        'finished_at': datetime.utcnow()
+    })
+    db.session.commit()
+
+def _retry_or_fail(job_id, worker_id, error):
+    job = SolveJob.query.filter_by(id=job_id, worker_id=worker_id, status='running').first()
+    if job is None:
+        return
+    job.error = error
+    if job.attempts >= job.max_attempts:
+        job.status = 'failed'
+        job.finished_at = datetime.utcnow()
+    else:
+        job.status = 'queued'
+        job.run_after = datetime.utcnow() + timedelta(seconds=2 ** job.attempts)
+    db.session.commit()
+
+class _Heartbeat(threading.Thread):
+    """Extends the job's lease while it runs, from its own session."""
+
+    def __init__(self, app, job_id, worker_id, lease_seconds):
+        super().__init__(daemon=True)
+        self.app = app
+        self.job_id = job_id
+        self.worker_id = worker_id
+        self.lease_seconds = lease_seconds
+        self._stopped = threading.Event()
+
+    def run(self):
+        with self.app.app_context():
+            while not self._stopped.wait(self.lease_seconds / 3):
+                now = datetime.utcnow()
+                try:
+                    SolveJob.query.filter_by(id=self.job_id, worker_id=self.worker_id, status='running').update({
+                        'heartbeat_at': now,
+                        'lease_expires_at': now + timedelta(seconds=self.lease_seconds)
+                    })
+                    db.session.commit()
+                except Exception as e:
+                    db.session.rollback()
+                    print(f"Worker {self.worker_id}: heartbeat failed for job {self.job_id}: {e}")
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+@contextmanager
+def _claim_lock():
+    if db.engine.dialect.name != 'sqlite':
+        yield
+        return
+    path = os.environ.get('SOLVE_JOB_LOCK_FILE') or os.path.join(tempfile.gettempdir(), 'timetable-solve-jobs.lock')
+    with open(path, 'a+') as f:
+        if fcntl:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f, fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
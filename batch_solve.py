@@ -0,0 +1,45 @@
+import argparse
+import json
+import os
+
+from config import Config
+from app.batch import (load_bundle, load_tenants, all_tenant_ids, solve_all,
+                       write_csv, write_to_db, format_report)
+
+# Headless batch solver for nightly re-planning, without Flask or HTTP:
+#   python batch_solve.py --users 3 7 12 --write-db
+#   python batch_solve.py --all-users --out nightly/
+#   python batch_solve.py --bundle cs_dept.json ee_dept/ --out out/
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Solve many timetables in parallel')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--bundle', nargs='+', help='JSON files or CSV directories, one instance each')
+    source.add_argument('--users', nargs='+', type=int, help='Tenant user ids to load from the database')
+    source.add_argument('--all-users', action='store_true', help='Every tenant that has subjects')
+    parser.add_argument('--database-url', default=Config.SQLALCHEMY_DATABASE_URI)
+    parser.add_argument('--workers', type=int, help='Parallel solver processes (default: CPU count)')
+    parser.add_argument('--time-limit', type=float, help='Override SOLVER_TIME_LIMIT for every instance')
+    parser.add_argument('--out', help='Directory for per-instance CSV timetables and report.json')
+    parser.add_argument('--write-db', action='store_true', help='Replace each tenant\'s timetable in the database')
+    args = parser.parse_args()
+
+    if args.bundle:
+        instances = [load_bundle(path) for path in args.bundle]
+    else:
+        user_ids = args.users or all_tenant_ids(args.database_url)
+        instances = load_tenants(args.database_url, user_ids)
+
+    overrides = {'SOLVER_TIME_LIMIT': args.time_limit} if args.time_limit else None
+    reports = solve_all(instances, workers=args.workers, overrides=overrides)
+
+    if args.write_db:
+        write_to_db(args.database_url, reports)
+    if args.out:
+        os.makedirs(args.out, exist_ok=True)
+        for report in reports:
+            if report['results']:
+                write_csv(report, args.out)
+        with open(os.path.join(args.out, 'report.json'), 'w', encoding='utf-8') as f:
+            json.dump([{k: v for k, v in r.items() if k != 'results'} for r in reports], f, indent=2)
+
+    print(format_report(reports))
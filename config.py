@@ -15,8 +15,41 @@ class Config:
     
     SQLALCHEMY_DATABASE_URI = uri
     SQLALCHEMY_TRACK_MODIFICATIONS = False
-    SQLALCHEMY_ENGINE_OPTIONS = {
-        "pool_pre_ping": True,
-        "pool_recycle": 280,
-    }
+
+    # Connection strategy (see app/db_pool.py): 'serverless' opens a connection
+    # per checkout for use behind pgbouncer/Supavisor transaction pooling,
+    # 'pooled' keeps a QueuePool for long-lived gunicorn workers.
+    DB_POOL_STRATEGY = os.environ.get('DB_POOL_STRATEGY') or ('serverless' if os.environ.get('VERCEL') else 'pooled')
+    DB_POOL_SIZE = int(os.environ.get('DB_POOL_SIZE') or 5)
+    DB_MAX_OVERFLOW = int(os.environ.get('DB_MAX_OVERFLOW') or 10)
+    DB_POOL_TIMEOUT = float(os.environ.get('DB_POOL_TIMEOUT') or 10)
+    DB_POOL_RECYCLE = int(os.environ.get('DB_POOL_RECYCLE') or 1800)
+
+    # Optional read replica for the read-only timetable views
+    DATABASE_REPLICA_URL = os.environ.get('DATABASE_REPLICA_URL')
+    if DATABASE_REPLICA_URL and DATABASE_REPLICA_URL.startswith("postgres://"):
+        DATABASE_REPLICA_URL = DATABASE_REPLICA_URL.replace("postgres://", "postgresql://", 1)
+
     SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
+
+    # 'inline' solves inside the web request; 'queue' hands generation to
+    # standalone workers (python worker.py) through the solve_job table
+    SOLVER_MODE = os.environ.get('SOLVER_MODE') or 'inline'
+    SOLVE_JOB_LEASE_SECONDS = int(os.environ.get('SOLVE_JOB_LEASE_SECONDS') or 120)
+    SOLVE_JOB_MAX_ATTEMPTS = int(os.environ.get('SOLVE_JOB_MAX_ATTEMPTS') or 3)
+
+    # Fast start for serverless: skip db.create_all() on every cold start and
+    # create the schema once with `python migrate.py` instead. On by default on Vercel.
+    FAST_START = (os.environ.get('FAST_START') or ('true' if os.environ.get('VERCEL') else 'false')).lower() == 'true'
+
+    # Report each request's SQL statement count in an X-DB-Queries header (load testing)
+    QUERY_COUNT_HEADER = (os.environ.get('QUERY_COUNT_HEADER') or 'false').lower() == 'true'
+
+    # Request profiling (app/profiling.py): per-request SQL, template and solver
+    # phase timings in a Server-Timing header, the last PROFILING_BUFFER_SIZE kept
+    # for /api/admin/profiles. PROFILING_ADMINS (usernames) may read them and
+    # request sampling profiles with ?profile=1.
+    PROFILING_ENABLED = (os.environ.get('PROFILING_ENABLED') or 'false').lower() == 'true'
+    PROFILING_BUFFER_SIZE = int(os.environ.get('PROFILING_BUFFER_SIZE') or 200)
+    PROFILING_SAMPLE_INTERVAL_MS = float(os.environ.get('PROFILING_SAMPLE_INTERVAL_MS') or 5)
+    PROFILING_ADMINS = [u.strip() for u in (os.environ.get('PROFILING_ADMINS') or '').split(',') if u.strip()]
@@ -0,0 +1,121 @@
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+from sqlalchemy.engine import make_url
+
+from config import Config
+from app.snapshot import DEMO_SNAPSHOT
+
+# Load test against a local gunicorn (or any running server with --url):
+#   python loadtest.py --tenants 20 --concurrency 16 --duration 60 --out loadtest/results.json
+#   python loadtest.py --database-url postgresql://localhost/timetable_load --workers 4 --threads 8
+#   python loadtest.py --mix timetable=5,view_all=5,generate=1 --baseline loadtest/results.json
+# Results are JSON with sorted keys, so they can be committed and diffed between commits.
+DEFAULT_DATABASE_URL = 'sqlite:///' + os.path.join(tempfile.gettempdir(), 'timetable-loadtest.db')
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+def start_gunicorn(database_url, port, workers, threads):
+    env = {**os.environ, 'DATABASE_URL': database_url, 'QUERY_COUNT_HEADER': 'true', 'FAST_START': 'true'}
+    server = subprocess.Popen([sys.executable, '-m', 'gunicorn', '--workers', str(workers), '--threads', str(threads),
+                               '--bind', f'127.0.0.1:{port}', '--timeout', '300', '--log-level', 'warning', 'app:create_app()'],
+                              env=env, cwd=ROOT)
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit("gunicorn exited during startup")
+        try:
+            with urllib.request.urlopen(base_url + '/login', timeout=2):
+                return server, base_url
+        except (urllib.error.URLError, OSError):
+            time.sleep(0.5)
+    server.terminate()
+    raise SystemExit("gunicorn did not start within 60s")
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=ROOT, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Drive mixed multi-tenant traffic at the app and report latency')
+    parser.add_argument('--tenants', type=int, default=10, help='Synthetic tenants to provision')
+    parser.add_argument('--snapshot', default=DEMO_SNAPSHOT, help='Institution snapshot each tenant gets a copy of')
+    parser.add_argument('--database-url', default=DEFAULT_DATABASE_URL)
+    parser.add_argument('--skip-provision', action='store_true', help='Reuse the load-* tenants already in the database')
+    parser.add_argument('--url', help='Target a server that is already running (with QUERY_COUNT_HEADER=true for query counts)')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn worker processes')
+    parser.add_argument('--threads', type=int, default=4, help='gunicorn threads per worker')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--concurrency', type=int, default=8, help='Virtual users sending requests at once')
+    parser.add_argument('--duration', type=float, default=30, help='Seconds to run')
+    parser.add_argument('--requests', type=int, help='Stop after this many requests instead')
+    parser.add_argument('--mix', help='Endpoint weights, e.g. timetable=3,manage=2,view_all=3,import_finalize=1,generate=1')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--out', help='Write the results as JSON here')
+    parser.add_argument('--baseline', help='Earlier results JSON to compare against')
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.loadtest import (DEFAULT_MIX, LOAD_TENANT_PREFIX, compare_summaries, format_summary, parse_mix,
+                              provision_tenants, run_load, summarize)
+
+    try:
+        mix = parse_mix(args.mix) if args.mix else DEFAULT_MIX
+    except ValueError as e:
+        raise SystemExit(str(e))
+    usernames = [f'{LOAD_TENANT_PREFIX}{i}' for i in range(args.tenants)]
+
+    if not args.skip_provision:
+        started = time.perf_counter()
+        LoadTestConfig = type('LoadTestConfig', (Config,), {'SQLALCHEMY_DATABASE_URI': args.database_url,
+                                                            'FAST_START': False})
+        with create_app(LoadTestConfig).app_context():
+            usernames = provision_tenants(args.tenants, args.snapshot)
+        print(f"Provisioned {len(usernames)} tenants in {time.perf_counter() - started:.1f}s")
+
+    server = None
+    if args.url:
+        base_url = args.url.rstrip('/')
+    else:
+        server, base_url = start_gunicorn(args.database_url, args.port, args.workers, args.threads)
+    try:
+        samples, elapsed = run_load(base_url, usernames, mix, args.concurrency,
+                                    duration=None if args.requests else args.duration,
+                                    total_requests=args.requests, seed=args.seed)
+    finally:
+        if server:
+            server.terminate()
+            server.wait()
+
+    summary = summarize(samples, elapsed, meta={
+        'commit': git_commit(),
+        'database': make_url(args.database_url).get_backend_name(),
+        'server': args.url or f'gunicorn {args.workers}x{args.threads}',
+        'tenants': len(usernames),
+        'concurrency': args.concurrency,
+        'mix': mix,
+        'seed': args.seed,
+    })
+    print(format_summary(summary))
+
+    if args.out:
+        os.makedirs(os.path.dirname(os.path.abspath(args.out)), exist_ok=True)
+        with open(args.out, 'w', encoding='utf-8') as f:
+            json.dump(summary, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"\nResults written to {args.out}")
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            baseline = json.load(f)
+        print(f"\nAgainst {args.baseline} ({baseline['meta'].get('commit')}):")
+        print(compare_summaries(baseline, summary))
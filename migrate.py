@@ -0,0 +1,9 @@
+from app import create_app, db, init_schema
+
+# Explicit schema step for FAST_START deployments, where the app no longer
+# creates tables on startup. Run once per deploy against DATABASE_URL.
+if __name__ == '__main__':
+    app = create_app()
+    with app.app_context():
+        init_schema()
+        print(f"Tables: {', '.join(sorted(db.metadata.tables))}")
@@ -0,0 +1,80 @@
+import argparse
+import os
+import re
+import subprocess
+import sys
+import time
+
+# Cold-start profiler: imports the entry point in a fresh interpreter with
+# `python -X importtime` and reports the slowest modules, then times app
+# creation and the first request the way a new serverless instance sees them.
+#   python profile_startup.py
+#   python profile_startup.py --entry app --top 30 --fast-start false
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+FIRST_REQUEST = '''
+import time
+started = time.perf_counter()
+import {entry} as entry
+imported = time.perf_counter()
+client = entry.app.test_client()
+client.get('/')
+finished = time.perf_counter()
+print(f"{{imported - started:.4f}} {{finished - imported:.4f}}")
+'''
+
+def import_times(entry, env):
+    """(module, self_ms, cumulative_ms, depth) for every import, from -X importtime."""
+    proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {entry}'],
+                          capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    rows = []
+    for line in proc.stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if match:
+            self_us, cumulative_us, indent, module = match.groups()
+            rows.append((module, int(self_us) / 1000, int(cumulative_us) / 1000, (len(indent) - 1) // 2))
+    return rows
+
+def first_request(entry, env):
+    """Seconds spent importing the entry point and serving its first request, in a fresh process."""
+    proc = subprocess.run([sys.executable, '-c', FIRST_REQUEST.format(entry=entry)],
+                          capture_output=True, text=True, env=env, cwd=os.path.dirname(os.path.abspath(__file__)))
+    last = proc.stdout.strip().splitlines()[-1] if proc.stdout.strip() else ''
+    try:
+        return tuple(float(v) for v in last.split())
+    except ValueError:
+        print(proc.stderr)
+        raise SystemExit("First-request probe failed")
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Report cold-start time per module')
+    parser.add_argument('--entry', default='api.index', help='Module exposing `app` (default: api.index)')
+    parser.add_argument('--top', type=int, default=20, help='Modules to list')
+    parser.add_argument('--fast-start', choices=('true', 'false'), default='true')
+    args = parser.parse_args()
+
+    env = {**os.environ, 'FAST_START': args.fast_start}
+    rows = import_times(args.entry, env)
+    if not rows:
+        raise SystemExit(f"Could not import {args.entry}")
+
+    total = max(cumulative for _, _, cumulative, _ in rows)
+    packages = {}
+    for module, self_ms, _, _ in rows:
+        top = module.split('.')[0]
+        packages[top] = packages.get(top, 0.0) + self_ms
+
+    print(f"Import of {args.entry}: {total:.1f} ms (FAST_START={args.fast_start})\n")
+    print(f"{'package':<32} {'self ms':>10} {'share':>7}")
+    for top, ms in sorted(packages.items(), key=lambda kv: -kv[1])[:args.top]:
+        print(f"{top:<32} {ms:>10.1f} {ms / total:>7.1%}")
+
+    print(f"\n{'module':<48} {'cumulative ms':>14} {'self ms':>10}")
+    for module, self_ms, cumulative, depth in sorted(rows, key=lambda r: -r[2])[:args.top]:
+        print(f"{'  ' * min(depth, 4) + module:<48} {cumulative:>14.1f} {self_ms:>10.1f}")
+
+    started = time.perf_counter()
+    import_s, request_s = first_request(args.entry, env)
+    print(f"\nFresh process: import {import_s * 1000:.1f} ms, first request {request_s * 1000:.1f} ms, "
+          f"probe wall {(time.perf_counter() - started) * 1000:.1f} ms")
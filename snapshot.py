@@ -0,0 +1,37 @@
+import argparse
+from app import create_app, db
+from app.models import User
+from app.snapshot import dump_tenant, save_snapshot, load_snapshot, restore_tenant
+
+# Tenant snapshots for demo data and fixtures:
+#   python snapshot.py dump 3 institution.json
+#   python snapshot.py restore institution.json --username staging_copy --password secret
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Dump or restore a tenant snapshot')
+    commands = parser.add_subparsers(dest='command', required=True)
+    dump = commands.add_parser('dump', help='Write a tenant to a snapshot file')
+    dump.add_argument('user_id', type=int)
+    dump.add_argument('path')
+    restore = commands.add_parser('restore', help='Create a new tenant from a snapshot file')
+    restore.add_argument('path')
+    restore.add_argument('--username', required=True)
+    restore.add_argument('--password')
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.command == 'dump':
+            snapshot = dump_tenant(args.user_id)
+            save_snapshot(snapshot, args.path)
+            print(', '.join(f"{name}: {len(t['rows'])}" for name, t in snapshot['tables'].items()))
+        else:
+            if User.query.filter_by(username=args.username).first():
+                raise SystemExit(f"Username already exists: {args.username}")
+            user = User(username=args.username)
+            if args.password:
+                user.set_password(args.password)
+            db.session.add(user)
+            db.session.flush()
+            restore_tenant(load_snapshot(args.path), user.id)
+            db.session.commit()
+            print(f"Restored {args.path} as user {user.id} ({args.username})")
@@ -0,0 +1,115 @@
+import os
+import sys
+
+import pytest
+from sqlalchemy import create_engine
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.models import Enrollment, TimetableVersion, User  # noqa: E402
+
+@pytest.fixture
+def connection():
+    """A fresh in-memory database holding the tables the Core-level helpers write to."""
+    engine = create_engine('sqlite://')
+    with engine.begin() as conn:
+        for table in (User.__table__, Enrollment.__table__, TimetableVersion.__table__):
+            table.create(conn)
+        yield conn
+    engine.dispose()
+
+@pytest.fixture
+def app(request, tmp_path):
+    """
+    The Flask app on a fresh SQLite file, inside an app context. Parametrize
+    it indirectly with a dict to override config settings.
+    """
+    from app import create_app, db
+    from config import Config
+
+    settings = {'TESTING': True, 'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'test.db'}",
+                'FAST_START': False, **getattr(request, 'param', {})}
+    app = create_app(type('TestConfig', (Config,), settings))
+    # Per-process caches are keyed by user id and revision, which every fresh database repeats
+    from app import editing, enrollment, listing
+    editing._indexes.clear()
+    enrollment._cliques.clear()
+    listing._counts.clear()
+    with app.app_context():
+        yield app
+        db.session.remove()
+        db.engine.dispose()
+
+@pytest.fixture
+def make_tenant(app):
+    """Saves the small_tenant() entities for a new user; returns them as ORM rows."""
+    from types import SimpleNamespace
+
+    from app import db
+    from app.models import Course, Department, Faculty, Room, StudentGroup, Subject, TimeSlot, User
+    from test_solver import small_tenant
+
+    def make(username='tenant'):
+        user = User(username=username)
+        db.session.add(user)
+        db.session.flush()
+        department = Department(user_id=user.id, name='Department')
+        db.session.add(department)
+        db.session.flush()
+        subjects, groups, rooms, faculties, time_slots = small_tenant()
+        courses = {}
+        for course_id in sorted({s.course_id for s in subjects} | {g.course_id for g in groups}):
+            courses[course_id] = Course(user_id=user.id, name=f'Course {course_id}', department_id=department.id)
+            db.session.add(courses[course_id])
+        faculty_rows = {f.id: Faculty(user_id=user.id, name=f.name, department_id=department.id,
+                                      max_hours_per_week=f.max_hours_per_week) for f in faculties}
+        db.session.add_all(faculty_rows.values())
+        db.session.flush()
+        tenant = SimpleNamespace(
+            user=user,
+            groups=[StudentGroup(user_id=user.id, name=g.name, course_id=courses[g.course_id].id, size=g.size)
+                    for g in groups],
+            rooms=[Room(user_id=user.id, name=r.name, capacity=r.capacity, type=r.type) for r in rooms],
+            faculties=list(faculty_rows.values()),
+            subjects=[Subject(user_id=user.id, name=s.name, course_id=courses[s.course_id].id,
+                              hours_per_week=s.hours_per_week, faculty_id=faculty_rows[s.faculty_id].id,
+                              is_lab=s.is_lab, is_shared=s.is_shared) for s in subjects],
+            time_slots=[TimeSlot(user_id=user.id, day=ts.day, slot_number=ts.slot_number,
+                                 start_time=f'{8 + ts.slot_number}:00', end_time=f'{9 + ts.slot_number}:00')
+                        for ts in time_slots],
+        )
+        for rows in (tenant.groups, tenant.rooms, tenant.subjects, tenant.time_slots):
+            db.session.add_all(rows)
+        db.session.commit()
+        return tenant
+
+    return make
+
+@pytest.fixture
+def solve_tenant(app):
+    """Solves a make_tenant() tenant and saves the timetable as /generate-timetable does; returns the results."""
+    from app import db
+    from app.generation import save_timetable
+    from app.solver import solve_timetable
+    from test_solver import SOLVE_CONFIG
+
+    def solve(tenant):
+        _, results, obj_value = solve_timetable(tenant.subjects, tenant.groups, tenant.rooms, tenant.faculties,
+                                                tenant.time_slots, dict(SOLVE_CONFIG))
+        save_timetable(tenant.user.id, results, obj_value)
+        db.session.commit()
+        return results
+
+    return solve
+
+@pytest.fixture
+def login(app):
+    """A test client logged in as the given user."""
+    def client_for(user):
+        client = app.test_client()
+        with client.session_transaction() as session:
+            session['_user_id'] = str(user.id)
+            session['_fresh'] = True
+        return client
+
+    return client_for
@@ -0,0 +1,45 @@
+import random
+
+import pytest
+
+from app.analytics import evaluate
+from app.editing import OccupancyIndex
+from test_editing import penalty, tenant
+
+@pytest.mark.parametrize('seed', range(20))
+def test_score_matches_the_occupancy_index(seed):
+    data = tenant(random.Random(seed))
+    report = evaluate(**data)
+    # tenant() places classes without room, group or faculty clashes
+    assert report['conflicts']['room'] == report['conflicts']['group'] == report['conflicts']['faculty'] == 0
+    index = OccupancyIndex(1, **data)
+    assert report['score'] == penalty(index) == sum(index.penalties().values())
+    assert report['entries'] == len(data['entries'])
+
+def test_live_and_saved_timetables_score_as_solved(make_tenant, solve_tenant, login):
+    from app.models import TimetableVersion
+
+    tenant = make_tenant()
+    results = solve_tenant(tenant)
+    client = login(tenant.user)
+    live = client.get('/api/analytics').get_json()
+    assert live['hard_conflicts'] == 0 and live['entries'] == len(results)
+    assert live['score'] == TimetableVersion.query.filter_by(user_id=tenant.user.id).one().obj_value
+    saved = client.get('/api/analytics?version=1').get_json()
+    assert saved['score'] == live['score'] and saved['heatmaps'] == live['heatmaps']
+    assert client.get('/api/analytics?version=2').status_code == 404
+
+def test_evaluate_scores_unsaved_entries(make_tenant, solve_tenant, login):
+    tenant = make_tenant()
+    results = solve_tenant(tenant)
+    client = login(tenant.user)
+    entries = [dict(e) for e in results]
+    # Book a second class into a room that is already taken
+    clash = next(e for e in entries if e['subject_id'] != entries[0]['subject_id']
+                 and e['room_id'] != entries[0]['room_id'] and e['group_id'] != entries[0]['group_id'])
+    clash.update(room_id=entries[0]['room_id'], day=entries[0]['day'], slot=entries[0]['slot'])
+
+    report = client.post('/api/analytics/evaluate', json={'entries': entries}).get_json()
+    assert report['conflicts']['room'] >= 1
+    response = client.post('/api/analytics/evaluate', json={'entries': [{'subject_id': 1, 'day': 3}]})
+    assert response.status_code == 400
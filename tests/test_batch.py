@@ -0,0 +1,74 @@
+import csv
+import json
+
+from app import db
+from app.batch import BUNDLE_FIELDS, load_bundle, load_tenants, solve_all, write_to_db
+from app.history import load_version
+from app.models import SystemSetting, TimetableEntry, TimetableVersion
+
+from test_solver import SOLVE_CONFIG, assert_valid_timetable, small_tenant
+
+def rows(entity, records):
+    return [{field: getattr(r, field) for field in BUNDLE_FIELDS[entity]} for r in records]
+
+def write_bundles(tmp_path):
+    entities = dict(zip(BUNDLE_FIELDS, small_tenant()))
+    json_path = tmp_path / 'dept.json'
+    json_path.write_text(json.dumps({'config': SOLVE_CONFIG,
+                                     **{entity: rows(entity, records) for entity, records in entities.items()}}))
+    csv_dir = tmp_path / 'other_dept'
+    csv_dir.mkdir()
+    for entity, records in entities.items():
+        with open(csv_dir / f'{entity}.csv', 'w', newline='') as f:
+            writer = csv.DictWriter(f, fieldnames=list(BUNDLE_FIELDS[entity]))
+            writer.writeheader()
+            # CSV cells are strings, with an empty faculty and "true"/"false" flags
+            writer.writerows({k: '' if v is None else str(v).lower() if isinstance(v, bool) else v
+                              for k, v in row.items()} for row in rows(entity, records))
+    (csv_dir / 'config.json').write_text(json.dumps(SOLVE_CONFIG))
+    return str(json_path), str(csv_dir)
+
+def test_json_and_csv_bundles_load_the_same_instance(tmp_path):
+    json_path, csv_dir = write_bundles(tmp_path)
+    from_json, from_csv = load_bundle(json_path), load_bundle(csv_dir)
+    assert (from_json['name'], from_csv['name']) == ('dept', 'other_dept')
+    assert from_json['config'] == from_csv['config'] == SOLVE_CONFIG
+    expected = [rows(entity, records) for entity, records in zip(BUNDLE_FIELDS, small_tenant())]
+    for instance in (from_json, from_csv):
+        assert [rows(entity, records) for entity, records in zip(BUNDLE_FIELDS, instance['inputs'])] == expected
+
+def test_bundles_are_solved_in_order(tmp_path):
+    instances = [load_bundle(path) for path in write_bundles(tmp_path)]
+    reports = solve_all(instances, workers=2, overrides={'SOLVER_TIME_LIMIT': 10})
+    assert [r['name'] for r in reports] == ['dept', 'other_dept']
+    for instance, report in zip(instances, reports):
+        assert report['status'] == 'OPTIMAL' and report['error'] is None
+        assert report['objective'] == sum(report['penalties'].values())
+        assert_valid_timetable(instance['inputs'], report['results'])
+
+def test_tenants_are_read_and_written_without_the_orm(app, make_tenant):
+    tenant, other = make_tenant('a'), make_tenant('b')
+    db.session.add(SystemSetting(user_id=tenant.user.id, key='SOLVER_TIME_LIMIT', value='10'))
+    db.session.commit()
+    url = app.config['SQLALCHEMY_DATABASE_URI']
+
+    [instance] = load_tenants(url, [tenant.user.id])
+    assert instance['config'] == {'SOLVER_TIME_LIMIT': 10}
+    assert [s.id for s in instance['inputs'][0]] == [s.id for s in tenant.subjects]
+    [report] = solve_all([instance], workers=1)
+    assert report['status'] == 'OPTIMAL'
+    write_to_db(url, [report])
+
+    db.session.expire_all()
+    entries = TimetableEntry.query.filter_by(user_id=tenant.user.id).all()
+    saved = {(e.subject_id, e.group_id, e.room_id, e.day, e.slot) for e in entries}
+    assert saved == {(r['subject_id'], r['group_id'], r['room_id'], r['day'], r['slot']) for r in report['results']}
+    assert tenant.user.timetable_revision == 1
+    version = TimetableVersion.query.filter_by(user_id=tenant.user.id).one()
+    assert (version.number, version.source, version.obj_value) == (1, 'batch', report['objective'])
+    assert load_version(db.session.execute, tenant.user.id, 1) == saved
+    score = SystemSetting.query.filter_by(user_id=tenant.user.id, key='LAST_SOLVER_SCORE').one()
+    assert float(score.value) == report['objective']
+    # Nothing else was touched
+    assert TimetableEntry.query.filter_by(user_id=other.user.id).count() == 0
+    assert other.user.timetable_revision == 0
@@ -0,0 +1,59 @@
+import pytest
+from ortools.sat.python import cp_model
+
+from app import budget
+from app.budget import budget_policy
+from app.solver import solve_timetable
+from test_solver import SOLVE_CONFIG, small_tenant
+
+def test_initial_limit_scales_with_model_size():
+    config = {'SOLVER_TIME_LIMIT': 30, 'SOLVER_MIN_TIME_LIMIT': 5, 'SOLVER_BUDGET_UNITS_PER_SECOND': 1000}
+    assert budget_policy({'variables': 1000, 'constraints': 1000}, config)['initial_limit'] == 5
+    assert budget_policy({'variables': 8000, 'constraints': 4000}, config)['initial_limit'] == 12
+    policy = budget_policy({'variables': 80000, 'constraints': 0}, config)
+    assert policy['initial_limit'] == 30
+    # Without SOLVER_MAX_TIME_LIMIT there is no room to extend, and windows are a quarter of the limit
+    assert policy['max_limit'] == 30 and policy['extension_seconds'] == 7.5
+
+    policy = budget_policy({'variables': 1000, 'constraints': 0},
+                           dict(config, SOLVER_MAX_TIME_LIMIT=60, SOLVER_STAGNATION_SECONDS=3))
+    assert (policy['max_limit'], policy['extension_seconds']) == (60, 3)
+
+def test_small_model_stops_as_optimal():
+    stats = {}
+    config = dict(SOLVE_CONFIG, SOLVER_ADAPTIVE_BUDGET=True, SOLVER_STAGNATION_SECONDS=10)
+    status, _, _ = solve_timetable(*small_tenant(), config, stats=stats)
+    assert status == cp_model.OPTIMAL
+    assert stats['budget']['stop_reason'] == 'optimal'
+    assert stats['budget']['improvements'] >= 1 and stats['budget']['extensions'] == 0
+
+class StoppableSolver:
+    stopped = False
+
+    def StopSearch(self):
+        self.stopped = True
+
+def watch(policy, last_improvement=None):
+    """Runs the watchdog alone against a solver that only records being stopped."""
+    solver = StoppableSolver()
+    watcher = budget._BudgetWatch(solver, {'stagnation_seconds': 0, 'gap_limit': 0, **policy})
+    watcher.last_improvement = last_improvement
+    watcher.start()
+    watcher._thread.join(timeout=5)
+    assert solver.stopped
+    return watcher
+
+@pytest.fixture(autouse=True)
+def fast_poll(monkeypatch):
+    monkeypatch.setattr(budget, 'BUDGET_POLL_SECONDS', 0.01)
+
+def test_search_without_a_solution_is_extended_up_to_the_max():
+    watcher = watch({'initial_limit': 0.1, 'max_limit': 0.3, 'extension_seconds': 0.1})
+    assert (watcher.stop_reason, watcher.extensions, watcher.deadline) == ('time_limit', 2, 0.3)
+
+def test_stale_search_stops_at_its_limit_or_on_stagnation():
+    watcher = watch({'initial_limit': 0.1, 'max_limit': 1, 'extension_seconds': 0.05}, last_improvement=0)
+    assert (watcher.stop_reason, watcher.extensions) == ('time_limit', 0)
+    watcher = watch({'initial_limit': 1, 'max_limit': 1, 'extension_seconds': 1, 'stagnation_seconds': 0.1},
+                    last_improvement=0)
+    assert watcher.stop_reason == 'stagnation'
@@ -0,0 +1,51 @@
+from sqlalchemy import event
+
+from app import create_app, db
+from app.db_pool import TimedNullPool, TimedQueuePool, _count_query, engine_options, pool_metrics
+from config import Config
+
+def app_with(tmp_path, **settings):
+    config = type('Settings', (Config,), {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'pool.db'}",
+                                          **settings})
+    return create_app(config)
+
+def test_engine_options_follow_the_strategy():
+    config = {'DB_POOL_STRATEGY': 'pooled', 'DB_POOL_SIZE': 3, 'DB_MAX_OVERFLOW': 2, 'DB_POOL_TIMEOUT': 5,
+              'DB_POOL_RECYCLE': 60}
+    pooled = engine_options('postgresql://u@h/db', config)
+    assert pooled['poolclass'] is TimedQueuePool
+    assert (pooled['pool_size'], pooled['max_overflow'], pooled['pool_pre_ping']) == (3, 2, True)
+
+    serverless = engine_options('postgresql+psycopg://u@h/db', {**config, 'DB_POOL_STRATEGY': 'serverless'})
+    assert serverless['poolclass'] is TimedNullPool
+    # No server-side prepared statements behind a transaction pooler
+    assert serverless['connect_args'] == {'prepare_threshold': None}
+    assert 'connect_args' not in engine_options('postgresql+psycopg2://u@h/db',
+                                                {**config, 'DB_POOL_STRATEGY': 'serverless'})
+    assert engine_options('sqlite:///x.db', config) == {}
+
+def test_query_counting_is_off_unless_requested(tmp_path):
+    app = app_with(tmp_path)
+    with app.app_context():
+        assert not event.contains(db.engine, 'before_cursor_execute', _count_query)
+        response = app.test_client().get('/')
+        assert 'X-DB-Queries' not in response.headers
+        db.engine.dispose()
+
+def test_query_count_header(tmp_path):
+    app = app_with(tmp_path, QUERY_COUNT_HEADER=True)
+    with app.app_context():
+        assert event.contains(db.engine, 'before_cursor_execute', _count_query)
+        client = app.test_client()
+        # The landing page runs no queries; logging in does
+        assert client.get('/').headers['X-DB-Queries'] == '0'
+        assert int(client.get('/demo-login').headers['X-DB-Queries']) > 0
+        db.engine.dispose()
+
+def test_pool_metrics_count_checkouts(app):
+    before = pool_metrics(db)['primary']['checkouts']
+    with db.engine.connect():
+        pass
+    metrics = pool_metrics(db)['primary']
+    assert metrics['checkouts'] == before + 1
+    assert metrics['checked_out'] == 0
@@ -0,0 +1,188 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+
+from app.editing import OccupancyIndex
+from app.solver import PENALTY_WEIGHTS
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+SLOTS = [1, 2, 3, 4, 5, 6]
+CONFIG = {'MAX_CONSECUTIVE_LECTURES': 2}
+
+def tenant(rng):
+    """A small tenant with labs, shared sections and students shared between electives."""
+    groups = [SimpleNamespace(id=i, name=f'G{i}', size=rng.randrange(20, 45), course_id=1) for i in range(1, 5)]
+    rooms = [SimpleNamespace(id=1, name='Hall', type='lecture', capacity=120),
+             SimpleNamespace(id=2, name='Room', type='lecture', capacity=40),
+             SimpleNamespace(id=3, name='Lab', type='lab', capacity=50)]
+    faculties = [SimpleNamespace(id=i, name=f'F{i}', max_hours_per_week=rng.randrange(3, 8)) for i in range(1, 4)]
+    subjects = [SimpleNamespace(id=i, name=f'S{i}', faculty_id=rng.choice([1, 2, 3, None]), is_lab=i % 4 == 0,
+                                is_shared=i % 3 == 0, hours_per_week=rng.randrange(1, 7), course_id=1)
+                for i in range(1, 9)]
+    cliques = [[1, 2], [5, 7, 8]]
+
+    # Placed without hard clashes, as a solve leaves them
+    entries, busy = [], set()
+    for subject in subjects:
+        members = groups[:2] if subject.is_shared else [rng.choice(groups)]
+        room = 3 if subject.is_lab else 1
+        for _ in range(subject.hours_per_week):
+            day, slot = rng.choice(DAYS), rng.choice(SLOTS)
+            needs = {('room', room), ('faculty', subject.faculty_id), *(('group', g.id) for g in members)}
+            needs = {(kind, key, day, slot) for kind, key in needs if key is not None}
+            if needs & busy:
+                continue
+            busy |= needs
+            for group in members:
+                entries.append(SimpleNamespace(id=len(entries) + 1, subject_id=subject.id, group_id=group.id,
+                                               room_id=room, day=day, slot=slot))
+    return dict(config=CONFIG, days=DAYS, slots=SLOTS, subjects=subjects, groups=groups, rooms=rooms,
+                faculties=faculties, entries=entries, conflict_cliques=cliques)
+
+def build(data):
+    return OccupancyIndex(1, **data)
+
+def occupancy(index):
+    """Every bitset the index keeps, recomputed from its placements."""
+    bits = {'room': {}, 'group': {}, 'faculty': {}, 'event': {}}
+    for p in index.entries.values():
+        subject = index.subjects[p.subject_id]
+        keys = {'room': p.room_id, 'group': p.group_id, 'faculty': subject.faculty_id,
+                'event': (p.subject_id, None if subject.is_shared else p.group_id)}
+        for kind, key in keys.items():
+            if key is not None:
+                bits[kind][key] = bits[kind].get(key, 0) | 1 << p.pos
+    return bits
+
+def index_bits(index):
+    # Emptied keys stay behind as 0
+    return {kind: {k: v for k, v in getattr(index, f'{kind}_bits').items() if v}
+            for kind in ('room', 'group', 'faculty', 'event')}
+
+def penalty(index):
+    """The weighted soft penalty, counted slot by slot."""
+    weights = {k: CONFIG.get(k, v) for k, v in PENALTY_WEIGHTS.items()}
+    limit = CONFIG['MAX_CONSECUTIVE_LECTURES']
+    busy = {'faculty': {}, 'event': {}}
+    for p in index.entries.values():
+        subject = index.subjects[p.subject_id]
+        day, slot = divmod(p.pos, len(SLOTS))
+        if subject.faculty_id is not None:
+            busy['faculty'].setdefault(subject.faculty_id, set()).add((day, slot))
+        busy['event'].setdefault((p.subject_id, None if subject.is_shared else p.group_id), set()).add((day, slot))
+
+    total = 0
+    for faculty_id, cells in busy['faculty'].items():
+        total += weights['MAX_HOURS_PENALTY'] * max(0, len(cells) - index.faculties[faculty_id].max_hours_per_week)
+        for day in range(len(DAYS)):
+            for start in range(len(SLOTS) - limit):
+                if all((day, start + k) in cells for k in range(limit + 1)):
+                    total += weights['CONSECUTIVE_PENALTY']
+    for (subject_id, _), cells in busy['event'].items():
+        subject = index.subjects[subject_id]
+        for day in range(len(DAYS)):
+            held = [slot for slot in range(len(SLOTS)) if (day, slot) in cells]
+            if subject.is_lab:
+                total += weights['CONSECUTIVE_LABS_WEIGHT'] * sum(
+                    (slot + 1) not in held and (slot + 2) in held for slot in held)
+            elif subject.hours_per_week <= len(DAYS) and len(held) > 1:
+                total += weights['SAME_DAY_MULTI_PENALTY']
+    return total
+
+def clashes(index, entry_ids, room_id, pos):
+    """Kinds of hard conflict a section move would hit, checked against every other placement."""
+    moving = [index.entries[i] for i in entry_ids]
+    subject = index.subjects[moving[0].subject_id]
+    room = index.rooms[room_id]
+    others = [p for i, p in index.entries.items() if i not in entry_ids and p.pos == pos]
+    kinds = []
+    if subject.is_lab != (room.type == 'lab'):
+        kinds.append('room')
+    if room.capacity < sum(index.groups[p.group_id].size for p in moving):
+        kinds.append('room')
+    if any(p.room_id == room_id for p in others):
+        kinds.append('room')
+    kinds += ['group' for p in moving if any(q.group_id == p.group_id for q in others)]
+    if subject.faculty_id is not None and any(index.subjects[q.subject_id].faculty_id == subject.faculty_id
+                                              for q in others):
+        kinds.append('faculty')
+    kinds += ['enrollment' for other_id in index.conflicting.get(subject.id, ())
+              if any(q.subject_id == other_id for q in others)]
+    return sorted(kinds)
+
+def snapshot(index):
+    return dict(index.entries), index_bits(index)
+
+@pytest.mark.parametrize('seed', range(30))
+def test_index_matches_its_placements(seed):
+    index = build(tenant(random.Random(seed)))
+    assert index_bits(index) == occupancy(index)
+    assert sum(index.penalties().values()) == penalty(index)
+
+@pytest.mark.parametrize('seed', range(30))
+def test_moves_agree_with_recomputation(seed):
+    rng = random.Random(seed)
+    index = build(tenant(rng))
+    applied = 0
+    for _ in range(150):
+        entry_id = rng.choice(list(index.entries))
+        section = index.section(entry_id)
+        room_id, pos = rng.choice(list(index.rooms)), rng.randrange(len(DAYS) * len(SLOTS))
+        expected = clashes(index, section, room_id, pos)
+        before, state = penalty(index), snapshot(index)
+
+        result = index.place([(section, room_id, pos)])
+        assert sorted(c['type'] for c in result['conflicts']) == expected
+        if expected:
+            assert result['penalty_delta'] is None
+            assert snapshot(index) == state
+        else:
+            applied += 1
+            assert result['penalty_delta'] == penalty(index) - before
+            assert all(index.entries[i].pos == pos and index.entries[i].room_id == room_id for i in section)
+        assert index_bits(index) == occupancy(index)
+    assert applied
+
+def test_shared_section_moves_together():
+    rng = random.Random(4)
+    index = build(tenant(rng))
+    entry_id = next(i for i, p in index.entries.items() if index.subjects[p.subject_id].is_shared)
+    section = index.section(entry_id)
+    assert len(section) >= 2
+    assert {index.entries[i].group_id for i in section} == {1, 2}
+
+    free = next(pos for pos in range(len(DAYS) * len(SLOTS))
+                if not clashes(index, section, index.entries[entry_id].room_id, pos))
+    assert not index.place([(section, index.entries[entry_id].room_id, free)])['conflicts']
+    assert set(index.section(entry_id)) == set(section)
+    assert {index.entries[i].pos for i in section} == {free}
+    assert index_bits(index) == occupancy(index)
+
+@pytest.mark.parametrize('seed', range(30))
+def test_swaps_roll_back_on_conflict_and_dry_run(seed):
+    rng = random.Random(seed)
+    index = build(tenant(rng))
+    outcomes = set()
+    for _ in range(100):
+        first_id, second_id = rng.sample(list(index.entries), 2)
+        first, second = index.section(first_id), index.section(second_id)
+        if first_id in second:
+            continue
+        a, b = index.entries[first_id], index.entries[second_id]
+        moves = [(first, b.room_id, b.pos), (second, a.room_id, a.pos)]
+        before, state = penalty(index), snapshot(index)
+
+        dry = index.place(moves, dry_run=True)
+        assert snapshot(index) == state
+        result = index.place(moves)
+        assert [c['type'] for c in result['conflicts']] == [c['type'] for c in dry['conflicts']]
+        if result['conflicts']:
+            outcomes.add('rolled back')
+            assert snapshot(index) == state
+        else:
+            outcomes.add('swapped')
+            assert result['penalty_delta'] == dry['penalty_delta'] == penalty(index) - before
+            assert index.entries[first_id].pos == b.pos and index.entries[second_id].pos == a.pos
+        assert index_bits(index) == occupancy(index)
+    assert outcomes == {'rolled back', 'swapped'}
@@ -0,0 +1,82 @@
+import itertools
+import random
+
+import pytest
+from sqlalchemy import insert
+
+from app import enrollment
+from app.enrollment import conflict_cliques, conflict_edges_query, subject_conflicts
+from app.models import Enrollment
+
+def random_graph(rng, nodes, density):
+    return [(u, v) for u, v in itertools.combinations(range(1, nodes + 1), 2) if rng.random() < density]
+
+def assert_clique_cover(edges, cliques):
+    graph = {frozenset(e) for e in edges}
+    covered = set()
+    for clique in cliques:
+        assert clique == sorted(clique) and len(set(clique)) == len(clique) >= 2
+        pairs = {frozenset(p) for p in itertools.combinations(clique, 2)}
+        # Only subjects that really share students are kept apart
+        assert pairs <= graph
+        covered |= pairs
+    assert covered == graph
+
+@pytest.mark.parametrize('seed', range(200))
+def test_random_graphs_are_covered_by_valid_cliques(seed):
+    rng = random.Random(seed)
+    edges = random_graph(rng, rng.randrange(2, 25), rng.choice((0.1, 0.3, 0.6, 0.9)))
+    rng.shuffle(edges)
+    assert_clique_cover(edges, conflict_cliques(edges))
+
+def test_complete_graph_is_one_clique():
+    edges = list(itertools.combinations(range(1, 9), 2))
+    assert conflict_cliques(edges) == [list(range(1, 9))]
+
+def test_edge_cases():
+    assert conflict_cliques([]) == []
+    # Self loops and repeated or reversed edges do not produce extra constraints
+    assert conflict_cliques([(3, 3), (1, 2), (2, 1), (1, 2)]) == [[1, 2]]
+
+def test_edges_query_matches_shared_students(connection):
+    rng = random.Random(5)
+    taking = {student: rng.sample(range(1, 15), rng.randrange(1, 5)) for student in range(40)}
+    rows = [{'user_id': 1, 'student': f's{student}', 'subject_id': subject_id}
+            for student, subject_ids in taking.items() for subject_id in subject_ids]
+    # A second tenant with the same student names must not add edges
+    rows += [{'user_id': 2, 'student': 's0', 'subject_id': subject_id} for subject_id in range(1, 15)]
+    connection.execute(insert(Enrollment), rows)
+
+    expected = {}
+    for subject_ids in taking.values():
+        for u, v in itertools.combinations(sorted(subject_ids), 2):
+            expected[(u, v)] = expected.get((u, v), 0) + 1
+    found = {(u, v): shared for u, v, shared in connection.execute(conflict_edges_query(1))}
+    assert found == expected
+    assert_clique_cover(list(expected), subject_conflicts(connection.execute, 1))
+
+def test_cliques_are_cached_per_revision(connection, monkeypatch):
+    monkeypatch.setattr(enrollment, '_cliques', {})
+    connection.execute(insert(Enrollment), [{'user_id': 1, 'student': 'a', 'subject_id': s} for s in (1, 2)])
+    assert subject_conflicts(connection.execute, 1, revision=0) == [[1, 2]]
+    connection.execute(insert(Enrollment), [{'user_id': 1, 'student': 'b', 'subject_id': s} for s in (2, 3)])
+    assert subject_conflicts(connection.execute, 1, revision=0) == [[1, 2]]
+    assert subject_conflicts(connection.execute, 1, revision=1) == [[1, 2], [2, 3]]
+    # Without a revision nothing is cached
+    assert subject_conflicts(connection.execute, 1) == [[1, 2], [2, 3]]
+
+def test_enrollment_import_reaches_the_solver_inputs(make_tenant, login):
+    from app.generation import load_solver_inputs
+
+    tenant = make_tenant()
+    client = login(tenant.user)
+    assert 'SUBJECT_CONFLICTS' not in load_solver_inputs(tenant.user.id)[0]
+    data = [{'Student': 'ann', 'Subject': 'S1'}, {'Student': 'ann', 'Subject': 'S4'}]
+    response = client.post('/api/import/finalize', json={'type': 'enrollment', 'data': data})
+    assert response.get_json()['count'] == 2
+    ids = sorted(s.id for s in tenant.subjects if s.name in ('S1', 'S4'))
+    assert load_solver_inputs(tenant.user.id)[0]['SUBJECT_CONFLICTS'] == [ids]
+
+    response = client.post('/api/import/finalize', json={'type': 'enrollment', 'data': data[:1], 'mode': 'replace'})
+    assert response.get_json()['status'] == 'success'
+    assert 'SUBJECT_CONFLICTS' not in load_solver_inputs(tenant.user.id)[0]
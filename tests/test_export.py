@@ -0,0 +1,121 @@
+import csv
+import io
+import os
+import zipfile
+from datetime import date, datetime, timedelta
+
+import pytest
+
+from app import export
+from app.export import ExportRow, csv_chunks, export_rows, ics_chunks, zip_chunks
+
+def row(**fields):
+    defaults = dict(day='Monday', slot=1, group_id=1, group='G1', subject='S1', faculty_id=1, faculty='F1',
+                    room='Hall', start_time='9:00', end_time='10:00', subject_id=1, room_id=1)
+    return ExportRow(**{**defaults, **fields})
+
+def unfold(text):
+    return text.replace('\r\n ', '').split('\r\n')
+
+def test_csv_streams_in_chunks(monkeypatch):
+    monkeypatch.setattr(export, 'CSV_CHUNK_ROWS', 2)
+    rows = [row(slot=slot, start_time=None, end_time=None) for slot in range(1, 6)]
+    chunks = list(csv_chunks(iter(rows)))
+    assert len(chunks) == 3
+    parsed = list(csv.reader(io.StringIO(''.join(chunks))))
+    assert parsed[0] == export.CSV_HEADER
+    # Without a TimeSlot the grid's default (8 + slot):00 is used
+    assert parsed[3] == ['Monday', '3', '11:00', '12:00', 'G1', 'S1', 'F1', 'Hall']
+
+def test_ics_folds_long_lines_without_splitting_characters():
+    long_name = 'Thermodynamik für Fortgeschrittene, Teil ' + 'ü' * 60
+    rows = [row(subject=long_name, room='Hörsaal; Nord', faculty=None)]
+    text = ''.join(ics_chunks('Gruppe ' + 'é' * 80, rows, week_start=date(2026, 9, 7)))
+
+    assert all(len(line.encode('utf-8')) <= 75 for line in text.split('\r\n'))
+    lines = unfold(text)
+    assert 'X-WR-CALNAME:Gruppe ' + 'é' * 80 in lines
+    assert f'SUMMARY:{long_name.replace(",", chr(92) + ",")} (G1)' in lines
+    assert 'LOCATION:Hörsaal\\; Nord' in lines
+    assert 'DESCRIPTION:Faculty: N/A' in lines
+    assert 'DTSTART:20260907T090000' in lines
+
+def test_zip_has_one_file_per_group_and_merges_faculty_sections(make_tenant, solve_tenant):
+    tenant = make_tenant()
+    results = solve_tenant(tenant)
+    user_id = tenant.user.id
+
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(zip_chunks(user_id, 'group', 'csv'))))
+    assert sorted(archive.namelist()) == sorted(f'group/{g.name}-{g.id}.csv' for g in tenant.groups)
+    exported = sum(len(archive.read(name).decode().splitlines()) - 1 for name in archive.namelist())
+    assert exported == len(results)
+
+    # The shared subject meets once per hour for its whole course, so faculty exports list it once
+    shared = next(s for s in tenant.subjects if s.is_shared)
+    rows = [r for r in export_rows(user_id, 'faculty', shared.faculty_id) if r.subject_id == shared.id]
+    assert len(rows) == shared.hours_per_week
+    assert all(r.group_id is None and r.group == 'G1, G2' for r in rows)
+
+    archive = zipfile.ZipFile(io.BytesIO(b''.join(zip_chunks(user_id, 'faculty', 'ics'))))
+    assert len(archive.namelist()) == len(tenant.faculties)
+    for name in archive.namelist():
+        text = archive.read(name).decode()
+        assert text.startswith('BEGIN:VCALENDAR\r\n') and text.endswith('END:VCALENDAR\r\n')
+
+@pytest.fixture
+def export_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(export, 'EXPORT_DIR', str(tmp_path / 'exports'))
+    return tmp_path / 'exports'
+
+class InlineThread:
+    """Runs the export job when it is started, instead of on a thread."""
+
+    def __init__(self, target, args, daemon):
+        self.target, self.args = target, args
+
+    def start(self):
+        self.target(*self.args)
+
+def test_export_job_writes_zip_for_download(app, make_tenant, solve_tenant, login, export_dir, monkeypatch):
+    tenant = make_tenant()
+    solve_tenant(tenant)
+    monkeypatch.setattr(export.threading, 'Thread', InlineThread)
+    client = login(tenant.user)
+
+    job_id = client.post('/api/export/jobs', json={'by': 'group', 'format': 'ics'}).get_json()['job_id']
+    status = client.get(f'/api/export/jobs/{job_id}').get_json()
+    assert status['status'] == 'done'
+    response = client.get(status['download_url'])
+    assert response.status_code == 200
+    assert len(zipfile.ZipFile(io.BytesIO(response.data)).namelist()) == len(tenant.groups)
+    assert os.listdir(export_dir) == [f'export-{job_id}.zip']
+
+def test_orphaned_jobs_fail_and_old_zips_expire(app, make_tenant, login, export_dir):
+    from app import db
+    from app.models import ExportJob
+
+    tenant = make_tenant()
+    now = datetime.utcnow()
+    export_dir.mkdir()
+    old_zip, new_zip = export_dir / 'export-old.zip', export_dir / 'export-new.zip'
+    old_zip.write_bytes(b'zip')
+    new_zip.write_bytes(b'zip')
+    jobs = [ExportJob(user_id=tenant.user.id, by='group', format='csv', status='running',
+                      created_at=now - timedelta(seconds=export.EXPORT_JOB_TIMEOUT + 60)),
+            ExportJob(user_id=tenant.user.id, by='group', format='csv', status='running', created_at=now),
+            ExportJob(user_id=tenant.user.id, by='group', format='csv', status='done', path=str(old_zip),
+                      created_at=now, finished_at=now - timedelta(hours=export.EXPORT_KEEP_HOURS + 1)),
+            ExportJob(user_id=tenant.user.id, by='group', format='csv', status='done', path=str(new_zip),
+                      created_at=now, finished_at=now)]
+    db.session.add_all(jobs)
+    db.session.commit()
+    orphan, running, old, new = (job.id for job in jobs)
+    client = login(tenant.user)
+
+    polled = client.get(f'/api/export/jobs/{orphan}').get_json()
+    assert polled['status'] == 'failed' and polled['error']
+    assert client.get(f'/api/export/jobs/{running}').get_json()['status'] == 'running'
+    assert client.get(f'/api/export/jobs/{old}').get_json()['status'] == 'expired'
+    assert not old_zip.exists() and new_zip.exists()
+    assert client.get(f'/api/export/jobs/{old}/download').status_code == 410
+    assert client.get(f'/api/export/jobs/{new}/download').status_code == 200
@@ -0,0 +1,66 @@
+from app.models import TimetableEntry
+
+def fetch_all(client, **params):
+    pages, after = [], None
+    while True:
+        page = client.get('/api/timetable/grid', query_string={**params, **({'after': after} if after else {})}).json
+        pages.append(page)
+        after = page['next_after']
+        if after is None:
+            return pages
+
+def decode(page):
+    """(group_id, day, slot) -> (subject, faculty, room) names from one page's codes."""
+    cells = {}
+    for group in page['groups']:
+        for s, row in enumerate(group['grid']):
+            for d, code in enumerate(row):
+                if code:
+                    subject, faculty, room = page['cells'][code - 1]
+                    cells[(group['id'], page['days'][d], page['slots'][s])] = (
+                        page['subjects'][subject], page['faculty'][faculty], page['rooms'][room])
+    return cells
+
+def expected_cells(user_id, keep=lambda entry: True):
+    return {(e.group_id, e.day, e.slot): (e.subject.name, e.subject.faculty.name, e.room.name)
+            for e in TimetableEntry.query.filter_by(user_id=user_id) if keep(e)}
+
+def test_pages_cover_every_group_once(app, make_tenant, solve_tenant, login):
+    tenant = make_tenant()
+    solve_tenant(tenant)
+    other = make_tenant('other')
+    solve_tenant(other)
+    client = login(tenant.user)
+
+    pages = fetch_all(client, limit=2)
+    assert [len(p['groups']) for p in pages] == [2, 1]
+    assert [g['id'] for p in pages for g in p['groups']] == sorted(g.id for g in tenant.groups)
+    assert pages[0]['days'] == ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+    assert pages[0]['slots'] == [1, 2, 3, 4]
+    found = {}
+    for page in pages:
+        found.update(decode(page))
+    assert found == expected_cells(tenant.user.id)
+
+def test_filters_narrow_the_grid(app, make_tenant, solve_tenant, login):
+    tenant = make_tenant()
+    solve_tenant(tenant)
+    client = login(tenant.user)
+    faculty, room, group = tenant.faculties[0], tenant.rooms[2], tenant.groups[1]
+
+    [page] = fetch_all(client, type='faculty', value=faculty.id)
+    assert decode(page) == expected_cells(tenant.user.id, lambda e: e.subject.faculty_id == faculty.id)
+    [page] = fetch_all(client, type='room', value=room.id)
+    assert decode(page) == expected_cells(tenant.user.id, lambda e: e.room_id == room.id)
+    [page] = fetch_all(client, type='group', value=group.id)
+    assert [g['id'] for g in page['groups']] == [group.id]
+    assert decode(page) == expected_cells(tenant.user.id, lambda e: e.group_id == group.id)
+
+def test_page_size_is_clamped(app, make_tenant, login):
+    tenant = make_tenant()
+    client = login(tenant.user)
+    assert len(client.get('/api/timetable/grid?limit=0').json['groups']) == 1
+    page = client.get('/api/timetable/grid?limit=100000').json
+    assert len(page['groups']) == 3 and page['next_after'] is None
+    # No timetable yet: every period is free
+    assert all(code == 0 for g in page['groups'] for row in g['grid'] for code in row)
@@ -0,0 +1,105 @@
+import random
+
+import pytest
+
+from app import history
+from app.history import (apply_payload, diff_assignments, load_version, pack_delta, pack_flat, pack_full,
+                         record_version, unpack_flat)
+
+DAYS = ['Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday']
+
+def random_timetable(rng, subjects=12, groups=4, rooms=5):
+    return {(s, g, rng.randrange(1, rooms + 1), rng.choice(DAYS), rng.randrange(1, 9))
+            for s in range(1, subjects + 1) for g in range(1, groups + 1) if rng.random() < 0.6}
+
+def perturb(rng, assignments):
+    """Moves, drops and adds a few classes, as a re-solve or manual edits would."""
+    result = set()
+    for s, g, r, d, sl in assignments:
+        roll = rng.random()
+        if roll < 0.1:
+            continue
+        if roll < 0.3:
+            r, d, sl = rng.randrange(1, 6), rng.choice(DAYS), rng.randrange(1, 9)
+        result.add((s, g, r, d, sl))
+    for _ in range(rng.randrange(3)):
+        result.add((rng.randrange(1, 13), rng.randrange(1, 5), rng.randrange(1, 6), rng.choice(DAYS),
+                    rng.randrange(1, 9)))
+    return result
+
+def test_flat_round_trip():
+    rng = random.Random(1)
+    assignments = sorted(random_timetable(rng))
+    codes = {d: i for i, d in enumerate(DAYS)}
+    flat = pack_flat(assignments, codes)
+    assert len(flat) == 5 * len(assignments)
+    assert all(isinstance(x, int) for x in flat)
+    assert list(unpack_flat(flat, DAYS)) == assignments
+
+@pytest.mark.parametrize('seed', range(20))
+def test_delta_rebuilds_the_new_timetable(seed):
+    rng = random.Random(seed)
+    old = random_timetable(rng)
+    new = perturb(rng, old)
+
+    delta = diff_assignments(old, new)
+    # Nothing is both moved and added/removed, and the counts add up
+    assert len(delta['added']) + len(delta['moved']) == len(new - old)
+    assert len(delta['removed']) + len(delta['moved']) == len(old - new)
+    for before, after in delta['moved']:
+        assert before[:2] == after[:2]
+
+    assert apply_payload(old, pack_delta(delta)) == new
+    assert apply_payload(set(), pack_full(new)) == new
+    # A full copy ignores whatever it is applied on top of
+    assert apply_payload(old, pack_full(new)) == new
+
+def test_unchanged_timetable_has_an_empty_delta():
+    rng = random.Random(2)
+    old = random_timetable(rng)
+    payload = pack_delta(diff_assignments(old, set(old)))
+    assert payload == {'days': [], 'added': [], 'removed': [], 'moved': []}
+
+def test_versions_load_back_across_keyframes_and_pruning(connection, monkeypatch):
+    monkeypatch.setattr(history, 'VERSION_KEYFRAME_INTERVAL', 4)
+    monkeypatch.setattr(history, 'TIMETABLE_VERSIONS_KEPT', 10)
+    rng = random.Random(3)
+    execute = connection.execute
+
+    saved = {}
+    timetable = random_timetable(rng)
+    for number in range(1, 31):
+        assert record_version(execute, 7, timetable, obj_value=number) == number
+        saved[number] = set(timetable)
+        timetable = perturb(rng, timetable)
+    # Another tenant's history does not get in the way
+    record_version(execute, 8, random_timetable(rng))
+
+    for number in range(21, 31):
+        assert load_version(execute, 7, number) == saved[number]
+    assert load_version(execute, 7, 31) is None
+
+    rows = execute(history.versions.select().where(history.versions.c.user_id == 7)).all()
+    numbers = sorted(row.number for row in rows)
+    # The newest TIMETABLE_VERSIONS_KEPT are kept, plus at most the keyframe run in front of them
+    assert numbers[-10:] == list(range(21, 31))
+    assert len(numbers) < 10 + 4
+    oldest = min(rows, key=lambda row: row.number)
+    assert oldest.base is None
+    for row in rows:
+        assert (row.base is None) == (row.number % 4 == 1)
+        assert load_version(execute, 7, row.number) == saved[row.number]
+
+def test_version_number_is_read_under_the_tenant_row_lock(connection):
+    from sqlalchemy.dialects import postgresql
+
+    statements = []
+
+    def execute(statement):
+        statements.append(str(statement.compile(dialect=postgresql.dialect())))
+        return connection.execute(statement)
+
+    assert record_version(execute, 7, random_timetable(random.Random(4))) == 1
+    lock = next(i for i, sql in enumerate(statements) if 'FOR UPDATE' in sql)
+    latest = next(i for i, sql in enumerate(statements) if 'max(timetable_version.number)' in sql)
+    assert 'FROM "user"' in statements[lock] and lock < latest
@@ -0,0 +1,79 @@
+import random
+
+import pytest
+
+from app import db
+from app.models import Room, User
+
+def add_rooms(user_id, rng, n=37):
+    names = ['Hall', 'Lab', 'Room', '100%', 'A_1', 'Ab']
+    rooms = [Room(user_id=user_id, name=f'{rng.choice(names)} {i % 7}', capacity=rng.choice([20, 40, 60]),
+                  type=rng.choice(['lecture', 'lab'])) for i in range(n)]
+    db.session.add_all(rooms)
+    db.session.commit()
+    return rooms
+
+def all_pages(client, **params):
+    items, cursor, totals = [], None, set()
+    while True:
+        page = client.get('/api/room/list', query_string={**params, **({'cursor': cursor} if cursor else {})}).json
+        assert page['status'] == 'success'
+        assert len(page['items']) <= int(params.get('limit', 50))
+        items += page['items']
+        totals.add(page['total'])
+        cursor = page['next_cursor']
+        if cursor is None:
+            return items, totals
+
+@pytest.fixture
+def tenant(app, login):
+    user = User(username='lister')
+    db.session.add(user)
+    db.session.commit()
+    return user, login(user)
+
+@pytest.mark.parametrize('sort', ['name', 'capacity'])
+@pytest.mark.parametrize('order', ['asc', 'desc'])
+def test_keyset_pages_follow_the_sort_without_gaps(tenant, sort, order):
+    user, client = tenant
+    rooms = add_rooms(user.id, random.Random(1))
+    other = User(username='other')
+    db.session.add(other)
+    db.session.commit()
+    add_rooms(other.id, random.Random(2), n=5)
+
+    items, totals = all_pages(client, sort=sort, order=order, limit=4)
+    expected = sorted(rooms, key=lambda r: (getattr(r, sort), r.id), reverse=order == 'desc')
+    assert [i['id'] for i in items] == [r.id for r in expected]
+    assert totals == {len(rooms)}
+
+def test_search_and_filters(tenant):
+    user, client = tenant
+    rooms = add_rooms(user.id, random.Random(3))
+    for prefix in ('a_', '100%', 'Ha', 'zz'):
+        items, totals = all_pages(client, q=prefix, limit=3)
+        # % and _ match themselves, not any character
+        expected = [r for r in rooms if r.name.lower().startswith(prefix.lower())]
+        assert sorted(i['id'] for i in items) == sorted(r.id for r in expected)
+        assert totals == {len(expected)}
+    items, _ = all_pages(client, type='lab', q='Room')
+    assert sorted(i['id'] for i in items) == sorted(r.id for r in rooms if r.type == 'lab' and r.name.startswith('Room'))
+
+def test_counts_follow_writes(tenant):
+    user, client = tenant
+    add_rooms(user.id, random.Random(4), n=3)
+    assert client.get('/api/room/list').json['total'] == 3
+    client.post('/api/room/add', data={'name': 'New', 'capacity': 30, 'type': 'lecture'})
+    # The write bumped the tenant's revision, so the cached count is not reused
+    assert client.get('/api/room/list').json['total'] == 4
+    assert client.get('/api/room/list?q=new').json['total'] == 1
+
+@pytest.mark.parametrize('query', ['sort=password', 'limit=many', 'cursor=%%%'])
+def test_bad_arguments_are_rejected(tenant, query):
+    _, client = tenant
+    response = client.get(f'/api/room/list?{query}')
+    assert response.status_code == 400 and response.json['status'] == 'error'
+
+def test_unknown_entity(tenant):
+    _, client = tenant
+    assert client.get('/api/user/list').status_code == 404
@@ -0,0 +1,66 @@
+import threading
+
+import pytest
+from werkzeug.serving import make_server
+
+from app import create_app, db
+from app.loadtest import compare_summaries, format_summary, parse_mix, provision_tenants, run_load, summarize
+from app.models import Room, User
+from app.snapshot import DEMO_SNAPSHOT
+from config import Config
+
+def test_parse_mix():
+    assert parse_mix('timetable=3, generate') == {'timetable': 3.0, 'generate': 1.0}
+    with pytest.raises(ValueError, match='Unknown endpoint'):
+        parse_mix('timetable=1,nope=2')
+    with pytest.raises(ValueError):
+        parse_mix('timetable=0')
+
+def test_summary_percentiles_and_errors():
+    samples = [('view_all', 200, ms / 1000, 4) for ms in range(1, 101)]
+    samples += [('generate', 500, 2.0, None), ('generate', 0, 3.0, None)]
+    summary = summarize(samples, elapsed=10, meta={'concurrency': 2})
+    view_all = summary['endpoints']['view_all']
+    assert (view_all['p50_ms'], view_all['p90_ms'], view_all['p99_ms'], view_all['max_ms']) == (50, 90, 99, 100)
+    assert view_all['throughput_rps'] == 10 and view_all['db_queries_mean'] == 4
+    generate = summary['endpoints']['generate']
+    assert (generate['errors'], generate['error_rate'], generate['statuses']) == (2, 1.0, {'500': 1, '0': 1})
+    assert generate['db_queries_mean'] is None
+    assert summary['total']['requests'] == 102 and summary['meta'] == {'concurrency': 2, 'elapsed_s': 10}
+    assert format_summary(summary).splitlines()[-1].startswith('TOTAL')
+
+    slower = summarize([(name, status, seconds * 2, queries) for name, status, seconds, queries in samples
+                        if name == 'view_all'], elapsed=10)
+    lines = compare_summaries(summary, slower).splitlines()
+    assert any(line.startswith('generate') and 'only in baseline' in line for line in lines)
+    assert any(line.startswith('view_all') and '+100%' in line for line in lines)
+
+def test_load_run_against_a_live_server(tmp_path):
+    config = type('Settings', (Config,), {'SQLALCHEMY_DATABASE_URI': f"sqlite:///{tmp_path / 'load.db'}",
+                                          'QUERY_COUNT_HEADER': True, 'FAST_START': False})
+    app = create_app(config)
+    with app.app_context():
+        usernames = provision_tenants(2, DEMO_SNAPSHOT)
+        # Provisioning again starts the tenants over
+        assert provision_tenants(2, DEMO_SNAPSHOT) == usernames == ['load-0', 'load-1']
+        assert User.query.filter(User.username.in_(usernames)).count() == 2
+        rooms = Room.query.count()
+
+        server = make_server('127.0.0.1', 0, app, threaded=True)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            samples, _ = run_load(f'http://127.0.0.1:{server.server_port}', usernames,
+                                  {'timetable': 1, 'view_all': 1, 'import_finalize': 1}, concurrency=2,
+                                  total_requests=12)
+        finally:
+            server.shutdown()
+            thread.join()
+
+        assert len(samples) == 12
+        assert all(status == 200 and queries > 0 for _, status, _, queries in samples)
+        imports = sum(1 for name, _, _, _ in samples if name == 'import_finalize')
+        db.session.expire_all()
+        assert Room.query.count() == rooms + imports
+        db.session.remove()
+        db.engine.dispose()
@@ -0,0 +1,44 @@
+import json
+
+from ortools.sat.python import cp_model
+
+from app import db
+from app.generation import find_solution_memo, store_solution_memo
+from app.models import SolutionMemo
+from app.model_cache import solution_fingerprint
+
+from test_solver import small_tenant
+
+RESULTS = [{'subject_id': 1, 'room_id': 2, 'group_id': 3, 'day': 'Monday', 'slot': 1}]
+
+def store(user_id, fingerprint, time_limit, status):
+    store_solution_memo(user_id, fingerprint, time_limit, status, 40.0, RESULTS)
+    db.session.commit()
+
+def test_fingerprint_follows_inputs_but_not_the_time_limit():
+    inputs = small_tenant()
+    base = solution_fingerprint(*inputs, {'MAX_HOURS_PENALTY': 500, 'SOLVER_TIME_LIMIT': 30})
+    assert solution_fingerprint(*inputs, {'MAX_HOURS_PENALTY': 500, 'SOLVER_TIME_LIMIT': 90}) == base
+    assert solution_fingerprint(*inputs, {'MAX_HOURS_PENALTY': 400, 'SOLVER_TIME_LIMIT': 30}) != base
+    inputs[1][0].size += 1
+    assert solution_fingerprint(*inputs, {'MAX_HOURS_PENALTY': 500, 'SOLVER_TIME_LIMIT': 30}) != base
+
+def test_optimal_memo_is_reused_under_any_limit(app):
+    store(1, 'a' * 64, 10, cp_model.OPTIMAL)
+    memo = find_solution_memo(1, 'a' * 64, 300)
+    assert memo is not None and json.loads(memo.entries) == [[1, 2, 3, 'Monday', 1]]
+
+def test_feasible_memo_needs_at_least_the_requested_limit(app):
+    store(1, 'a' * 64, 30, cp_model.FEASIBLE)
+    assert find_solution_memo(1, 'a' * 64, 30) is not None
+    assert find_solution_memo(1, 'a' * 64, 20) is not None
+    # A longer run could find a better timetable
+    assert find_solution_memo(1, 'a' * 64, 60) is None
+
+def test_stale_memos_are_evicted_per_tenant(app):
+    store(1, 'a' * 64, 30, cp_model.OPTIMAL)
+    store(2, 'a' * 64, 30, cp_model.OPTIMAL)
+    assert find_solution_memo(1, 'b' * 64, 30) is None
+    db.session.commit()
+    assert SolutionMemo.query.filter_by(user_id=1).count() == 0
+    assert find_solution_memo(2, 'a' * 64, 30) is not None
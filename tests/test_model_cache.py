@@ -0,0 +1,46 @@
+import random
+
+from ortools.sat.python import cp_model
+
+from app.model_cache import ModelCache, model_cache, structural_key
+from app.solver import build_model, instantiate_model, solve_timetable
+
+from test_solver import SOLVE_CONFIG, assert_valid_timetable, entities, small_tenant
+
+def test_disk_tier_round_trip(tmp_path):
+    inputs = entities(random.Random(0))
+    compiled = build_model(*inputs, {})
+    ModelCache(disk_dir=str(tmp_path)).put('k', compiled)
+
+    loaded = ModelCache(disk_dir=str(tmp_path)).get('k')
+    assert loaded == compiled
+    assert instantiate_model(loaded).Proto() == instantiate_model(compiled).Proto()
+    assert ModelCache(disk_dir=str(tmp_path)).get('other') is None
+
+def test_disk_tier_ignores_damaged_files(tmp_path):
+    compiled = build_model(*entities(random.Random(1)), {})
+    ModelCache(disk_dir=str(tmp_path)).put('k', compiled)
+    proto_file = tmp_path / 'k.pb'
+    proto_file.write_bytes(proto_file.read_bytes()[:-1])
+    assert ModelCache(disk_dir=str(tmp_path)).get('k') is None
+
+    ModelCache(disk_dir=str(tmp_path)).put('k', compiled)
+    (tmp_path / 'k.json').write_text('{"sha256": ')
+    assert ModelCache(disk_dir=str(tmp_path)).get('k') is None
+
+def test_weight_changes_reuse_the_compiled_model():
+    inputs = small_tenant()
+    config = dict(SOLVE_CONFIG)
+    reweighted = {**config, 'MAX_HOURS_PENALTY': 50, 'SAME_DAY_MULTI_PENALTY': 30}
+    assert structural_key(*inputs, config) == structural_key(*inputs, reweighted)
+    assert structural_key(*inputs, config) != structural_key(*inputs, {**config, 'LECTURES_IN_LABS': True})
+
+    model_cache.clear()
+    first, second = {}, {}
+    solve_timetable(*inputs, config, stats=first)
+    status, results, obj_value = solve_timetable(*inputs, reweighted, stats=second)
+    assert (first['model_cache_hit'], second['model_cache_hit']) == (False, True)
+    assert status == cp_model.OPTIMAL
+    assert_valid_timetable(inputs, results)
+    # Only the objective was rewritten, and it carries the new weights
+    assert sum(second['penalties'].values()) == obj_value
@@ -0,0 +1,37 @@
+from ortools.sat.python import cp_model
+
+from app.portfolio import portfolio_strategies
+from app.solver import solve_timetable
+
+from test_solver import SOLVE_CONFIG, assert_valid_timetable, small_tenant
+
+def test_strategies_start_with_default_and_hard_only():
+    assert [s['name'] for s in portfolio_strategies(4, has_hint=False)] == \
+        ['default', 'hard_only', 'seed_1', 'seed_2']
+    assert [s['name'] for s in portfolio_strategies(4, has_hint=True)] == \
+        ['default', 'hard_only', 'warm_start', 'seed_1']
+    assert [s['name'] for s in portfolio_strategies(1, has_hint=True)] == ['default']
+
+def test_race_reaches_the_single_solve_optimum():
+    inputs = small_tenant()
+    _, _, single = solve_timetable(*inputs, dict(SOLVE_CONFIG))
+
+    stats = {}
+    status, results, obj_value = solve_timetable(*inputs, {**SOLVE_CONFIG, 'SOLVER_PORTFOLIO_SIZE': 3},
+                                                 stats=stats)
+    assert status == cp_model.OPTIMAL
+    assert obj_value == single
+    assert_valid_timetable(inputs, results)
+    assert stats['portfolio_winner'] in {'default', 'hard_only', 'seed_1'}
+    assert sum(stats['penalties'].values()) == obj_value
+
+def test_race_stops_at_the_target_objective():
+    inputs = small_tenant()
+    stats = {}
+    config = {**SOLVE_CONFIG, 'SOLVER_PORTFOLIO_SIZE': 2, 'SOLVER_TARGET_OBJECTIVE': 10 ** 6}
+    status, results, obj_value = solve_timetable(*inputs, config, stats=stats)
+    # Any timetable meets the target, so the race ends on the first one without proving it optimal
+    assert status in (cp_model.OPTIMAL, cp_model.FEASIBLE)
+    assert obj_value <= 10 ** 6
+    assert_valid_timetable(inputs, results)
+    assert stats['solve_time'] < SOLVE_CONFIG['SOLVER_TIME_LIMIT']
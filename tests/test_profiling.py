@@ -0,0 +1,52 @@
+import pytest
+from sqlalchemy import event
+
+from app import db, profiling
+
+PROFILED = {'PROFILING_ENABLED': True, 'PROFILING_ADMINS': ['tenant'], 'SOLVER_NUM_WORKERS': 4}
+
+def timings(response):
+    """Server-Timing metrics as name -> duration in ms."""
+    metrics = {}
+    for metric in response.headers['Server-Timing'].split(', '):
+        name, duration = metric.split(';')[:2]
+        metrics[name] = float(duration.removeprefix('dur='))
+    return metrics
+
+def test_nothing_is_hooked_with_profiling_off(app, make_tenant, login):
+    assert not event.contains(db.engine, 'before_cursor_execute', profiling._before_statement)
+    client = login(make_tenant().user)
+    response = client.get('/manage')
+    assert 'Server-Timing' not in response.headers and 'X-Profile-Id' not in response.headers
+    assert client.get('/api/admin/profiles').status_code == 404
+
+@pytest.mark.parametrize('app', [PROFILED], indirect=True)
+def test_requests_report_server_timing_and_are_buffered(app, make_tenant, login):
+    tenant = make_tenant()
+    client = login(tenant.user)
+    response = client.get('/manage')
+    metrics = timings(response)
+    assert {'total', 'sql', 'render'} <= set(metrics)
+    assert metrics['total'] >= metrics['sql'] and 'queries' in response.headers['Server-Timing']
+
+    # Generates also time their phases
+    response = client.post('/generate-timetable')
+    assert response.status_code == 200
+    assert {'load', 'estimate', 'build', 'search', 'save'} <= set(timings(response))
+
+    profiles = client.get('/api/admin/profiles?endpoint=main.manage').get_json()['profiles']
+    assert len(profiles) == 1
+    assert profiles[0]['sql_count'] > 0 and not profiles[0]['sampled']
+
+    sampled = client.get('/manage?profile=1')
+    profile = client.get(f"/api/admin/profiles/{sampled.headers['X-Profile-Id']}").get_json()
+    assert 'samples' in profile
+
+@pytest.mark.parametrize('app', [PROFILED], indirect=True)
+def test_only_profiling_admins_read_profiles(app, make_tenant, login):
+    client = login(make_tenant('someone').user)
+    assert client.get('/api/admin/profiles').status_code == 403
+    # ?profile=1 from anyone else is profiled but not sampled
+    response = client.get('/manage?profile=1')
+    profile = profiling.find_profile(app, int(response.headers['X-Profile-Id']))
+    assert 'samples' not in profile
@@ -0,0 +1,45 @@
+import pytest
+from ortools.sat.python import cp_model
+
+from app.scenarios import MAX_VARIANTS, expand_grid, run_scenarios, validate_variants
+
+from test_solver import SOLVE_CONFIG, assert_valid_timetable, small_tenant
+
+def test_grid_expands_to_every_combination():
+    variants = expand_grid({'MAX_HOURS_PENALTY': [100, '200'], 'LECTURES_IN_LABS': [True, 'false'],
+                            'SOLVER_TIME_LIMIT': 5})
+    assert variants == [{'LECTURES_IN_LABS': lab, 'MAX_HOURS_PENALTY': weight, 'SOLVER_TIME_LIMIT': 5.0}
+                        for lab in (True, False) for weight in (100, 200)]
+
+@pytest.mark.parametrize('variants, message', [
+    ([{'SECRET_KEY': 'x'}], 'cannot be varied'),
+    ([{'MAX_HOURS_PENALTY': 1.5}], 'whole number'),
+    ([{'MAX_HOURS_PENALTY': True}], 'must be a number'),
+    ([{'MAX_CONSECUTIVE_LECTURES': 0}], 'between'),
+    ([{'SOLVER_TIME_LIMIT': 'soon'}], 'must be a number'),
+    ([{'LECTURES_IN_LABS': 1}], 'true or false'),
+    ({'MAX_HOURS_PENALTY': 1}, 'must be a list'),
+    ([{}] * (MAX_VARIANTS + 1), 'max'),
+])
+def test_invalid_variants_are_rejected(variants, message):
+    with pytest.raises(ValueError, match=message):
+        validate_variants(variants)
+
+def test_oversized_grid_is_rejected_before_expanding():
+    with pytest.raises(ValueError, match='scenarios requested'):
+        expand_grid({'MAX_HOURS_PENALTY': list(range(1000)), 'CONSECUTIVE_PENALTY': list(range(1000))})
+    with pytest.raises(ValueError, match='must map'):
+        expand_grid([1, 2])
+
+def test_variants_are_solved_in_order():
+    inputs = small_tenant()
+    variants = validate_variants([{'SAME_DAY_MULTI_PENALTY': 10}, {'SAME_DAY_MULTI_PENALTY': 0}])
+    outcomes = run_scenarios(inputs, dict(SOLVE_CONFIG), variants)
+    assert [o['overrides'] for o in outcomes] == variants
+    for outcome in outcomes:
+        assert outcome['status'] == cp_model.OPTIMAL
+        assert_valid_timetable(inputs, [dict(zip(('subject_id', 'room_id', 'group_id', 'day', 'slot'), row))
+                                        for row in outcome['entries']])
+        assert sum(outcome['penalties'].values()) == outcome['obj_value']
+    # Dropping a penalty can only lower the optimum
+    assert outcomes[1]['obj_value'] <= outcomes[0]['obj_value']
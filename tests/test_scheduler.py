@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+from app.scheduler import SolveQuotaExceeded, SolveScheduler
+
+def wait_until(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.005)
+
+def start(target, *args):
+    thread = threading.Thread(target=target, args=args)
+    thread.start()
+    return thread
+
+def test_queue_runs_smallest_model_first_then_fifo():
+    scheduler = SolveScheduler(max_concurrent=1)
+    release, order = threading.Event(), []
+    blocker = start(scheduler.run, 0, 'blocker', 0, release.wait, 1)
+    wait_until(lambda: scheduler.metrics()['running'] == 1)
+
+    threads = []
+    for name, size in (('big', 5), ('small-1', 1), ('medium', 3), ('small-2', 1)):
+        threads.append(start(scheduler.run, 1, name, size, lambda name=name: order.append(name), 1))
+        wait_until(lambda n=len(threads): scheduler.metrics()['queue_depth'] == n)
+    release.set()
+    for thread in [blocker, *threads]:
+        thread.join()
+    assert order == ['small-1', 'small-2', 'medium', 'big']
+    assert scheduler.metrics()['completed'] == 5
+
+def test_identical_requests_share_one_run():
+    scheduler = SolveScheduler(max_concurrent=2)
+    release, calls, results = threading.Event(), [], []
+
+    def solve():
+        calls.append(1)
+        release.wait()
+        return 'timetable'
+
+    threads = [start(lambda: results.append(scheduler.run(7, 'fingerprint', 1, solve, 1))) for _ in range(3)]
+    wait_until(lambda: scheduler.metrics()['coalesced'] == 2)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert len(calls) == 1
+    assert sorted(results) == [('timetable', False), ('timetable', True), ('timetable', True)]
+
+def test_followers_see_the_owners_error():
+    scheduler = SolveScheduler(max_concurrent=1)
+    release, errors = threading.Event(), []
+
+    def solve():
+        release.wait()
+        raise RuntimeError('solver crashed')
+
+    def request():
+        try:
+            scheduler.run(7, 'fingerprint', 1, solve, 1)
+        except RuntimeError as e:
+            errors.append(str(e))
+
+    threads = [start(request) for _ in range(2)]
+    wait_until(lambda: scheduler.metrics()['coalesced'] == 1)
+    release.set()
+    for thread in threads:
+        thread.join()
+    assert errors == ['solver crashed'] * 2
+    # The key is free again
+    assert scheduler.run(7, 'fingerprint', 1, lambda: 'ok', 1) == ('ok', False)
+
+def test_quota_charges_wall_time_times_search_workers():
+    scheduler = SolveScheduler(max_concurrent=2, cpu_quota=1, quota_window=60)
+    scheduler.run(7, 'a', 1, lambda: time.sleep(0.05), 4)
+    used = scheduler.tenant_usage(7)
+    assert 0.2 <= used < 1
+    scheduler.run(7, 'b', 1, lambda: time.sleep(0.1), 8)
+    assert scheduler.tenant_usage(7) >= used + 0.8
+
+    with pytest.raises(SolveQuotaExceeded) as raised:
+        scheduler.run(7, 'c', 1, lambda: None, 1)
+    assert 0 < raised.value.retry_after <= 60
+    assert scheduler.metrics()['rejected'] == 1
+    # Other tenants keep their own quota
+    assert scheduler.run(8, 'c', 1, lambda: 'ok', 1) == ('ok', False)
+
+def test_usage_expires_with_the_window():
+    scheduler = SolveScheduler(max_concurrent=1, cpu_quota=0.01, quota_window=0.2)
+    scheduler.run(7, 'a', 1, lambda: time.sleep(0.02), 1)
+    with pytest.raises(SolveQuotaExceeded):
+        scheduler.run(7, 'b', 1, lambda: None, 1)
+    time.sleep(0.25)
+    assert scheduler.tenant_usage(7) == 0
+    assert scheduler.run(7, 'b', 1, lambda: 'ok', 1) == ('ok', False)
@@ -0,0 +1,80 @@
+from datetime import datetime, timedelta
+
+from app import db
+from app.models import Enrollment, Subject, TimetableEntry, User
+from app.snapshot import (DEMO_ACTIVITY_INTERVAL, DEMO_IDLE_HOURS, SNAPSHOT_MODELS, create_demo_tenant,
+                          delete_tenant, dump_tenant, record_demo_activity, restore_tenant)
+
+def by_name(snapshot, table):
+    """A table's rows without ids, which differ between tenants."""
+    data = snapshot['tables'][table]
+    return sorted(tuple(v for c, v in zip(data['columns'], row) if c != 'id' and not c.endswith('_id'))
+                  for row in data['rows'])
+
+def test_restore_copies_a_tenant_with_remapped_ids(app, make_tenant):
+    source = make_tenant('source')
+    subject, group, room = source.subjects[0], source.groups[0], source.rooms[0]
+    db.session.add(TimetableEntry(user_id=source.user.id, subject_id=subject.id, group_id=group.id,
+                                  room_id=room.id, day='Monday', slot=1))
+    db.session.add(Enrollment(user_id=source.user.id, student='s1', subject_id=subject.id))
+    db.session.commit()
+    snapshot = dump_tenant(source.user.id)
+
+    copy = User(username='copy')
+    db.session.add(copy)
+    db.session.flush()
+    restore_tenant(snapshot, copy.id)
+    db.session.commit()
+
+    restored = dump_tenant(copy.id)
+    for model in SNAPSHOT_MODELS:
+        assert by_name(restored, model.__tablename__) == by_name(snapshot, model.__tablename__)
+    # References point at the copy's own rows
+    entry = TimetableEntry.query.filter_by(user_id=copy.id).one()
+    assert (entry.subject.user_id, entry.group.user_id, entry.room.user_id) == (copy.id,) * 3
+    assert entry.subject.name == subject.name
+    assert Enrollment.query.filter_by(user_id=copy.id).one().subject_id != subject.id
+
+    copy_id = copy.id
+    delete_tenant(copy_id)
+    db.session.commit()
+    assert all(not data['rows'] for data in dump_tenant(copy_id)['tables'].values())
+    assert db.session.get(User, copy_id) is None
+    assert Subject.query.filter_by(user_id=source.user.id).count() == len(source.subjects)
+
+def test_demo_tenants_are_pruned_by_idle_time(app):
+    now = datetime.utcnow()
+    idle, recent, untracked = (create_demo_tenant().id for _ in range(3))
+    User.query.filter_by(id=idle).update({'last_active_at': now - timedelta(hours=DEMO_IDLE_HOURS + 1)})
+    User.query.filter_by(id=recent).update({'last_active_at': now - timedelta(hours=DEMO_IDLE_HOURS - 1)})
+    User.query.filter_by(id=untracked).update({'last_active_at': None})
+    db.session.commit()
+    assert Subject.query.filter_by(user_id=idle).count() > 0
+
+    fresh = create_demo_tenant()
+    remaining = {u.id for u in User.query.filter_by(is_demo=True)}
+    assert remaining == {recent, fresh.id}
+    assert Subject.query.filter_by(user_id=idle).count() == 0
+
+def test_demo_activity_is_recorded_at_most_once_per_interval(app):
+    user = create_demo_tenant()
+    first = user.last_active_at
+    record_demo_activity(user)
+    assert db.session.get(User, user.id).last_active_at == first
+
+    User.query.filter_by(id=user.id).update({'last_active_at': first - DEMO_ACTIVITY_INTERVAL})
+    db.session.commit()
+    record_demo_activity(user)
+    assert db.session.get(User, user.id).last_active_at > first - DEMO_ACTIVITY_INTERVAL
+
+def test_requests_keep_a_demo_tenant_active(app):
+    client = app.test_client()
+    client.get('/demo-login')
+    user = User.query.filter_by(is_demo=True).one()
+    idle_since = datetime.utcnow() - timedelta(hours=DEMO_IDLE_HOURS + 1)
+    User.query.filter_by(id=user.id).update({'last_active_at': idle_since})
+    db.session.commit()
+
+    assert client.get('/manage').status_code == 200
+    db.session.expire_all()
+    assert datetime.utcnow() - db.session.get(User, user.id).last_active_at < DEMO_ACTIVITY_INTERVAL
@@ -0,0 +1,119 @@
+import random
+from types import SimpleNamespace
+
+import pytest
+from ortools.sat.python import cp_model
+
+from app.solver import analyze_constraints, build_model, estimate_model_footprint, solve_timetable
+
+def entities(rng):
+    groups = [SimpleNamespace(id=i, name=f'G{i}', size=rng.randrange(20, 60), course_id=1 + i % 2)
+              for i in range(1, 6)]
+    rooms = [SimpleNamespace(id=1, name='Hall', type='lecture', capacity=100),
+             SimpleNamespace(id=2, name='Room', type='lecture', capacity=40),
+             SimpleNamespace(id=3, name='Lab', type='lab', capacity=60)]
+    faculties = [SimpleNamespace(id=i, name=f'F{i}', max_hours_per_week=8) for i in range(1, 4)]
+    subjects = [SimpleNamespace(id=i, name=f'S{i}', faculty_id=rng.choice([1, 2, 3, None]), is_lab=rng.random() < 0.3,
+                                is_shared=rng.random() < 0.3, hours_per_week=rng.randrange(1, 5),
+                                course_id=rng.choice([1, 2, 3]))
+                for i in range(1, 10)]
+    time_slots = [SimpleNamespace(day=day, slot_number=slot) for day in ('Monday', 'Tuesday', 'Wednesday')
+                  for slot in range(1, 6)]
+    return subjects, groups, rooms, faculties, time_slots
+
+@pytest.mark.parametrize('seed', range(10))
+def test_footprint_counts_match_build_model(seed):
+    rng = random.Random(seed)
+    inputs = entities(rng)
+    # Cliques may name subjects without classes (course 3 has no groups) or unknown ids
+    cliques = [sorted(rng.sample(range(1, 12), rng.randrange(2, 4))) for _ in range(3)]
+    config = {'SUBJECT_CONFLICTS': cliques, 'LECTURES_IN_LABS': rng.random() < 0.5}
+    compiled = build_model(*inputs, config)
+    footprint = estimate_model_footprint(*inputs, config)
+    assert (footprint['variables'], footprint['constraints']) == (compiled['variables'], compiled['constraints'])
+
+def small_tenant():
+    """A tenant small enough to solve to optimality in a second or two."""
+    groups = [SimpleNamespace(id=1, name='G1', size=30, course_id=1),
+              SimpleNamespace(id=2, name='G2', size=30, course_id=1),
+              SimpleNamespace(id=3, name='G3', size=35, course_id=2)]
+    rooms = [SimpleNamespace(id=1, name='Hall', type='lecture', capacity=100),
+             SimpleNamespace(id=2, name='Room', type='lecture', capacity=40),
+             SimpleNamespace(id=3, name='Lab', type='lab', capacity=60)]
+    faculties = [SimpleNamespace(id=1, name='F1', max_hours_per_week=8),
+                 SimpleNamespace(id=2, name='F2', max_hours_per_week=6),
+                 SimpleNamespace(id=3, name='F3', max_hours_per_week=4)]
+    subjects = [SimpleNamespace(id=i, name=f'S{i}', course_id=course_id, hours_per_week=hours, faculty_id=faculty_id,
+                                is_lab=is_lab, is_shared=is_shared)
+                for i, (course_id, hours, faculty_id, is_lab, is_shared) in enumerate(
+                    [(1, 3, 1, False, False), (1, 2, 2, True, False), (1, 2, 3, False, True),
+                     (2, 2, 1, False, False), (2, 2, 2, True, False)], start=1)]
+    time_slots = [SimpleNamespace(day=day, slot_number=slot)
+                  for day in ('Monday', 'Tuesday', 'Wednesday', 'Thursday', 'Friday') for slot in range(1, 5)]
+    return subjects, groups, rooms, faculties, time_slots
+
+SOLVE_CONFIG = {'SOLVER_TIME_LIMIT': 20, 'SOLVER_NUM_WORKERS': 4, 'MAX_CONSECUTIVE_LECTURES': 2}
+
+def assert_valid_timetable(inputs, results):
+    """Checks every hard constraint against the decoded entries."""
+    subjects, groups, rooms, faculties, _ = inputs
+    subject_by_id = {s.id: s for s in subjects}
+    room_by_id = {r.id: r for r in rooms}
+    size = {g.id: g.size for g in groups}
+    sections, room_events, group_busy, faculty_events = {}, {}, set(), {}
+    for entry in results:
+        subject = subject_by_id[entry['subject_id']]
+        event = (subject.id, None if subject.is_shared else entry['group_id'])
+        cell = (entry['day'], entry['slot'])
+        sections.setdefault(event, {}).setdefault(cell, set()).add((entry['group_id'], entry['room_id']))
+        room_events.setdefault(cell + (entry['room_id'],), set()).add(event)
+        assert cell + (entry['group_id'],) not in group_busy
+        group_busy.add(cell + (entry['group_id'],))
+        faculty_events.setdefault(cell + (subject.faculty_id,), set()).add(event)
+        assert (room_by_id[entry['room_id']].type == 'lab') == subject.is_lab
+
+    assert all(len(events) == 1 for events in room_events.values())
+    assert all(len(events) == 1 for events in faculty_events.values())
+    for (subject_id, _), cells in sections.items():
+        assert len(cells) == subject_by_id[subject_id].hours_per_week
+        for placed in cells.values():
+            # A shared section meets once, in one room, with every group of its course
+            assert len({room_id for _, room_id in placed}) == 1
+            room_id = next(iter(placed))[1]
+            assert room_by_id[room_id].capacity >= sum(size[group_id] for group_id, _ in placed)
+    expected = {(s.id, g.id) for s in subjects for g in groups if g.course_id == s.course_id}
+    assert {(e['subject_id'], e['group_id']) for e in results} == expected
+
+def test_solution_meets_hard_constraints_and_scores_its_penalties():
+    inputs = small_tenant()
+    stats = {}
+    status, results, obj_value = solve_timetable(*inputs, dict(SOLVE_CONFIG), stats=stats)
+    assert status == cp_model.OPTIMAL
+    assert_valid_timetable(inputs, results)
+    # The objective is exactly the weighted penalty families built on the shared aggregates
+    assert sum(stats['penalties'].values()) == obj_value
+
+def test_shared_subject_is_one_section_for_its_course():
+    subjects, groups, rooms, faculties, time_slots = small_tenant()
+    shared = subjects[2]
+    unshared = [s if s is not shared else SimpleNamespace(**{**vars(s), 'is_shared': False}) for s in subjects]
+    config = dict(SOLVE_CONFIG)
+    compiled = build_model(subjects, groups, rooms, faculties, time_slots, config)
+    split = build_model(unshared, groups, rooms, faculties, time_slots, config)
+    assert compiled['variables'] < split['variables']
+
+    status, results, _ = solve_timetable(subjects, groups, rooms, faculties, time_slots, config)
+    assert status == cp_model.OPTIMAL
+    placed = {(e['day'], e['slot'], e['room_id']) for e in results if e['subject_id'] == shared.id}
+    # G1 and G2 meet together, so the faculty teaches the subject's hours once
+    assert len(placed) == shared.hours_per_week
+    assert {e['group_id'] for e in results if e['subject_id'] == shared.id} == {1, 2}
+
+def test_analysis_flags_shared_section_no_room_can_seat():
+    subjects, groups, rooms, faculties, time_slots = small_tenant()
+    rooms[0].capacity = 50
+    reasons = analyze_constraints(subjects, groups, rooms, faculties, time_slots)
+    assert any("Shared subject 'S3' seats 60" in reason for reason in reasons)
+    subjects[2].is_shared = False
+    assert not any('Shared subject' in reason for reason in analyze_constraints(subjects, groups, rooms, faculties,
+                                                                               time_slots))
@@ -0,0 +1,21 @@
+from ortools.sat.python import cp_model
+
+from app.solver import PENALTY_WEIGHTS, solve_timetable
+from test_solver import SOLVE_CONFIG, assert_valid_timetable, small_tenant
+
+def test_staged_solve_settles_max_hours_first():
+    inputs = small_tenant()
+    # F3 teaches the shared S3 for two hours against a limit of one
+    inputs[3][2].max_hours_per_week = 1
+    stats = {}
+    status, results, obj_value = solve_timetable(*inputs, dict(SOLVE_CONFIG, SOLVER_STAGED=True), stats=stats)
+
+    # Lexicographic optima are not proven optimal for the weighted sum
+    assert status == cp_model.FEASIBLE
+    assert stats['best_bound'] is None
+    assert_valid_timetable(inputs, results)
+    first, second = stats['stages']
+    assert first['penalties'] == ['MAX_HOURS_PENALTY']
+    assert first['status'] == cp_model.OPTIMAL and first['objective'] == PENALTY_WEIGHTS['MAX_HOURS_PENALTY']
+    assert obj_value == first['objective'] + second['objective']
+    assert sum(stats['penalties'].values()) == obj_value
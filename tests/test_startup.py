@@ -0,0 +1,57 @@
+import os
+import subprocess
+import sys
+
+from sqlalchemy import inspect
+
+from app import create_app, db
+from app.models import SystemSetting, TimeSlot, User
+from app.routes import DEFAULT_SETTINGS, DEFAULT_TIME_SLOTS
+from config import Config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+def test_entry_point_does_not_load_the_solver(tmp_path):
+    code = ("import sys; from app import create_app; create_app(); "
+            "print(sorted(m for m in ('ortools', 'numpy', 'app.solver') if m in sys.modules))")
+    env = {**os.environ, 'DATABASE_URL': f"sqlite:///{tmp_path / 'cold.db'}", 'FAST_START': 'true'}
+    out = subprocess.run([sys.executable, '-c', code], cwd=ROOT, env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.strip().splitlines()[-1] == '[]'
+
+def test_fast_start_skips_schema_creation(tmp_path):
+    class FastConfig(Config):
+        SQLALCHEMY_DATABASE_URI = f"sqlite:///{tmp_path / 'fast.db'}"
+        FAST_START = True
+
+    app = create_app(FastConfig)
+    with app.app_context():
+        assert inspect(db.engine).get_table_names() == []
+        db.engine.dispose()
+
+def test_tenant_is_seeded_once_and_reseeded_when_data_is_missing(app, login):
+    user = User(username='new')
+    db.session.add(user)
+    db.session.commit()
+    client = login(user)
+
+    assert client.get('/').status_code == 200
+    assert SystemSetting.query.filter_by(user_id=user.id).count() == len(DEFAULT_SETTINGS)
+    assert TimeSlot.query.filter_by(user_id=user.id).count() == len(DEFAULT_TIME_SLOTS)
+    db.session.refresh(user)
+    revision = user.timetable_revision
+    assert revision > 0
+
+    # Seeded tenants are not written to again
+    assert client.get('/').status_code == 200
+    db.session.refresh(user)
+    assert user.timetable_revision == revision
+
+    # Whatever goes missing later (or a reused id that never had it) is seeded again
+    TimeSlot.query.filter_by(user_id=user.id).delete()
+    SystemSetting.query.filter_by(user_id=user.id, key='SOLVER_TIME_LIMIT').delete()
+    db.session.commit()
+    assert client.get('/').status_code == 200
+    assert TimeSlot.query.filter_by(user_id=user.id).count() == len(DEFAULT_TIME_SLOTS)
+    assert SystemSetting.query.filter_by(user_id=user.id, key='SOLVER_TIME_LIMIT').count() == 1
+    db.session.refresh(user)
+    assert user.timetable_revision > revision
@@ -0,0 +1,70 @@
+import pytest
+
+from app.term import parse_weeks
+
+def test_parse_weeks():
+    assert parse_weeks('3-5, 9', 10) == [3, 4, 5, 9]
+    assert parse_weeks('odd', 6) == [1, 3, 5]
+    assert parse_weeks('even,1', 6) == [1, 2, 4, 6]
+    assert parse_weeks('all', 3) == [1, 2, 3]
+    for spec in ('', 'x', '0', '4-2', '11'):
+        with pytest.raises(ValueError):
+            parse_weeks(spec, 10)
+
+def cells(entries):
+    """(kind, key, day, slot) for each group and room booking; clashes show up as repeats."""
+    # A shared section's groups sit in one room
+    sections = {(e['subject_id'], e['room_id'], e['day'], e['slot']) for e in entries}
+    return ([('group', e['group_id'], e['day'], e['slot']) for e in entries]
+            + [('room', room_id, day, slot) for _, room_id, day, slot in sections])
+
+def assignment(entry):
+    return entry['subject_id'], entry['group_id'], entry['room_id'], entry['day'], entry['slot']
+
+def test_term_weeks_follow_their_exceptions(make_tenant, solve_tenant, login):
+    tenant = make_tenant()
+    template = solve_tenant(tenant)
+    client = login(tenant.user)
+    room = next(r for r in tenant.rooms if r.name == 'Room')
+    created = client.post('/api/terms', json={
+        'name': 'Autumn', 'start_date': '2026-09-07', 'weeks': 6,
+        'exceptions': [{'kind': 'no_classes', 'weeks': '2'}, {'kind': 'day_off', 'weeks': 'even', 'day': 'Monday'}],
+    }).get_json()
+    term_id = created['term']['id']
+    response = client.post(f'/api/terms/{term_id}/exceptions', json={'kind': 'room_closed', 'weeks': '3',
+                                                                      'room_id': room.id})
+    assert response.status_code == 200
+    assert client.post(f'/api/terms/{term_id}/exceptions', json={'kind': 'day_off', 'weeks': '3'}).status_code == 400
+
+    plan = client.post(f'/api/terms/{term_id}/plan').get_json()
+    assert plan['template_entries'] == len(template) and plan['template_weeks'] == 2
+    assert sorted(v['weeks'] for v in plan['variants']) == [[2], [3], [4, 6]]
+
+    def week(n):
+        return client.get(f'/api/terms/{term_id}/weeks/{n}').get_json()
+
+    def entries(data):
+        return [e for day_entries in data['days'].values() for e in day_entries]
+
+    first = week(1)
+    assert len(entries(first)) == len(template) and not first['moved']
+    assert first['dates']['Monday'] == '2026-09-07'
+    assert week(2)['cancelled'] and not week(2)['days']
+
+    for n, dropped in ((4, lambda e: e['day'] == 'Monday'), (3, lambda e: e['room_id'] == room.id)):
+        data = week(n)
+        placed = entries(data)
+        assert not any(dropped(e) for e in placed)
+        assert len(cells(placed)) == len(set(cells(placed)))
+        assert len(placed) + len(data['unplaced']) == len(template)
+        # Only the displaced classes move
+        kept = {assignment(e) for e in template if not dropped(e)}
+        assert kept <= {assignment(e) for e in placed}
+        assert not data['stale']
+
+    # A dated exception stands for its week and day, and leaves the plan stale until re-planned
+    client.post(f'/api/terms/{term_id}/exceptions', json={'kind': 'day_off', 'date': '2026-09-23'})
+    third = week(3)
+    assert third['stale']
+    assert client.get(f'/api/terms/{term_id}').get_json()['exceptions'][-1]['day'] == 'Wednesday'
+    assert client.get(f'/api/terms/{term_id}/weeks/7').status_code == 404
@@ -0,0 +1,88 @@
+import json
+from datetime import datetime, timedelta
+
+import pytest
+
+from app import db
+from app.models import SolveJob
+from app.worker import _finish, _owns, _retry_or_fail, claim_job, enqueue_job, run_job
+
+@pytest.fixture(autouse=True)
+def lock_file(tmp_path, monkeypatch):
+    monkeypatch.setenv('SOLVE_JOB_LOCK_FILE', str(tmp_path / 'claims.lock'))
+
+def expire_lease(job_id):
+    SolveJob.query.filter_by(id=job_id).update({'lease_expires_at': datetime.utcnow() - timedelta(seconds=1)})
+    db.session.commit()
+
+def test_enqueue_reuses_the_active_job_for_the_same_inputs(app):
+    job = enqueue_job(1, 'a' * 64)
+    assert enqueue_job(1, 'a' * 64).id == job.id
+    assert enqueue_job(1, 'b' * 64).id != job.id
+    assert enqueue_job(2, 'a' * 64).id != job.id
+    # Still active while running; once finished the same inputs queue a new job
+    assert claim_job('w1', 60).id == job.id
+    assert enqueue_job(1, 'a' * 64).id == job.id
+    _finish(job.id, 'w1', 'done', {'status': 'Success'}, 200)
+    assert enqueue_job(1, 'a' * 64).id != job.id
+
+def test_claims_take_the_oldest_runnable_job(app):
+    first, second = enqueue_job(1, 'a' * 64), enqueue_job(2, 'a' * 64)
+    SolveJob.query.filter_by(id=first.id).update({'run_after': datetime.utcnow() + timedelta(minutes=5)})
+    db.session.commit()
+
+    claimed = claim_job('w1', 60)
+    assert claimed.id == second.id
+    assert (claimed.status, claimed.worker_id, claimed.attempts) == ('running', 'w1', 1)
+    assert claimed.lease_expires_at > datetime.utcnow()
+    # The first is still backing off and the second is leased
+    assert claim_job('w2', 60) is None
+
+def test_expired_lease_is_taken_over(app):
+    job_id = enqueue_job(1, 'a' * 64).id
+    claim_job('w1', 60)
+    assert claim_job('w2', 60) is None
+
+    expire_lease(job_id)
+    taken = claim_job('w2', 60)
+    assert (taken.id, taken.worker_id, taken.attempts) == (job_id, 'w2', 2)
+    # The first worker no longer owns it and cannot overwrite the result
+    assert not _owns(job_id, 'w1') and _owns(job_id, 'w2')
+    _finish(job_id, 'w1', 'failed', {'error': 'late'}, 500)
+    assert db.session.get(SolveJob, job_id).status == 'running'
+    _finish(job_id, 'w2', 'done', {'status': 'Success'}, 200)
+    job = db.session.get(SolveJob, job_id)
+    assert (job.status, json.loads(job.result), job.result_code) == ('done', {'status': 'Success'}, 200)
+
+def test_lease_expiring_on_the_last_attempt_fails_the_job(app):
+    job_id = enqueue_job(1, 'a' * 64, max_attempts=1).id
+    claim_job('w1', 60)
+    expire_lease(job_id)
+    assert claim_job('w2', 60) is None
+    job = db.session.get(SolveJob, job_id)
+    assert (job.status, job.error) == ('failed', 'Worker lease expired')
+
+def test_errors_back_off_then_fail(app):
+    job_id = enqueue_job(1, 'a' * 64, max_attempts=2).id
+    claim_job('w1', 60)
+    _retry_or_fail(job_id, 'w1', 'boom')
+    job = db.session.get(SolveJob, job_id)
+    assert (job.status, job.error) == ('queued', 'boom')
+    assert job.run_after > datetime.utcnow()
+    assert claim_job('w1', 60) is None
+
+    SolveJob.query.filter_by(id=job_id).update({'run_after': None})
+    db.session.commit()
+    claim_job('w1', 60)
+    _retry_or_fail(job_id, 'w1', 'boom again')
+    job = db.session.get(SolveJob, job_id)
+    assert (job.status, job.error, job.attempts) == ('failed', 'boom again', 2)
+
+def test_run_job_records_the_solve_outcome(app):
+    # A tenant with no data fails the way /generate-timetable would
+    enqueue_job(1, 'a' * 64)
+    job = claim_job('w1', 60)
+    run_job(app, job, 'w1', 60)
+    job = db.session.get(SolveJob, job.id)
+    assert (job.status, job.result_code) == ('failed', 400)
+    assert 'Insufficient data' in json.loads(job.result)['error']
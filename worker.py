@@ -0,0 +1,15 @@
+import argparse
+from app import create_app
+from app.worker import run_worker
+
+# Standalone solver worker: claims generation jobs from the solve_job table.
+# Run several of these (on any host sharing DATABASE_URL) with SOLVER_MODE=queue.
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Timetable solver worker')
+    parser.add_argument('--worker-id', help='Defaults to hostname:pid')
+    parser.add_argument('--poll-interval', type=float, default=2.0, help='Seconds between polls of an empty queue')
+    parser.add_argument('--drain', action='store_true', help='Exit once the queue is empty')
+    args = parser.parse_args()
+
+    app = create_app()
+    run_worker(app, worker_id=args.worker_id, poll_interval=args.poll_interval, drain=args.drain)